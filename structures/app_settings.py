@@ -25,6 +25,12 @@ STRUCTURES_DEFAULT_TAGS_FILTER_ENABLED = clean_setting(
 # UNDOCUMENTED SETTING
 STRUCTURES_DEVELOPER_MODE = clean_setting("STRUCTURES_DEVELOPER_MODE", False)
 
+# Timeout in seconds for caching Discord roles of ping groups
+# and the resulting mentions for each owner and webhook
+STRUCTURES_DISCORD_ROLES_CACHE_TIMEOUT = clean_setting(
+    "STRUCTURES_DISCORD_ROLES_CACHE_TIMEOUT", 3600, min_value=0
+)
+
 # Whether the customs offices feature is active
 STRUCTURES_FEATURE_CUSTOMS_OFFICES = clean_setting(
     "STRUCTURES_FEATURE_CUSTOMS_OFFICES", True
@@ -73,6 +79,12 @@ STRUCTURES_NOTIFICATIONS_ARCHIVING_ENABLED = clean_setting(
     "STRUCTURES_NOTIFICATIONS_ARCHIVING_ENABLED", False
 )
 
+# Notifications older than this number of days are moved into the archive
+# by the archive_notifications task
+STRUCTURES_NOTIFICATION_RETENTION_DAYS = clean_setting(
+    "STRUCTURES_NOTIFICATION_RETENTION_DAYS", 90, min_value=1
+)
+
 # Wether structures sets the name and avatar icon of a webhook
 # else the webhook will show it's default names as set when defining the webhook
 STRUCTURES_NOTIFICATION_SET_AVATAR = clean_setting(
@@ -110,6 +122,16 @@ STRUCTURES_TIMERS_ARE_CORP_RESTRICTED = clean_setting(
 # whether ESI timeout is enabled
 STRUCTURES_ESI_TIMEOUT_ENABLED = clean_setting("STRUCTURES_ESI_TIMEOUT_ENABLED", True)
 
+# Max number of concurrent requests when fetching pages from ESI.
+# Set to 1 to fetch pages one after the other.
+STRUCTURES_ESI_MAX_WORKERS = clean_setting("STRUCTURES_ESI_MAX_WORKERS", 5, min_value=1)
+
+# Max number of Eve Universe objects kept in memory while syncing
+# or processing notifications. Set to 0 to disable this cache.
+STRUCTURES_EVEUNIVERSE_CACHE_MAX_SIZE = clean_setting(
+    "STRUCTURES_EVEUNIVERSE_CACHE_MAX_SIZE", 10000, min_value=0
+)
+
 # Default page size for structure list.
 # Must be an integer value from the current options as seen in the app.
 STRUCTURES_DEFAULT_PAGE_LENGTH = clean_setting("STRUCTURES_DEFAULT_PAGE_LENGTH", 10)
@@ -140,6 +162,11 @@ STRUCTURES_NOTIFICATION_TURNAROUND_MAX_VALID = clean_setting(
     "STRUCTURES_NOTIFICATION_TURNAROUND_MAX_VALID", 3600
 )
 
+# Max number of webhooks that are sent to concurrently from one worker
+STRUCTURES_WEBHOOKS_MAX_WORKERS = clean_setting(
+    "STRUCTURES_WEBHOOKS_MAX_WORKERS", 10, min_value=1
+)
+
 # Timeout for throttled issue notifications to users and admins in seconds.
 STRUCTURES_NOTIFY_THROTTLED_TIMEOUT = clean_setting(
     "STRUCTURES_NOTIFY_THROTTLED_TIMEOUT", 86400
@@ -266,9 +266,7 @@ class NotificationStructureEmbed(NotificationBaseEmbed):
     def __init__(self, notification: Notification) -> None:
         super().__init__(notification)
         try:
-            structure = Structure.objects.select_related_defaults().get(
-                id=self._parsed_text["structureID"]
-            )
+            structure = notification.get_structure()
         except Structure.DoesNotExist:
             structure = None
             structure_name = gettext("(unknown)")
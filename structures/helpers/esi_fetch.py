@@ -4,9 +4,12 @@
     - Automatic page retry on 502, 503, 504 up to max retries with exponential backoff
     - Automatic retrieval of all pages
     - Automatic retrieval of variants for all requested languages
+    - Concurrent retrieval of pages and languages with a bounded pool of workers
 """
 
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from time import sleep
+from typing import List
 
 from bravado.exception import HTTPBadGateway, HTTPGatewayTimeout, HTTPServiceUnavailable
 
@@ -18,7 +21,7 @@ from allianceauth.services.hooks import get_extension_logger
 from app_utils.logging import LoggerAddTag
 
 from .. import __title__
-from ..app_settings import STRUCTURES_ESI_TIMEOUT_ENABLED
+from ..app_settings import STRUCTURES_ESI_MAX_WORKERS, STRUCTURES_ESI_TIMEOUT_ENABLED
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
@@ -35,6 +38,7 @@ def esi_fetch(
     token: Token = None,
     esi_client: object = None,
     logger_tag: str = None,
+    max_workers: int = None,
 ) -> dict:
     """returns an response object from ESI, will retry on some HTTP errors.
     will automatically return all pages if requested
@@ -48,6 +52,8 @@ def esi_fetch(
     - esi_client: esi client object from django-esi to be used for request
     instead of default esi client from this module
     - logger_tag: every log message will start with this text in brackets
+    - max_workers: max number of concurrent requests to ESI,
+    defaults to STRUCTURES_ESI_MAX_WORKERS. Set to 1 when already called from a pool
     """
     _, request_object = _fetch_main(
         esi_path=esi_path,
@@ -57,6 +63,7 @@ def esi_fetch(
         esi_client=esi_client,
         token=token,
         logger_tag=logger_tag,
+        max_workers=max_workers,
     ).popitem()
     return request_object
 
@@ -69,6 +76,7 @@ def esi_fetch_with_localization(
     esi_client: object = None,
     token: Token = None,
     logger_tag: str = None,
+    max_workers: int = None,
 ) -> dict:
     """returns dict of response objects from ESI
     will contain one full object items for each language if supported or just one
@@ -86,6 +94,8 @@ def esi_fetch_with_localization(
     - esi_client: esi client object from django-esi to be used for request
     instead of default esi client from this module
     - logger_tag: every log message will start with this text in brackets
+    - max_workers: max number of concurrent requests to ESI,
+    defaults to STRUCTURES_ESI_MAX_WORKERS. Set to 1 when already called from a pool
     """
     return _fetch_main(
         esi_path=esi_path,
@@ -95,6 +105,7 @@ def esi_fetch_with_localization(
         esi_client=esi_client,
         token=token,
         logger_tag=logger_tag,
+        max_workers=max_workers,
     )
 
 
@@ -106,6 +117,7 @@ def _fetch_main(
     esi_client: object,
     token: Token,
     logger_tag: str,
+    max_workers: int = None,
 ) -> dict:
     """returns dict of response objects from ESI with localization"""
 
@@ -118,19 +130,107 @@ def _fetch_main(
     else:
         has_localization = True
 
-    response_objects = dict()
+    if not max_workers:
+        max_workers = STRUCTURES_ESI_MAX_WORKERS
+
+    if max_workers > 1 and (has_pages or len(languages) > 1):
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    else:
+        executor = None
+
+    try:
+        if executor and has_localization:
+            response_objects = _fetch_languages_concurrently(
+                esi_path=esi_path,
+                args=args,
+                languages=languages,
+                has_pages=has_pages,
+                esi_client=esi_client,
+                token=token,
+                logger_tag=logger_tag,
+                executor=executor,
+            )
+        else:
+            response_objects = dict()
+            for language in languages:
+                if has_localization:
+                    args["language"] = language
+                response_objects[language] = _fetch_with_paging(
+                    esi_path=esi_path,
+                    args=args,
+                    has_pages=has_pages,
+                    esi_client=esi_client,
+                    token=token,
+                    logger_tag=logger_tag,
+                    executor=executor,
+                )
+    finally:
+        if executor:
+            executor.shutdown()
+
+    return response_objects
+
+
+def _fetch_languages_concurrently(
+    esi_path: str,
+    args: dict,
+    languages: set,
+    has_pages: bool,
+    esi_client: object,
+    token: Token,
+    logger_tag: str,
+    executor: Executor,
+) -> dict:
+    """fetches all language variants with the executor and returns them
+
+    The first pages of all languages are requested at the same time.
+    Remaining pages of all languages are then queued into the same pool.
+    """
+    if token:
+        if token.expired:
+            token.refresh()
+        args["token"] = token.access_token
+
+    first_page_futures = dict()
     for language in languages:
-        if has_localization:
-            args["language"] = language
-        response_objects[language] = _fetch_with_paging(
-            esi_path=esi_path,
-            args=args,
-            has_pages=has_pages,
-            esi_client=esi_client,
-            token=token,
-            logger_tag=logger_tag,
+        language_args = {**args, "language": language}
+        first_page_futures[language] = (
+            language_args,
+            executor.submit(
+                _fetch_with_retries,
+                esi_path=esi_path,
+                args=language_args,
+                has_pages=has_pages,
+                esi_client=esi_client,
+                logger_tag=logger_tag,
+            ),
         )
 
+    futures = [future for _, future in first_page_futures.values()]
+    try:
+        response_objects = dict()
+        page_futures = dict()
+        for language, (language_args, future) in first_page_futures.items():
+            response_objects[language], pages = future.result()
+            if has_pages and pages > 1:
+                page_futures[language] = _submit_pages(
+                    esi_path=esi_path,
+                    args=language_args,
+                    pages=pages,
+                    esi_client=esi_client,
+                    logger_tag=logger_tag,
+                    executor=executor,
+                )
+                futures += page_futures[language]
+
+        for language, language_page_futures in page_futures.items():
+            response_objects[language] += _collect_pages(language_page_futures)
+
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+
     return response_objects
 
 
@@ -141,8 +241,12 @@ def _fetch_with_paging(
     esi_client: object = None,
     token: Token = None,
     logger_tag: str = None,
+    executor: Executor = None,
 ) -> dict:
-    """fetches esi objects incl. all pages if requested and returns them"""
+    """fetches esi objects incl. all pages if requested and returns them
+
+    Pages after the first are fetched concurrently when an executor is provided
+    """
     response_object, pages = _fetch_with_retries(
         esi_path=esi_path,
         args=args,
@@ -151,7 +255,23 @@ def _fetch_with_paging(
         token=token,
         logger_tag=logger_tag,
     )
-    if has_pages:
+    if has_pages and executor and pages > 1:
+        futures = _submit_pages(
+            esi_path=esi_path,
+            args=args,
+            pages=pages,
+            esi_client=esi_client,
+            logger_tag=logger_tag,
+            executor=executor,
+        )
+        try:
+            response_object += _collect_pages(futures)
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    elif has_pages:
         for page in range(2, pages + 1):
             response_object_page, _ = _fetch_with_retries(
                 esi_path=esi_path,
@@ -168,6 +288,45 @@ def _fetch_with_paging(
     return response_object
 
 
+def _submit_pages(
+    esi_path: str,
+    args: dict,
+    pages: int,
+    esi_client: object,
+    logger_tag: str,
+    executor: Executor,
+) -> List[Future]:
+    """submits requests for pages 2 to pages to the executor
+
+    Each page is retried on its own.
+    The access token is already part of args after the first page has been fetched,
+    so workers never need to refresh the token from the database.
+    """
+    return [
+        executor.submit(
+            _fetch_with_retries,
+            esi_path=esi_path,
+            args=dict(args),
+            has_pages=True,
+            page=page,
+            pages=pages,
+            esi_client=esi_client,
+            logger_tag=logger_tag,
+        )
+        for page in range(2, pages + 1)
+    ]
+
+
+def _collect_pages(futures: List[Future]) -> list:
+    """returns the combined response objects of the futures in order"""
+    response_object = list()
+    for future in futures:
+        response_object_page, _ = future.result()
+        response_object += response_object_page
+
+    return response_object
+
+
 def _esi_client() -> object:
     """returns the singular esi client used in this module"""
     global _my_esi_client
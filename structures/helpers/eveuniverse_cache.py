@@ -0,0 +1,104 @@
+"""This module provides a request-scoped in-memory cache for Eve Universe objects
+
+    The cache is an identity map of objects by model and ID.
+    It is only active within a scope, e.g. a task syncing structures for an owner,
+    and each thread has its own scope.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+from django.db import models
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import STRUCTURES_EVEUNIVERSE_CACHE_MAX_SIZE
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+_scope = threading.local()
+
+
+class EveUniverseCache:
+    """Identity map for Eve Universe objects with a bounded size.
+
+    When the max size is reached the least recently used object is evicted.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = int(max_size)
+        self.hits = 0
+        self.misses = 0
+        self._objects = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def get(self, model_class: type, obj_id: int) -> Optional[models.Model]:
+        """returns cached object or None if not cached"""
+        key = (model_class, int(obj_id))
+        try:
+            obj = self._objects[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._objects.move_to_end(key)
+        self.hits += 1
+        return obj
+
+    def set(self, obj: models.Model) -> None:
+        """adds object to the cache"""
+        if self.max_size < 1:
+            return
+
+        key = (type(obj), obj.pk)
+        self._objects[key] = obj
+        self._objects.move_to_end(key)
+        while len(self._objects) > self.max_size:
+            self._objects.popitem(last=False)
+
+    def invalidate(self, model_class: type, obj_id: int) -> None:
+        """removes object from the cache if it exists"""
+        self._objects.pop((model_class, int(obj_id)), None)
+
+    def clear(self) -> None:
+        """removes all objects from the cache"""
+        self._objects.clear()
+
+
+def current_cache() -> Optional[EveUniverseCache]:
+    """returns the cache of the current scope or None if no scope is active"""
+    return getattr(_scope, "cache", None)
+
+
+@contextmanager
+def eveuniverse_cache(max_size: int = None):
+    """Activates the Eve Universe cache for the current thread within this scope.
+
+    Nested scopes share the cache of the outermost scope.
+    Can also be used as decorator.
+    """
+    cache = current_cache()
+    if cache is not None:
+        yield cache
+        return
+
+    cache = EveUniverseCache(
+        max_size if max_size is not None else STRUCTURES_EVEUNIVERSE_CACHE_MAX_SIZE
+    )
+    _scope.cache = cache
+    try:
+        yield cache
+    finally:
+        del _scope.cache
+        logger.debug(
+            "Eve Universe cache: %d hits, %d misses, %d objects",
+            cache.hits,
+            cache.misses,
+            len(cache),
+        )
@@ -1,3 +1,5 @@
+from threading import Lock
+from time import sleep, time
 from unittest.mock import Mock, patch
 
 from bravado.exception import (
@@ -10,6 +12,7 @@ from bravado.exception import (
 from app_utils.logging import make_logger_prefix
 from app_utils.testing import NoSocketsTestCase
 
+from structures.helpers import esi_fetch as esi_fetch_module
 from structures.helpers.esi_fetch import esi_fetch, esi_fetch_with_localization
 from structures.models.eveuniverse import EsiNameLocalization
 from structures.tests.testdata import (
@@ -21,6 +24,70 @@ from structures.tests.testdata import (
 MODULE_PATH = __package__ + ".esi_fetch"
 
 
+class FakePagedEsiOperation:
+    """Fake ESI operation for a paged endpoint, which adds latency to each request
+
+    Will raise the given exception once for every page in fail_pages
+    """
+
+    def __init__(
+        self, page, pages, page_size, latency, fail_pages, language=None
+    ) -> None:
+        self.also_return_response = False
+        self._language = language
+        self._page = page
+        self._pages = pages
+        self._page_size = page_size
+        self._latency = latency
+        self._fail_pages = fail_pages
+
+    def result(self, **kwargs):
+        sleep(self._latency)
+        if self._page in self._fail_pages:
+            self._fail_pages.remove(self._page)
+            raise HTTPBadGateway(response=Mock(**{"text": "test"}))
+        start = (self._page - 1) * self._page_size
+        data = list(range(start, start + self._page_size))
+        if self._language:
+            data = [f"{self._language}-{x}" for x in data]
+        if self.also_return_response:
+            return data, Mock(**{"headers": {"x-pages": self._pages}})
+        return data
+
+
+def fake_paged_esi_client(
+    pages: int, page_size: int = 3, latency: float = 0, fail_pages: set = None
+) -> Mock:
+    """Fake ESI client with a paged assets endpoint"""
+    fail_pages = set(fail_pages) if fail_pages else set()
+    lock = Lock()
+    requested_pages = list()
+
+    def get_corporations_corporation_id_assets(corporation_id, page=1, **kwargs):
+        with lock:
+            requested_pages.append(page)
+        return FakePagedEsiOperation(page, pages, page_size, latency, fail_pages)
+
+    def get_corporations_corporation_id_structures(
+        corporation_id, language, page=1, **kwargs
+    ):
+        with lock:
+            requested_pages.append((language, page))
+        return FakePagedEsiOperation(
+            page, pages, page_size, latency, fail_pages, language
+        )
+
+    client = Mock()
+    client.Assets.get_corporations_corporation_id_assets.side_effect = (
+        get_corporations_corporation_id_assets
+    )
+    client.Corporation.get_corporations_corporation_id_structures.side_effect = (
+        get_corporations_corporation_id_structures
+    )
+    client.requested_pages = requested_pages
+    return client
+
+
 class TestEsiFetch(NoSocketsTestCase):
     def setUp(self):
         self.add_prefix = make_logger_prefix("Test")
@@ -294,3 +361,182 @@ class TestEsiFetch(NoSocketsTestCase):
             else:
                 expected = {"Clone Bay_" + language, "Market Hub_" + language}
             self.assertEqual(service_names, expected)
+
+
+class TestEsiFetchConcurrentPaging(NoSocketsTestCase):
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 5)
+    def test_should_fetch_pages_concurrently(self):
+        # given
+        client = fake_paged_esi_client(pages=10, latency=0.1)
+        # when
+        start = time()
+        assets = esi_fetch(
+            "Assets.get_corporations_corporation_id_assets",
+            args={"corporation_id": 2001},
+            esi_client=client,
+            has_pages=True,
+        )
+        duration = time() - start
+        # then
+        self.assertListEqual(assets, list(range(30)))
+        self.assertSetEqual(set(client.requested_pages), set(range(1, 11)))
+        self.assertLess(duration, 0.7)
+
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 5)
+    def test_should_use_pool_for_second_page_like_for_languages(self):
+        # given
+        client = fake_paged_esi_client(pages=2)
+        # when
+        with patch(
+            MODULE_PATH + "._submit_pages", wraps=esi_fetch_module._submit_pages
+        ) as spy:
+            assets = esi_fetch(
+                "Assets.get_corporations_corporation_id_assets",
+                args={"corporation_id": 2001},
+                esi_client=client,
+                has_pages=True,
+            )
+        # then
+        self.assertListEqual(assets, list(range(6)))
+        self.assertTrue(spy.called)
+
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 1)
+    def test_should_fetch_pages_sequentially_when_only_one_worker(self):
+        # given
+        client = fake_paged_esi_client(pages=4)
+        # when
+        assets = esi_fetch(
+            "Assets.get_corporations_corporation_id_assets",
+            args={"corporation_id": 2001},
+            esi_client=client,
+            has_pages=True,
+        )
+        # then
+        self.assertListEqual(assets, list(range(12)))
+        self.assertListEqual(client.requested_pages, [1, 2, 3, 4])
+
+    @patch(MODULE_PATH + ".ESI_RETRY_SLEEP_SECS", 0)
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 3)
+    def test_should_retry_failed_pages_on_their_own(self):
+        # given
+        client = fake_paged_esi_client(pages=6, fail_pages={3, 5})
+        # when
+        assets = esi_fetch(
+            "Assets.get_corporations_corporation_id_assets",
+            args={"corporation_id": 2001},
+            esi_client=client,
+            has_pages=True,
+        )
+        # then
+        self.assertListEqual(assets, list(range(18)))
+        self.assertEqual(client.requested_pages.count(3), 2)
+        self.assertEqual(client.requested_pages.count(5), 2)
+        self.assertEqual(client.requested_pages.count(4), 1)
+
+    @patch(MODULE_PATH + ".ESI_RETRY_SLEEP_SECS", 0)
+    @patch(MODULE_PATH + ".ESI_MAX_RETRIES", 0)
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 3)
+    def test_should_raise_exception_when_page_fails_permanently(self):
+        # given
+        client = fake_paged_esi_client(pages=6, fail_pages={4})
+        # when/then
+        with self.assertRaises(HTTPBadGateway):
+            esi_fetch(
+                "Assets.get_corporations_corporation_id_assets",
+                args={"corporation_id": 2001},
+                esi_client=client,
+                has_pages=True,
+            )
+
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 3)
+    def test_should_pass_token_to_all_pages_without_refreshing_it(self):
+        # given
+        client = fake_paged_esi_client(pages=4)
+        mock_token = Mock()
+        mock_token.access_token = "my_access_token"
+        mock_token.expired = False
+        # when
+        esi_fetch(
+            "Assets.get_corporations_corporation_id_assets",
+            args={"corporation_id": 2001},
+            esi_client=client,
+            token=mock_token,
+            has_pages=True,
+        )
+        # then
+        for call in client.Assets.get_corporations_corporation_id_assets.call_args_list:
+            _, kwargs = call
+            self.assertEqual(kwargs["token"], "my_access_token")
+        self.assertFalse(mock_token.refresh.called)
+
+
+class TestEsiFetchConcurrentLanguages(NoSocketsTestCase):
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 8)
+    def test_should_fetch_languages_concurrently(self):
+        # given
+        client = fake_paged_esi_client(pages=3, latency=0.1)
+        languages = {"en-us", "de", "ko", "ru"}
+        # when
+        start = time()
+        result = esi_fetch_with_localization(
+            "Corporation.get_corporations_corporation_id_structures",
+            args={"corporation_id": 2001},
+            esi_client=client,
+            has_pages=True,
+            languages=languages,
+        )
+        duration = time() - start
+        # then
+        self.assertSetEqual(set(result.keys()), languages)
+        for language, structures in result.items():
+            self.assertListEqual(
+                structures, [f"{language}-{x}" for x in range(9)], language
+            )
+        self.assertEqual(len(client.requested_pages), 12)
+        self.assertLess(duration, 0.6)
+
+    @patch(MODULE_PATH + ".ESI_RETRY_SLEEP_SECS", 0)
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 2)
+    def test_should_retry_failed_pages_for_each_language(self):
+        # given
+        client = fake_paged_esi_client(pages=3, fail_pages={2})
+        languages = {"en-us", "de"}
+        # when
+        result = esi_fetch_with_localization(
+            "Corporation.get_corporations_corporation_id_structures",
+            args={"corporation_id": 2001},
+            esi_client=client,
+            has_pages=True,
+            languages=languages,
+        )
+        # then
+        for language, structures in result.items():
+            self.assertListEqual(
+                structures, [f"{language}-{x}" for x in range(9)], language
+            )
+
+    @patch(MODULE_PATH + ".STRUCTURES_ESI_MAX_WORKERS", 4)
+    def test_should_refresh_expired_token_once_before_fetching_languages(self):
+        # given
+        client = fake_paged_esi_client(pages=2)
+        mock_token = Mock()
+        mock_token.access_token = "my_access_token"
+        mock_token.expired = True
+        # when
+        esi_fetch_with_localization(
+            "Corporation.get_corporations_corporation_id_structures",
+            args={"corporation_id": 2001},
+            esi_client=client,
+            token=mock_token,
+            has_pages=True,
+            languages={"en-us", "de", "ko", "ru"},
+        )
+        # then
+        self.assertEqual(mock_token.refresh.call_count, 1)
+        mock_calls = (
+            client.Corporation.get_corporations_corporation_id_structures.call_args_list
+        )
+        self.assertEqual(len(mock_calls), 8)
+        for call in mock_calls:
+            _, kwargs = call
+            self.assertEqual(kwargs["token"], "my_access_token")
@@ -0,0 +1,91 @@
+from threading import Thread
+
+from app_utils.testing import NoSocketsTestCase
+
+from structures.helpers.eveuniverse_cache import (
+    EveUniverseCache,
+    current_cache,
+    eveuniverse_cache,
+)
+from structures.models import EveGroup, EveType
+
+
+class TestEveUniverseCache(NoSocketsTestCase):
+    def test_should_return_cached_object_and_count_hits(self):
+        # given
+        cache = EveUniverseCache(max_size=10)
+        obj = EveType(id=35832, name="Astrahus")
+        cache.set(obj)
+        # when/then
+        self.assertIs(cache.get(EveType, 35832), obj)
+        self.assertIsNone(cache.get(EveType, 35835))
+        self.assertIsNone(cache.get(EveGroup, 35832))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+
+    def test_should_evict_least_recently_used_object(self):
+        # given
+        cache = EveUniverseCache(max_size=2)
+        cache.set(EveType(id=1))
+        cache.set(EveType(id=2))
+        cache.get(EveType, 1)
+        # when
+        cache.set(EveType(id=3))
+        # then
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get(EveType, 1))
+        self.assertIsNone(cache.get(EveType, 2))
+        self.assertIsNotNone(cache.get(EveType, 3))
+
+    def test_should_invalidate_object(self):
+        # given
+        cache = EveUniverseCache(max_size=10)
+        cache.set(EveType(id=1))
+        cache.set(EveType(id=2))
+        # when
+        cache.invalidate(EveType, 1)
+        cache.invalidate(EveType, 99)
+        # then
+        self.assertIsNone(cache.get(EveType, 1))
+        self.assertIsNotNone(cache.get(EveType, 2))
+
+    def test_should_not_store_anything_when_disabled(self):
+        # given
+        cache = EveUniverseCache(max_size=0)
+        # when
+        cache.set(EveType(id=1))
+        # then
+        self.assertEqual(len(cache), 0)
+
+
+class TestEveUniverseCacheScope(NoSocketsTestCase):
+    def test_should_only_be_active_within_scope(self):
+        self.assertIsNone(current_cache())
+        with eveuniverse_cache() as cache:
+            self.assertIs(current_cache(), cache)
+        self.assertIsNone(current_cache())
+
+    def test_nested_scopes_should_share_cache(self):
+        with eveuniverse_cache() as outer_cache:
+            with eveuniverse_cache() as inner_cache:
+                self.assertIs(inner_cache, outer_cache)
+            self.assertIs(current_cache(), outer_cache)
+
+    def test_should_not_share_cache_between_threads(self):
+        # given
+        caches = []
+        # when
+        with eveuniverse_cache():
+            thread = Thread(target=lambda: caches.append(current_cache()))
+            thread.start()
+            thread.join()
+        # then
+        self.assertListEqual(caches, [None])
+
+    def test_can_be_used_as_decorator(self):
+        @eveuniverse_cache()
+        def my_func():
+            return current_cache()
+
+        self.assertIsInstance(my_func(), EveUniverseCache)
+        self.assertIsNone(current_cache())
@@ -0,0 +1,192 @@
+import csv
+import json
+from pathlib import Path
+from time import monotonic
+from typing import Iterator
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.utils.timezone import now
+
+from ...models import (
+    EveCategory,
+    EveConstellation,
+    EveGroup,
+    EveMoon,
+    EvePlanet,
+    EveRegion,
+    EveSolarSystem,
+    EveType,
+)
+
+# models in the order they need to be loaded to satisfy their foreign keys
+MODELS = [
+    EveCategory,
+    EveGroup,
+    EveType,
+    EveRegion,
+    EveConstellation,
+    EveSolarSystem,
+    EvePlanet,
+    EveMoon,
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads Eve Online SDE data from a local dump without accessing the network. "
+        "The dump is a directory with one CSV or JSON Lines file per model, "
+        "e.g. EveSolarSystem.csv. Files are read as a stream. "
+        "Objects that already exist are not changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to SDE dump directory")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of objects stored together",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+        if not path.is_dir():
+            raise CommandError(f"{path} is not a directory")
+
+        batch_size = options["batch_size"]
+        start_time = monotonic()
+        for EveModel in MODELS:
+            count_before = EveModel.objects.count()
+            processed_count = self._load_model(
+                EveModel, self._rows_from_directory(path, EveModel), batch_size
+            )
+            inserted_count = EveModel.objects.count() - count_before
+            self.stdout.write(
+                f"{EveModel.__name__}: Processed {processed_count:,} rows, "
+                f"inserted {inserted_count:,} new objects"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Load completed in %.1f seconds" % (monotonic() - start_time)
+            )
+        )
+
+    def _rows_from_directory(self, path: Path, EveModel: type) -> Iterator[dict]:
+        """yields rows for a model from its file in the dump directory"""
+        csv_path = path / f"{EveModel.__name__}.csv"
+        jsonl_path = path / f"{EveModel.__name__}.jsonl"
+        if csv_path.exists():
+            with csv_path.open("r", encoding="utf-8", newline="") as f:
+                yield from csv.DictReader(f)
+        elif jsonl_path.exists():
+            with jsonl_path.open("r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, start=1):
+                    if line.strip():
+                        try:
+                            yield json.loads(line)
+                        except ValueError as ex:
+                            raise CommandError(
+                                f"{jsonl_path.name}: Invalid JSON in line "
+                                f"{line_number}: {ex}"
+                            ) from ex
+
+    def _load_model(self, EveModel: type, rows: Iterator[dict], batch_size: int) -> int:
+        """loads objects for a model from rows in batches. Returns count of rows."""
+        fields = {
+            field.name: field
+            for field in EveModel._meta.concrete_fields
+            if field.name != "last_updated"
+        }
+        last_updated = now()
+        count = 0
+        batch = list()
+        for row_number, row in enumerate(rows, start=1):
+            obj = EveModel(last_updated=last_updated)
+            for field_name, field in fields.items():
+                if field.attname in row:
+                    value = row[field.attname]
+                elif field_name in row:
+                    value = row[field_name]
+                else:
+                    continue
+                try:
+                    setattr(obj, field.attname, self._to_python(field, value))
+                except (ValueError, ValidationError) as ex:
+                    raise CommandError(
+                        f"{EveModel.__name__}: Invalid value {value!r} for "
+                        f"{field_name} in row {row_number} (id: {row.get('id')}): "
+                        f"{ex}"
+                    ) from ex
+
+            batch.append((row_number, obj))
+            if len(batch) >= batch_size:
+                count += self._store_batch(EveModel, batch)
+                batch = list()
+
+        if batch:
+            count += self._store_batch(EveModel, batch)
+
+        return count
+
+    @staticmethod
+    def _check_parents(EveModel: type, batch: list) -> None:
+        """ensures all parent objects of a batch exist in the database"""
+        for field in EveModel._meta.concrete_fields:
+            if not field.many_to_one:
+                continue
+            parent_ids = {
+                getattr(obj, field.attname)
+                for _, obj in batch
+                if getattr(obj, field.attname) is not None
+            }
+            existing_ids = set(
+                field.related_model.objects.filter(pk__in=parent_ids).values_list(
+                    "pk", flat=True
+                )
+            )
+            for row_number, obj in batch:
+                parent_id = getattr(obj, field.attname)
+                if parent_id is not None and parent_id not in existing_ids:
+                    raise CommandError(
+                        f"{EveModel.__name__}: Unknown {field.related_model.__name__} "
+                        f"{parent_id!r} for {field.name} in row {row_number} "
+                        f"(id: {obj.pk})"
+                    )
+
+    @staticmethod
+    def _generate_localizations(batch: list) -> None:
+        """generates localizations, which need the related solar system"""
+        solar_systems = EveSolarSystem.objects.in_bulk(
+            {obj.eve_solar_system_id for _, obj in batch}
+        )
+        for _, obj in batch:
+            obj.eve_solar_system = solar_systems[obj.eve_solar_system_id]
+            obj.set_generated_translations()
+
+    @staticmethod
+    def _to_python(field: models.Field, value):
+        """converts a value from the dump into a python value for the given field"""
+        if value == "" and (field.null or field.is_relation):
+            return None
+        if value is None and not field.null and isinstance(field, models.CharField):
+            return ""
+        if field.is_relation:
+            return field.target_field.to_python(value)
+        return field.to_python(value)
+
+    @classmethod
+    def _store_batch(cls, EveModel: type, batch: list) -> int:
+        """stores a batch of row numbers and their objects. Returns count of rows."""
+        cls._check_parents(EveModel, batch)
+        if EveModel._eve_universe_meta_attr("generate_localization"):
+            cls._generate_localizations(batch)
+        with transaction.atomic():
+            EveModel.objects.bulk_create(
+                [obj for _, obj in batch], ignore_conflicts=True
+            )
+        return len(batch)
@@ -1,5 +1,12 @@
+from time import monotonic
+
+from bravado.exception import HTTPError
+
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
+from django.utils.timezone import now
 
+from ...app_settings import STRUCTURES_ESI_MAX_WORKERS
 from ...models import (
     EveCategory,
     EveConstellation,
@@ -10,6 +17,9 @@ from ...models import (
     EveType,
 )
 
+# cache key for the start time of an unfinished update, which is used to resume it
+CHECKPOINT_KEY = "structures_updatesde_checkpoint"
+
 
 def get_input(text):
     """wrapped input to enable unit testing / patching"""
@@ -19,8 +29,32 @@ def get_input(text):
 class Command(BaseCommand):
     help = "Updates Eve Online SDE data"
 
-    def _update_models(self):
-        """updates all SDE models from ESI and provides progress output"""
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=STRUCTURES_ESI_MAX_WORKERS,
+            help="Max number of concurrent requests to ESI",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of objects fetched and stored together",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Update all objects again instead of resuming an unfinished update",
+        )
+
+    def _update_models(self, workers: int, batch_size: int, restart: bool) -> bool:
+        """updates all SDE models from ESI and provides progress output
+
+        Objects already updated by an unfinished previous run are skipped.
+
+        Returns True if all objects were updated, else False
+        """
         models = [
             EveCategory,
             EveGroup,
@@ -30,22 +64,64 @@ class Command(BaseCommand):
             EveSolarSystem,
             EveMoon,
         ]
-        model_count = 0
-        for EveModel in models:
-            total_objects = EveModel.objects.count()
-            model_count += 1
+        started_at = None if restart else cache.get(CHECKPOINT_KEY)
+        if started_at:
+            self.stdout.write(
+                "Resuming unfinished update from %s" % started_at.isoformat()
+            )
+        else:
+            started_at = now()
+            cache.set(CHECKPOINT_KEY, started_at, timeout=None)
+
+        is_complete = True
+        for model_count, EveModel in enumerate(models, start=1):
+            eve_ids = list(
+                EveModel.objects.exclude(last_updated__gte=started_at)
+                .order_by("last_updated")
+                .values_list("id", flat=True)
+            )
+            total_objects = len(eve_ids)
             self.stdout.write(
                 "Updating %d objects of %s (%d/%d)..."
                 % (total_objects, EveModel.__name__, model_count, len(models))
             )
-            count_updated = EveModel.objects.update_all_esi()
+            count_updated = 0
+            start_time = monotonic()
+            for start in range(0, total_objects, batch_size):
+                batch_ids = eve_ids[start : start + batch_size]
+                try:
+                    EveModel.objects.update_or_create_many_esi(batch_ids, workers)
+                except HTTPError as ex:
+                    self.stdout.write(
+                        self.style.WARNING("Failed to update a batch: %s" % ex)
+                    )
+                else:
+                    count_updated += len(batch_ids)
+
+                duration = max(monotonic() - start_time, 0.001)
+                self.stdout.write(
+                    "%s: %d/%d objects updated (%.1f objects/s)"
+                    % (
+                        EveModel.__name__,
+                        count_updated,
+                        total_objects,
+                        (start + len(batch_ids)) / duration,
+                    )
+                )
+
             if count_updated < total_objects:
+                is_complete = False
                 self.stdout.write(
-                    self.style.DANGER(
+                    self.style.ERROR(
                         "Only %d objects updated due to an error." % count_updated
                     )
                 )
 
+        if is_complete:
+            cache.delete(CHECKPOINT_KEY)
+
+        return is_complete
+
     def handle(self, *args, **options):
         self.stdout.write(
             "This command will reload all local EVE Online SDE data from "
@@ -54,7 +130,17 @@ class Command(BaseCommand):
         user_input = get_input("Are you sure you want to proceed? (y/N)?")
         if user_input.lower() == "y":
             self.stdout.write("Starting update. Please stand by.")
-            self._update_models()
-            self.stdout.write("Update completed!")
+            is_complete = self._update_models(
+                workers=options["workers"],
+                batch_size=options["batch_size"],
+                restart=options["restart"],
+            )
+            if is_complete:
+                self.stdout.write("Update completed!")
+            else:
+                self.stdout.write(
+                    "Update not completed. "
+                    "Run this command again to resume where it stopped."
+                )
         else:
             self.stdout.write("Aborted")
@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from pydoc import locate
+from typing import Iterable, List, NamedTuple, Optional
 
-from bravado.exception import HTTPError
+from bravado.exception import HTTPError, HTTPNotFound
 
 from django.db import models, transaction
 from django.db.models import Case, Count, Q, Value, When
@@ -11,11 +14,20 @@ from allianceauth.services.hooks import get_extension_logger
 from app_utils.logging import LoggerAddTag
 
 from . import __title__, constants
+from .app_settings import (
+    STRUCTURES_ESI_MAX_WORKERS,
+    STRUCTURES_HOURS_UNTIL_STALE_NOTIFICATION,
+)
 from .helpers.esi_fetch import esi_fetch, esi_fetch_with_localization
+from .helpers.eveuniverse_cache import current_cache
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
 
+# max number of IDs ESI accepts for one request to post_universe_names
+ESI_POST_UNIVERSE_NAMES_MAX_IDS = 1000
+
+
 def make_log_prefix(model_manager, id):
     return f"{model_manager.model.__name__}(id={id})"
 
@@ -30,12 +42,21 @@ class EveUniverseManager(models.Manager):
         Returns: object, created
         """
         eve_id = int(eve_id)
+        cache = current_cache()
+        if cache is not None:
+            obj = cache.get(self.model, eve_id)
+            if obj:
+                return obj, False
+
         try:
             obj = self.get(id=eve_id)
             created = False
         except self.model.DoesNotExist:
             obj, created = self.update_or_create_esi(eve_id)
 
+        if cache is not None:
+            cache.set(obj)
+
         return obj, created
 
     def update_or_create_esi(self, eve_id: int) -> tuple:
@@ -46,24 +67,14 @@ class EveUniverseManager(models.Manager):
 
         Returns: object, created
         """
-        from .models import EsiNameLocalization
-
         eve_id = int(eve_id)
         log_prefix = make_log_prefix(self, eve_id)
+        cache = current_cache()
+        if cache is not None:
+            cache.invalidate(self.model, eve_id)
+
         try:
-            esi_path = "Universe." + self.model.esi_method()
-            args = {self.model.esi_pk(): eve_id}
-            if self.model.has_esi_localization():
-                eve_data_objects = esi_fetch_with_localization(
-                    esi_path=esi_path,
-                    languages=EsiNameLocalization.ESI_LANGUAGES,
-                    args=args,
-                )
-            else:
-                eve_data_objects = dict()
-                eve_data_objects[EsiNameLocalization.ESI_DEFAULT_LANGUAGE] = esi_fetch(
-                    esi_path=esi_path, args=args
-                )  # noqa E123
+            eve_data_objects = self._fetch_esi(eve_id)
             defaults = self.model.map_esi_fields_to_model(eve_data_objects)
             obj, created = self.update_or_create(id=eve_id, defaults=defaults)
             obj.set_generated_translations()
@@ -76,6 +87,160 @@ class EveUniverseManager(models.Manager):
 
         return obj, created
 
+    def get_or_create_many_esi(self, eve_ids: Iterable[int]) -> dict:
+        """gets or creates many eve universe objects fetched from ESI if needed.
+        Will always get/create parent and children objects of new objects.
+
+        Missing objects are fetched concurrently from ESI and created in bulk.
+        Their parents are resolved the same way before, one level at a time.
+
+        eve_ids: Eve Online IDs of objects
+
+        Returns: objects by ID
+        """
+        eve_ids = {int(eve_id) for eve_id in eve_ids}
+        objs = dict()
+        cache = current_cache()
+        if cache is not None:
+            for eve_id in eve_ids:
+                obj = cache.get(self.model, eve_id)
+                if obj:
+                    objs[eve_id] = obj
+
+        if eve_ids - objs.keys():
+            objs.update(self.in_bulk(eve_ids - objs.keys()))
+
+        missing_ids = eve_ids - objs.keys()
+        if missing_ids:
+            objs.update(self.update_or_create_many_esi(missing_ids))
+
+        if cache is not None:
+            for obj in objs.values():
+                cache.set(obj)
+
+        return objs
+
+    def update_or_create_many_esi(
+        self, eve_ids: Iterable[int], max_workers: int = None
+    ) -> dict:
+        """updates or creates many Eve Universe objects with data fetched from ESI.
+        Will always update/create children and get/create parent objects.
+
+        Objects are fetched concurrently from ESI and written in bulk.
+
+        eve_ids: Eve Online IDs of objects
+        max_workers: max number of concurrent requests to ESI
+
+        Returns: objects by ID
+        """
+        eve_ids = {int(eve_id) for eve_id in eve_ids}
+        if not eve_ids:
+            return dict()
+
+        logger.info(
+            "%s: Fetching %d objects from ESI", self.model.__name__, len(eve_ids)
+        )
+        cache = current_cache()
+        if cache is not None:
+            for eve_id in eve_ids:
+                cache.invalidate(self.model, eve_id)
+
+        eve_data_by_id = self._fetch_many_esi(eve_ids, max_workers)
+        parent_objs = dict()
+        for field_name, (esi_key, ParentClass) in self.model._fk_mappings().items():
+            parent_objs[field_name] = ParentClass.objects.get_or_create_many_esi(
+                {
+                    eve_data_objects[self.model.ESI_DEFAULT_LANGUAGE][esi_key]
+                    for eve_data_objects in eve_data_by_id.values()
+                }
+            )
+
+        existing_ids = set(self.filter(id__in=eve_ids).values_list("id", flat=True))
+        objs = list()
+        for eve_id, eve_data_objects in eve_data_by_id.items():
+            defaults = self.model.map_esi_fields_to_model(eve_data_objects, parent_objs)
+            obj = self.model(id=eve_id, **defaults)
+            obj.set_generated_translations()
+            objs.append(obj)
+
+        with transaction.atomic():
+            self.bulk_create(
+                [obj for obj in objs if obj.id not in existing_ids],
+                ignore_conflicts=True,
+            )
+            self.bulk_update(
+                [obj for obj in objs if obj.id in existing_ids],
+                fields=[
+                    field.name
+                    for field in self.model._meta.concrete_fields
+                    if not field.primary_key
+                ],
+            )
+
+        self._update_or_create_many_children(eve_data_by_id.values(), max_workers)
+        return {obj.id: obj for obj in objs}
+
+    def _fetch_many_esi(self, eve_ids: set, max_workers: int = None) -> dict:
+        """fetches data for many objects concurrently from ESI
+
+        Returns: ESI data objects by language by ID
+        """
+        with ThreadPoolExecutor(
+            max_workers=max_workers or STRUCTURES_ESI_MAX_WORKERS
+        ) as executor:
+            futures = {
+                eve_id: executor.submit(self._fetch_esi, eve_id) for eve_id in eve_ids
+            }
+            try:
+                return {eve_id: future.result() for eve_id, future in futures.items()}
+            except Exception as ex:
+                for future in futures.values():
+                    future.cancel()
+                logger.warn("%s: Failed to fetch objects from ESI", self.model.__name__)
+                raise ex
+
+    def _fetch_esi(self, eve_id: int) -> dict:
+        """fetches data for an object from ESI
+
+        Requests are sent one after the other,
+        since this is called by the workers of the pool in _fetch_many_esi.
+
+        Returns: ESI data objects by language
+        """
+        from .models import EsiNameLocalization
+
+        esi_path = "Universe." + self.model.esi_method()
+        args = {self.model.esi_pk(): eve_id}
+        if self.model.has_esi_localization():
+            eve_data_objects = esi_fetch_with_localization(
+                esi_path=esi_path,
+                languages=EsiNameLocalization.ESI_LANGUAGES,
+                args=args,
+                max_workers=1,
+            )
+        else:
+            eve_data_objects = dict()
+            eve_data_objects[EsiNameLocalization.ESI_DEFAULT_LANGUAGE] = esi_fetch(
+                esi_path=esi_path, args=args, max_workers=1
+            )  # noqa E123
+
+        return eve_data_objects
+
+    def _update_or_create_many_children(
+        self, eve_data_objects_list: list, max_workers: int = None
+    ) -> None:
+        """updates or creates child objects in bulk if specified"""
+        for key, child_class in self.model.child_mappings().items():
+            ChildClass = locate(__package__ + ".models." + child_class)
+            child_ids = {
+                eve_data_obj_2[ChildClass.esi_pk()]
+                for eve_data_objects in eve_data_objects_list
+                for eve_data_obj_2 in eve_data_objects[self.model.ESI_DEFAULT_LANGUAGE][
+                    key
+                ]
+            }
+            ChildClass.objects.update_or_create_many_esi(child_ids, max_workers)
+
     def _update_or_create_children(self, eve_data_objects: dict) -> None:
         """updates or creates child objects if specified"""
         eve_data_obj = eve_data_objects[self.model.ESI_DEFAULT_LANGUAGE]
@@ -85,53 +250,123 @@ class EveUniverseManager(models.Manager):
                 eve_id = eve_data_obj_2[ChildClass.esi_pk()]
                 ChildClass.objects.update_or_create_esi(eve_id)
 
-    def update_all_esi(self) -> int:
-        """update all objects from ESI. Returns count of updated  objects"""
+    def update_all_esi(self, batch_size: int = 100, max_workers: int = None) -> int:
+        """update all objects from ESI in batches. Returns count of updated objects"""
         logger.info(
             "%s: Updating %d objects from from ESI...",
             self.model.__name__,
             self.count(),
         )
         count_updated = 0
-        for eve_obj in self.all().order_by("last_updated"):
+        eve_ids = list(self.order_by("last_updated").values_list("id", flat=True))
+        for start in range(0, len(eve_ids), batch_size):
+            batch_ids = eve_ids[start : start + batch_size]
             try:
-                self.update_or_create_esi(eve_obj.id)
-                count_updated += 1
+                self.update_or_create_many_esi(batch_ids, max_workers)
+                count_updated += len(batch_ids)
             except HTTPError:
                 logger.exception("Update interrupted by exception")
 
         return count_updated
 
 
+class SovereigntyOwner(NamedTuple):
+    """owner of sovereignty in a solar system"""
+
+    alliance_id: Optional[int]
+    corporation_id: Optional[int]
+    faction_id: Optional[int]
+
+
+class SovereigntyChange(NamedTuple):
+    """change of sovereignty in a solar system. Owner is None when unclaimed."""
+
+    solar_system_id: int
+    old_owner: Optional[SovereigntyOwner]
+    new_owner: Optional[SovereigntyOwner]
+
+
 class EveSovereigntyMapManager(models.Manager):
-    def update_from_esi(self):
+    def update_from_esi(self) -> List[SovereigntyChange]:
+        """updates the sovereignty map from ESI.
+        Only rows for solar systems with changed owners are written.
+
+        Returns: changes compared to the stored map
+        """
         logger.info("Fetching sovereignty map from ESI...")
         sov_map = esi_fetch("Sovereignty.get_sovereignty_map", args={})
-        last_updated = now()
-        obj_list = list()
+        new_owners = dict()
         for solar_system in sov_map:
-            obj_def = {
-                "solar_system_id": solar_system["system_id"],
-                "last_updated": last_updated,
-            }
-            for key in ["alliance_id", "corporation_id", "faction_id"]:
-                if key in solar_system and solar_system[key]:
-                    obj_def[key] = solar_system[key]
-                else:
-                    obj_def[key] = None
-
-            if (
-                obj_def["alliance_id"]
-                or obj_def["corporation_id"]
-                or obj_def["faction_id"]
-            ):
-                obj_list.append(self.model(**obj_def))
+            owner = SovereigntyOwner(
+                *[
+                    solar_system.get(key) or None
+                    for key in ["alliance_id", "corporation_id", "faction_id"]
+                ]
+            )
+            if any(owner):
+                new_owners[solar_system["system_id"]] = owner
+
+        if not new_owners:
+            return []
+
+        old_objs = self.in_bulk()
+        changes = list()
+        for solar_system_id in old_objs.keys() | new_owners.keys():
+            old_obj = old_objs.get(solar_system_id)
+            old_owner = (
+                SovereigntyOwner(
+                    old_obj.alliance_id, old_obj.corporation_id, old_obj.faction_id
+                )
+                if old_obj
+                else None
+            )
+            new_owner = new_owners.get(solar_system_id)
+            if old_owner != new_owner:
+                changes.append(SovereigntyChange(solar_system_id, old_owner, new_owner))
 
-        if obj_list:
-            logger.info("Storing sovereignty map ...")
+        if changes:
+            logger.info("Storing %d changes to sovereignty map ...", len(changes))
+            last_updated = now()
             with transaction.atomic():
-                self.all().delete()
-                self.bulk_create(obj_list, batch_size=1000)
+                self.filter(
+                    solar_system_id__in=[
+                        change.solar_system_id
+                        for change in changes
+                        if change.new_owner is None
+                    ]
+                ).delete()
+                self.bulk_create(
+                    [
+                        self.model(
+                            solar_system_id=change.solar_system_id,
+                            last_updated=last_updated,
+                            **change.new_owner._asdict(),
+                        )
+                        for change in changes
+                        if change.old_owner is None
+                    ],
+                    batch_size=1000,
+                )
+                changed_objs = list()
+                for change in changes:
+                    if change.old_owner and change.new_owner:
+                        obj = old_objs[change.solar_system_id]
+                        for key, value in change.new_owner._asdict().items():
+                            setattr(obj, key, value)
+                        obj.last_updated = last_updated
+                        changed_objs.append(obj)
+                self.bulk_update(
+                    changed_objs,
+                    fields=[
+                        "alliance_id",
+                        "corporation_id",
+                        "faction_id",
+                        "last_updated",
+                    ],
+                    batch_size=1000,
+                )
+
+        return changes
 
 
 class EveEntityManager(models.Manager):
@@ -181,6 +416,70 @@ class EveEntityManager(models.Manager):
 
         return obj, created
 
+    def get_or_create_many_esi(self, eve_entity_ids: Iterable[int]) -> dict:
+        """gets or creates many EveEntity objs with data fetched from ESI if needed
+
+        Unknown IDs are resolved in chunks with one request to ESI per chunk.
+        Invalid IDs are skipped.
+
+        eve_entity_ids: Eve Online IDs of objects
+
+        Returns: objects by ID
+        """
+        eve_entity_ids = {int(eve_entity_id) for eve_entity_id in eve_entity_ids}
+        objs = self.in_bulk(eve_entity_ids)
+        missing_ids = sorted(eve_entity_ids - objs.keys())
+        new_objs = list()
+        for start in range(0, len(missing_ids), ESI_POST_UNIVERSE_NAMES_MAX_IDS):
+            chunk_ids = missing_ids[start : start + ESI_POST_UNIVERSE_NAMES_MAX_IDS]
+            try:
+                response = self._fetch_names_from_esi(chunk_ids)
+            except Exception as ex:
+                logger.warn(
+                    "%s: Failed to load %d eve entities",
+                    self.model.__name__,
+                    len(chunk_ids),
+                )
+                raise ex
+
+            new_objs += [
+                self.model(
+                    id=entity["id"],
+                    category=self.model.Category.from_esi_name(entity["category"]),
+                    name=entity["name"],
+                )
+                for entity in response
+                if entity["id"] in eve_entity_ids
+            ]
+
+        if new_objs:
+            self.bulk_create(new_objs, ignore_conflicts=True)
+            objs.update({obj.id: obj for obj in new_objs})
+
+        return objs
+
+    def _fetch_names_from_esi(self, eve_entity_ids: List[int]) -> list:
+        """fetches names for IDs from ESI.
+
+        ESI rejects the whole request when it contains an invalid ID,
+        so a rejected request is split in half and each half is retried.
+        """
+        try:
+            return esi_fetch(
+                esi_path="Universe.post_universe_names", args={"ids": eve_entity_ids}
+            )
+        except HTTPNotFound:
+            if len(eve_entity_ids) == 1:
+                logger.warn(
+                    "%s: Skipping invalid ID", make_log_prefix(self, eve_entity_ids[0])
+                )
+                return []
+
+        middle = len(eve_entity_ids) // 2
+        return self._fetch_names_from_esi(
+            eve_entity_ids[:middle]
+        ) + self._fetch_names_from_esi(eve_entity_ids[middle:])
+
 
 class StructureQuerySet(models.QuerySet):
     def filter_upwell_structures(self) -> models.QuerySet:
@@ -291,45 +590,11 @@ class StructureManagerBase(models.Manager):
             EveType,
             StructureService,
         )
-        from .models.eveuniverse import EveUniverse
 
         eve_type, _ = EveType.objects.get_or_create_esi(structure["type_id"])
         eve_solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
             structure["system_id"]
         )
-        fuel_expires_at = (
-            structure["fuel_expires"] if "fuel_expires" in structure else None
-        )
-        next_reinforce_hour = (
-            structure["next_reinforce_hour"]
-            if "next_reinforce_hour" in structure
-            else None
-        )
-        next_reinforce_apply = (
-            structure["next_reinforce_apply"]
-            if "next_reinforce_apply" in structure
-            else None
-        )
-        reinforce_hour = (
-            structure["reinforce_hour"] if "reinforce_hour" in structure else None
-        )
-        state = (
-            self.model.State.from_esi_name(structure["state"])
-            if "state" in structure
-            else self.model.State.UNKNOWN
-        )
-        state_timer_start = (
-            structure["state_timer_start"] if "state_timer_start" in structure else None
-        )
-        state_timer_end = (
-            structure["state_timer_end"] if "state_timer_end" in structure else None
-        )
-        unanchors_at = (
-            structure["unanchors_at"] if "unanchors_at" in structure else None
-        )
-        position_x = structure["position"]["x"] if "position" in structure else None
-        position_y = structure["position"]["y"] if "position" in structure else None
-        position_z = structure["position"]["z"] if "position" in structure else None
         if "planet_id" in structure:
             eve_planet, _ = EvePlanet.objects.get_or_create_esi(structure["planet_id"])
         else:
@@ -338,46 +603,28 @@ class StructureManagerBase(models.Manager):
             eve_moon, _ = EveMoon.objects.get_or_create_esi(structure["moon_id"])
         else:
             eve_moon = None
-        obj, created = self.update_or_create(
-            id=structure["structure_id"],
-            defaults={
+        defaults = self._defaults_from_dict(structure)
+        defaults.update(
+            {
                 "owner": owner,
                 "eve_type": eve_type,
-                "name": structure["name"],
                 "eve_solar_system": eve_solar_system,
                 "eve_planet": eve_planet,
                 "eve_moon": eve_moon,
-                "position_x": position_x,
-                "position_y": position_y,
-                "position_z": position_z,
-                "fuel_expires_at": fuel_expires_at,
-                "next_reinforce_hour": next_reinforce_hour,
-                "next_reinforce_apply": next_reinforce_apply,
-                "reinforce_hour": reinforce_hour,
-                "state": state,
-                "state_timer_start": state_timer_start,
-                "state_timer_end": state_timer_end,
-                "unanchors_at": unanchors_at,
                 "last_updated_at": now(),
-            },
+            }
+        )
+        obj, created = self.update_or_create(
+            id=structure["structure_id"], defaults=defaults
         )
         # Make sure we have dogmas loaded for this type for fittings
         EveUniverseType.objects.get_or_create_esi(
             id=structure["type_id"], enabled_sections=[EveUniverseType.Section.DOGMAS]
         )
         # save related structure services
-        StructureService.objects.filter(structure=obj).delete()
-        if "services" in structure and structure["services"]:
-            for service in structure["services"]:
-                state = StructureService.State.from_esi_name(service["state"])
-                args = {"structure": obj, "name": service["name"], "state": state}
-                for lang in EveUniverse.ESI_LANGUAGES:
-                    if lang != EveUniverse.ESI_DEFAULT_LANGUAGE:
-                        field_name = "name_%s" % lang
-                        if field_name in service:
-                            args[field_name] = service[field_name]
-
-                StructureService.objects.create(**args)
+        StructureService.objects.update_for_structures(
+            [obj.id], self._services_from_dict(structure, obj)
+        )
 
         if obj.services.filter(state=StructureService.State.ONLINE).exists():
             obj.last_online_at = now()
@@ -385,10 +632,307 @@ class StructureManagerBase(models.Manager):
 
         return obj, created
 
+    def update_or_create_from_dicts(self, structures: list, owner: object) -> list:
+        """update or create structures from given dicts in bulk
+
+        Gives the same result as calling ``update_or_create_from_dict()``
+        for each dict, but writes structures, services and tags
+        with a fixed number of bulk queries.
+        Related Eve objects missing locally are fetched from ESI in bulk.
+
+        Returns: list of structure objects in the same order as the dicts
+        """
+        from eveuniverse.models import EveType as EveUniverseType
+
+        from .models import (
+            EveMoon,
+            EvePlanet,
+            EveSolarSystem,
+            EveType,
+            StructureService,
+            StructureTag,
+        )
+
+        if not structures:
+            return []
+
+        eve_types = EveType.objects.get_or_create_many_esi(
+            {x["type_id"] for x in structures}
+        )
+        eve_solar_systems = EveSolarSystem.objects.get_or_create_many_esi(
+            {x["system_id"] for x in structures}
+        )
+        eve_planets = EvePlanet.objects.get_or_create_many_esi(
+            {x["planet_id"] for x in structures if "planet_id" in x}
+        )
+        eve_moons = EveMoon.objects.get_or_create_many_esi(
+            {x["moon_id"] for x in structures if "moon_id" in x}
+        )
+        # Make sure we have dogmas loaded for these types for fittings
+        for type_id in eve_types.keys():
+            EveUniverseType.objects.get_or_create_esi(
+                id=type_id, enabled_sections=[EveUniverseType.Section.DOGMAS]
+            )
+
+        existing_objs = self.in_bulk({x["structure_id"] for x in structures})
+        update_time = now()
+        objs = dict()
+        services = list()
+        for structure in structures:
+            structure_id = structure["structure_id"]
+            defaults = self._defaults_from_dict(structure)
+            defaults.update(
+                {
+                    "owner": owner,
+                    "eve_type": eve_types[structure["type_id"]],
+                    "eve_solar_system": eve_solar_systems[structure["system_id"]],
+                    "eve_planet": eve_planets.get(structure.get("planet_id")),
+                    "eve_moon": eve_moons.get(structure.get("moon_id")),
+                    "last_updated_at": update_time,
+                }
+            )
+            obj = existing_objs.get(structure_id) or objs.get(structure_id)
+            if obj:
+                for field_name, value in defaults.items():
+                    setattr(obj, field_name, value)
+            else:
+                obj = self.model(id=structure_id, **defaults)
+            structure_services = self._services_from_dict(structure, obj)
+            if any(
+                service.state == StructureService.State.ONLINE
+                for service in structure_services
+            ):
+                obj.last_online_at = update_time
+            services += structure_services
+            objs[structure_id] = obj
+
+        with transaction.atomic():
+            self.bulk_create(
+                [obj for obj in objs.values() if obj.id not in existing_objs]
+            )
+            self.bulk_update(
+                [obj for obj in objs.values() if obj.id in existing_objs],
+                fields=[
+                    "owner",
+                    "eve_type",
+                    "name",
+                    "eve_solar_system",
+                    "eve_planet",
+                    "eve_moon",
+                    "position_x",
+                    "position_y",
+                    "position_z",
+                    "fuel_expires_at",
+                    "next_reinforce_hour",
+                    "next_reinforce_apply",
+                    "reinforce_hour",
+                    "state",
+                    "state_timer_start",
+                    "state_timer_end",
+                    "unanchors_at",
+                    "last_online_at",
+                    "last_updated_at",
+                ],
+            )
+            StructureService.objects.update_for_structures(objs.keys(), services)
+            tag_ids_by_structure = self._generated_tag_ids_for_structures(
+                objs.values(), owner
+            )
+            new_ids = objs.keys() - existing_objs.keys()
+            if new_ids:
+                default_tag_ids = set(
+                    StructureTag.objects.filter(is_default=True).values_list(
+                        "id", flat=True
+                    )
+                )
+                for structure_id in new_ids:
+                    tag_ids_by_structure[structure_id] |= default_tag_ids
+            StructureTagRelation = self.model.tags.through
+            StructureTagRelation.objects.bulk_create(
+                [
+                    StructureTagRelation(
+                        structure_id=structure_id, structuretag_id=tag_id
+                    )
+                    for structure_id, tag_ids in tag_ids_by_structure.items()
+                    for tag_id in tag_ids
+                ],
+                ignore_conflicts=True,
+            )
+
+        return [objs[x["structure_id"]] for x in structures]
+
+    def update_sov_tags(self, solar_system_ids: Iterable[int]) -> None:
+        """adds or removes the sov tag for structures in given solar systems,
+        e.g. after sovereignty changed for these solar systems
+        """
+        from .models import StructureTag
+
+        structures = self.filter(
+            eve_solar_system_id__in=solar_system_ids
+        ).select_related("owner__corporation__alliance", "eve_solar_system")
+        if not structures:
+            return
+
+        sov_tag, _ = StructureTag.objects.get_or_create_for_sov()
+        for structure in structures:
+            if structure.owner_has_sov:
+                structure.tags.add(sov_tag)
+            else:
+                structure.tags.remove(sov_tag)
+
+    def _defaults_from_dict(self, structure: dict) -> dict:
+        """returns field values for a structure from given dict,
+        excluding relations
+        """
+        position = structure.get("position")
+        return {
+            "name": structure["name"],
+            "position_x": position["x"] if position else None,
+            "position_y": position["y"] if position else None,
+            "position_z": position["z"] if position else None,
+            "fuel_expires_at": structure.get("fuel_expires"),
+            "next_reinforce_hour": structure.get("next_reinforce_hour"),
+            "next_reinforce_apply": structure.get("next_reinforce_apply"),
+            "reinforce_hour": structure.get("reinforce_hour"),
+            "state": (
+                self.model.State.from_esi_name(structure["state"])
+                if "state" in structure
+                else self.model.State.UNKNOWN
+            ),
+            "state_timer_start": structure.get("state_timer_start"),
+            "state_timer_end": structure.get("state_timer_end"),
+            "unanchors_at": structure.get("unanchors_at"),
+        }
+
+    def _services_from_dict(self, structure: dict, obj: models.Model) -> list:
+        """returns unsaved service objects for a structure from given dict"""
+        from .models import StructureService
+        from .models.eveuniverse import EveUniverse
+
+        services = list()
+        for service in structure.get("services") or []:
+            args = {
+                "structure": obj,
+                "name": service["name"],
+                "state": StructureService.State.from_esi_name(service["state"]),
+            }
+            for lang in EveUniverse.ESI_LANGUAGES:
+                if lang != EveUniverse.ESI_DEFAULT_LANGUAGE:
+                    field_name = "name_%s" % lang
+                    if field_name in service:
+                        args[field_name] = service[field_name]
+
+            services.append(StructureService(**args))
+
+        return services
+
+    def _generated_tag_ids_for_structures(self, objs: list, owner: object) -> dict:
+        """returns IDs of generated tags by structure ID for given structures.
+        Same tags as added by ``Structure.update_generated_tags()``.
+        """
+        from .models import EveSovereigntyMap, StructureTag
+
+        space_type_tag_ids = dict()
+        for obj in objs:
+            space_type = obj.eve_solar_system.space_type
+            if space_type not in space_type_tag_ids:
+                tag, _ = StructureTag.objects.get_or_create_for_space_type(
+                    obj.eve_solar_system
+                )
+                space_type_tag_ids[space_type] = tag.id if tag else None
+
+        alliance = owner.corporation.alliance
+        if alliance:
+            sov_system_ids = set(
+                EveSovereigntyMap.objects.filter(
+                    solar_system_id__in={
+                        obj.eve_solar_system_id
+                        for obj in objs
+                        if obj.eve_solar_system.is_null_sec
+                    },
+                    alliance_id=int(alliance.alliance_id),
+                ).values_list("solar_system_id", flat=True)
+            )
+        else:
+            sov_system_ids = set()
+        if sov_system_ids:
+            sov_tag, _ = StructureTag.objects.get_or_create_for_sov()
+
+        tag_ids_by_structure = dict()
+        for obj in objs:
+            tag_ids = set()
+            space_type_tag_id = space_type_tag_ids[obj.eve_solar_system.space_type]
+            if space_type_tag_id:
+                tag_ids.add(space_type_tag_id)
+            if obj.eve_solar_system_id in sov_system_ids:
+                tag_ids.add(sov_tag.id)
+            tag_ids_by_structure[obj.id] = tag_ids
+
+        return tag_ids_by_structure
+
 
 StructureManager = StructureManagerBase.from_queryset(StructureQuerySet)
 
 
+class StructureServiceManager(models.Manager):
+    def localizations_by_name(self, names: set, languages: set) -> dict:
+        """returns the known localizations for the given service names
+
+        Only names that have localizations for all given languages are included.
+
+        Returns: dict of localized names by name,
+        e.g. ``{"Clone Bay": {"name_de": "Klonbucht"}}``
+        """
+        field_names = ["name_" + lang for lang in languages]
+        localizations = dict()
+        for row in self.filter(name__in=names).values("name", *field_names):
+            if all(row[field_name] for field_name in field_names):
+                localizations[row.pop("name")] = row
+
+        return localizations
+
+    def update_for_structures(self, structure_ids: list, services: list) -> None:
+        """updates the stored services of given structures to match given services
+
+        Only rows that differ are inserted, updated or deleted.
+        Nothing is written when there are no changes.
+
+        structure_ids: IDs of all structures to update
+        services: unsaved service objects for these structures
+        """
+        field_names = ["state"] + self.model.localized_name_fields()
+        new_services = {(x.structure_id, x.name): x for x in services}
+        old_services = {
+            (x.structure_id, x.name): x
+            for x in self.filter(structure_id__in=structure_ids)
+        }
+        obsolete_ids = [
+            obj.pk for key, obj in old_services.items() if key not in new_services
+        ]
+        if obsolete_ids:
+            self.filter(pk__in=obsolete_ids).delete()
+
+        changed_services = list()
+        for key, new_obj in new_services.items():
+            old_obj = old_services.get(key)
+            if old_obj and any(
+                getattr(old_obj, field_name) != getattr(new_obj, field_name)
+                for field_name in field_names
+            ):
+                for field_name in field_names:
+                    setattr(old_obj, field_name, getattr(new_obj, field_name))
+                changed_services.append(old_obj)
+
+        if changed_services:
+            self.bulk_update(changed_services, fields=field_names)
+
+        added_services = [
+            obj for key, obj in new_services.items() if key not in old_services
+        ]
+        if added_services:
+            self.bulk_create(added_services)
+
+
 class StructureTagManager(models.Manager):
     def get_or_create_for_space_type(self, solar_system: object) -> tuple:
         if solar_system.space_type in self.model.SPACE_TYPE_MAP:
@@ -456,6 +1000,55 @@ class StructureTagManager(models.Manager):
         return obj, created
 
 
+class RefineryMoonManager(models.Manager):
+    def update_from_notifications(self, notifications: Iterable) -> int:
+        """Updates moons of refineries from given moon mining notifications.
+
+        Entries are only replaced by newer notifications.
+        Returns number of created or updated entries.
+        """
+        from .models import NotificationType
+
+        structure_id_2_moon = dict()
+        for notification in sorted(notifications, key=lambda obj: obj.timestamp):
+            if notification.notif_type not in NotificationType.relevant_for_moonmining:
+                continue
+            try:
+                parsed_text = notification.get_parsed_text()
+                structure_id = parsed_text["structureID"]
+                moon_id = parsed_text["moonID"]
+            except (KeyError, TypeError):
+                continue
+            structure_id_2_moon[structure_id] = (moon_id, notification.timestamp)
+
+        if not structure_id_2_moon:
+            return 0
+
+        existing_objs = self.in_bulk(structure_id_2_moon.keys())
+        new_objs = list()
+        changed_objs = list()
+        for structure_id, (moon_id, timestamp) in structure_id_2_moon.items():
+            obj = existing_objs.get(structure_id)
+            if not obj:
+                new_objs.append(
+                    self.model(
+                        structure_id=structure_id, moon_id=moon_id, timestamp=timestamp
+                    )
+                )
+            elif obj.timestamp < timestamp:
+                obj.moon_id = moon_id
+                obj.timestamp = timestamp
+                changed_objs.append(obj)
+
+        with transaction.atomic():
+            if new_objs:
+                self.bulk_create(new_objs, ignore_conflicts=True)
+            if changed_objs:
+                self.bulk_update(changed_objs, fields=["moon_id", "timestamp"])
+
+        return len(new_objs) + len(changed_objs)
+
+
 class NotificationQuerySet(models.QuerySet):
     def annotate_can_be_rendered(self) -> models.QuerySet:
         """annotates field indicating if a notification can be rendered"""
@@ -469,9 +1062,72 @@ class NotificationQuerySet(models.QuerySet):
             )
         )
 
+    def select_related_for_sending(self) -> models.QuerySet:
+        """Loads exactly the related objects needed for rendering notifications
+        and sending them to webhooks.
+        """
+        return self.select_related(
+            "owner__corporation__alliance", "sender"
+        ).prefetch_related("owner__ping_groups")
+
+    def new_for_forwarding(self, owner) -> models.QuerySet:
+        """New notifications of an owner which are due to be forwarded to webhooks,
+        oldest first. Stale notifications are excluded.
+        """
+        from .models import NotificationType
+
+        cutoff_dt_for_stale = now() - timedelta(
+            hours=STRUCTURES_HOURS_UNTIL_STALE_NOTIFICATION
+        )
+        return (
+            self.filter(owner=owner)
+            .filter(notif_type__in=NotificationType.values)
+            .filter(is_sent=False)
+            .filter(timestamp__gte=cutoff_dt_for_stale)
+            .select_related_for_sending()
+            .order_by("timestamp")
+        )
+
 
 class NotificationManagerBase(models.Manager):
-    pass
+    def archive_older_than(self, cutoff: datetime, batch_size: int = 1000) -> int:
+        """Moves notifications older than cutoff into the archive in batches.
+
+        Returns number of archived notifications.
+        """
+        from .models import ArchivedNotification
+
+        archived_count = 0
+        while True:
+            batch = list(
+                self.filter(timestamp__lt=cutoff)
+                .order_by("pk")
+                .values(
+                    "pk",
+                    "notification_id",
+                    "owner_id",
+                    "sender_id",
+                    "timestamp",
+                    "notif_type",
+                    "text",
+                    "created",
+                )[:batch_size]
+            )
+            if not batch:
+                break
+
+            pks = [values.pop("pk") for values in batch]
+            with transaction.atomic():
+                ArchivedNotification.objects.bulk_create(
+                    [ArchivedNotification(**values) for values in batch],
+                    ignore_conflicts=True,
+                )
+                self.filter(pk__in=pks).delete()
+
+            archived_count += len(batch)
+            logger.info("Archived %d notifications", archived_count)
+
+        return archived_count
 
 
 NotificationManager = NotificationManagerBase.from_queryset(NotificationQuerySet)
@@ -516,14 +1172,16 @@ class OwnerAssetManager(models.Manager):
             and asset["location_flag"]
             not in ["CorpDeliveries", "OfficeFolder", "SecondaryStorage", "AutoFit"]
         ]
+        eve_types = EveType.objects.get_or_create_many_esi(
+            {asset["type_id"] for asset in assets_in_structures}
+        )
         objs_ids = []
         for asset in assets_in_structures:
-            eve_type, _ = EveType.objects.get_or_create_esi(asset["type_id"])
             obj, _ = self.update_or_create(
                 id=asset["item_id"],
                 defaults={
                     "owner": owner,
-                    "eve_type": eve_type,
+                    "eve_type": eve_types[asset["type_id"]],
                     "is_singleton": asset["is_singleton"],
                     "location_flag": asset["location_flag"],
                     "location_id": asset["location_id"],
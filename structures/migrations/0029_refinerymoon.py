@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2021-07-20 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("structures", "0028_migrate_owner_characters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RefineryMoon",
+            fields=[
+                (
+                    "structure_id",
+                    models.BigIntegerField(
+                        help_text="Eve Online ID of the refinery",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "moon_id",
+                    models.PositiveIntegerField(help_text="Eve Online ID of the moon"),
+                ),
+                (
+                    "timestamp",
+                    models.DateTimeField(
+                        help_text="Date of the latest notification reporting this moon"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+"""This migration builds the index of refinery moons
+from all existing moon mining notifications.
+"""
+
+import yaml
+
+from django.db import migrations
+
+MOONMINING_NOTIF_TYPES = [
+    "MoonminingExtractionStarted",
+    "MoonminingExtractionCancelled",
+    "MoonminingLaserFired",
+    "MoonminingExtractionFinished",
+    "MoonminingAutomaticFracture",
+]
+
+
+def migrate_forward(apps, schema_editor):
+    Notification = apps.get_model("structures", "Notification")
+    RefineryMoon = apps.get_model("structures", "RefineryMoon")
+    structure_id_2_moon = dict()
+    notifications = (
+        Notification.objects.filter(notif_type__in=MOONMINING_NOTIF_TYPES)
+        .order_by("timestamp")
+        .values_list("text", "timestamp")
+    )
+    for text, timestamp in notifications.iterator():
+        try:
+            parsed_text = yaml.safe_load(text)
+            structure_id = parsed_text["structureID"]
+            moon_id = parsed_text["moonID"]
+        except (yaml.YAMLError, KeyError, TypeError):
+            continue
+        structure_id_2_moon[structure_id] = (moon_id, timestamp)
+
+    RefineryMoon.objects.bulk_create(
+        [
+            RefineryMoon(
+                structure_id=structure_id, moon_id=moon_id, timestamp=timestamp
+            )
+            for structure_id, (moon_id, timestamp) in structure_id_2_moon.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("structures", "0029_refinerymoon"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrate_forward, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("structures", "0030_populate_refinerymoons"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedNotification",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("notification_id", models.PositiveBigIntegerField(verbose_name="id")),
+                (
+                    "sender_id",
+                    models.PositiveIntegerField(
+                        help_text="Eve Online ID of the sender of this notification"
+                    ),
+                ),
+                ("timestamp", models.DateTimeField()),
+                (
+                    "notif_type",
+                    models.CharField(
+                        help_text="type of this notification as reported by ESI",
+                        max_length=100,
+                        verbose_name="type",
+                    ),
+                ),
+                (
+                    "text",
+                    models.TextField(
+                        blank=True,
+                        default=None,
+                        help_text="Notification details in YAML",
+                        null=True,
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        default=None,
+                        help_text="Date when this notification was first received from ESI",
+                        null=True,
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        help_text="Corporation that received this notification",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_notifications",
+                        to="structures.owner",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("notification_id", "owner")},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("structures", "0031_archivednotification"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["owner", "timestamp", "is_sent"],
+                name="structures__owner_i_04fc53_idx",
+            ),
+        ),
+    ]
@@ -13,6 +13,7 @@ from .eveuniverse import (
     EveType,
 )
 from .notifications import (
+    ArchivedNotification,
     EveEntity,
     Notification,
     NotificationType,
@@ -20,4 +21,10 @@ from .notifications import (
     get_default_notification_types,
 )
 from .owners import Owner, OwnerAsset, OwnerCharacter
-from .structures import PocoDetails, Structure, StructureService, StructureTag
+from .structures import (
+    PocoDetails,
+    RefineryMoon,
+    Structure,
+    StructureService,
+    StructureTag,
+)
@@ -1,6 +1,7 @@
 """Eve Universe models"""
 
 import urllib
+from typing import List
 
 from django.db import models
 from django.utils import translation
@@ -93,6 +94,15 @@ class EsiNameLocalization(models.Model):
     class Meta:
         abstract = True
 
+    @classmethod
+    def localized_name_fields(cls) -> List[str]:
+        """returns names of all fields with a localized name, e.g. name_de"""
+        return [
+            field.name
+            for field in cls._meta.concrete_fields
+            if field.name.startswith("name_")
+        ]
+
     @classmethod
     def _language_code_translation(cls, code: str, category_from: int) -> tuple:
         """translates language codes between systems"""
@@ -235,9 +245,14 @@ class EveUniverse(EsiNameLocalization, models.Model):
         return mappings
 
     @classmethod
-    def map_esi_fields_to_model(cls, eve_data_objects: dict) -> dict:
+    def map_esi_fields_to_model(
+        cls, eve_data_objects: dict, parent_objs: dict = None
+    ) -> dict:
         """maps ESi fields to model fields incl. translations if any
         returns the result as defaults dict
+
+        parent_objs: (optional) already resolved parent objects by ID for FK fields,
+        e.g. ``{"eve_group": {1657: <EveGroup>}}``
         """
         fk_mappings = cls._fk_mappings()
         field_mappings = cls._field_mappings()
@@ -246,7 +261,12 @@ class EveUniverse(EsiNameLocalization, models.Model):
         for key in cls._field_names_not_pk():
             if key in fk_mappings:
                 esi_key, ParentClass = fk_mappings[key]
-                value, _ = ParentClass.objects.get_or_create_esi(eve_data_obj[esi_key])
+                if parent_objs and key in parent_objs:
+                    value = parent_objs[key][eve_data_obj[esi_key]]
+                else:
+                    value, _ = ParentClass.objects.get_or_create_esi(
+                        eve_data_obj[esi_key]
+                    )
             else:
                 if key in field_mappings:
                     mapping = field_mappings[key]
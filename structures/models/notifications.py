@@ -1,6 +1,6 @@
 """Notification related models"""
 
-from typing import Tuple
+from typing import Optional, Tuple
 
 import dhooks_lite
 import yaml
@@ -9,6 +9,7 @@ from requests.exceptions import HTTPError
 
 from django.conf import settings
 from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.db import models
 from django.utils import translation
 from django.utils.functional import classproperty
@@ -30,6 +31,7 @@ from app_utils.urls import static_file_absolute_url
 from .. import __title__, constants
 from ..app_settings import (
     STRUCTURES_DEFAULT_LANGUAGE,
+    STRUCTURES_DISCORD_ROLES_CACHE_TIMEOUT,
     STRUCTURES_MOON_EXTRACTION_TIMERS_ENABLED,
     STRUCTURES_NOTIFICATION_SET_AVATAR,
     STRUCTURES_REPORT_NPC_ATTACKS,
@@ -57,6 +59,9 @@ if "structuretimers" in app_labels():
 else:
     has_structure_timers = False
 
+# use the much faster C implementation of the YAML loader when available
+YamlSafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
 # Supported languages
@@ -344,6 +349,28 @@ class Notification(models.Model):
 
     HTTP_CODE_TOO_MANY_REQUESTS = 429
 
+    # keys in the text of notifications which can refer to Eve entities
+    EVE_ENTITY_ID_KEYS = (
+        "againstID",
+        "aggressorAllianceID",
+        "aggressorCorpID",
+        "aggressorID",
+        "allianceID",
+        "allyID",
+        "cancelledBy",
+        "charID",
+        "corpID",
+        "declaredByID",
+        "defenderID",
+        "firedBy",
+        "invokingCharID",
+        "newOwnerCorpID",
+        "oldOwnerCorpID",
+        "opponentID",
+        "quitterID",
+        "startedBy",
+    )
+
     # event type structure map
     MAP_CAMPAIGN_EVENT_2_TYPE_ID = {
         1: constants.EVE_TYPE_ID_TCU,
@@ -402,6 +429,11 @@ class Notification(models.Model):
 
     class Meta:
         unique_together = (("notification_id", "owner"),)
+        indexes = [
+            # also allows filtering unsent notifications within the index,
+            # since filters on booleans are not used as index prefix by all databases
+            models.Index(fields=["owner", "timestamp", "is_sent"]),
+        ]
 
     def __str__(self) -> str:
         return str(self.notification_id)
@@ -435,8 +467,79 @@ class Notification(models.Model):
     #     return {x[0] for x in NotificationType.choices}
 
     def get_parsed_text(self) -> dict:
-        """Returns the notifications's text as dict."""
-        return yaml.safe_load(self.text)
+        """Returns the notifications's text as dict.
+
+        The result is cached on this instance until the text changes.
+        Callers must not modify the returned dict.
+        """
+        cached = getattr(self, "_parsed_text_cache", None)
+        if cached is not None and cached[0] == self.text:
+            return cached[1]
+
+        parsed_text = yaml.load(self.text, Loader=YamlSafeLoader)
+        self._parsed_text_cache = (self.text, parsed_text)
+        return parsed_text
+
+    def eve_entity_ids(self) -> set:
+        """Returns the IDs of all Eve entities referenced in this notification's text."""
+        try:
+            parsed_text = self.get_parsed_text()
+        except yaml.YAMLError:
+            return set()
+
+        if not isinstance(parsed_text, dict):
+            return set()
+
+        return {
+            parsed_text[key]
+            for key in self.EVE_ENTITY_ID_KEYS
+            if isinstance(parsed_text.get(key), int)
+        }
+
+    def structure_id(self) -> Optional[int]:
+        """Returns the ID of the structure referenced in this notification's text
+        or None if there is none.
+        """
+        try:
+            parsed_text = self.get_parsed_text()
+        except yaml.YAMLError:
+            return None
+
+        if not isinstance(parsed_text, dict):
+            return None
+
+        structure_id = parsed_text.get("structureID")
+        return structure_id if isinstance(structure_id, int) else None
+
+    def get_structure(self) -> Structure:
+        """Returns the structure referenced in this notification's text.
+
+        Uses the structures loaded by prefetch_structures() if available.
+        Raises Structure.DoesNotExist if the structure is not known.
+        """
+        structures = getattr(self, "_structures_cache", None)
+        if structures is None:
+            return Structure.objects.select_related_defaults().get(
+                id=self.structure_id()
+            )
+        try:
+            return structures[self.structure_id()]
+        except KeyError:
+            raise Structure.DoesNotExist() from None
+
+    @staticmethod
+    def prefetch_structures(notifications: list) -> None:
+        """Loads the structures referenced by notifications with one query,
+        so they are not fetched one by one when generating embeds.
+        """
+        structure_ids = {
+            structure_id
+            for structure_id in (obj.structure_id() for obj in notifications)
+            if structure_id
+        }
+        structures = Structure.objects.select_related_defaults().in_bulk(structure_ids)
+        for notification in notifications:
+            notification._structures_cache = structures
 
     def is_npc_attacking(self) -> bool:
         """Whether this notification is about a NPC attacking."""
@@ -471,9 +574,12 @@ class Notification(models.Model):
         """True when notification to be filtered out due to alliance level."""
         return self.is_alliance_level and not self.owner.is_alliance_main
 
-    def send_to_webhook(self, webhook: Webhook) -> bool:
+    def send_to_webhook(self, webhook: Webhook, save_is_sent: bool = True) -> bool:
         """Sends this notification to the configured webhook.
 
+        save_is_sent: whether to store that this notification has been sent.
+        Callers sending many notifications can disable it and update them in bulk.
+
         returns True if successful, else False
         """
         logger.info("%s: Trying to sent to webhook: %s", self, webhook)
@@ -494,21 +600,10 @@ class Notification(models.Model):
         else:
             content = ""
 
-        if webhook.ping_groups.count() > 0 or self.owner.ping_groups.count() > 0:
-            if "discord" in app_labels():
-                DiscordUser = self._import_discord()
-
-                groups = set(self.owner.ping_groups.all()) | set(
-                    webhook.ping_groups.all()
-                )
-                for group in groups:
-                    try:
-                        role = DiscordUser.objects.group_to_role(group)
-                    except HTTPError:
-                        logger.warning("Failed to get Discord roles", exc_info=True)
-                    else:
-                        if role:
-                            content += f" <@&{role['id']}>"
+        # using all() to benefit from prefetched ping groups
+        groups = set(self.owner.ping_groups.all()) | set(webhook.ping_groups.all())
+        if groups and "discord" in app_labels():
+            content += self._ping_groups_mentions(groups)
 
         username, avatar_url = self._gen_avatar()
         success = webhook.send_message(
@@ -516,13 +611,23 @@ class Notification(models.Model):
             embeds=[embed],
             username=username,
             avatar_url=avatar_url,
+            priority=self._ping_type_to_priority(ping_type),
         )
-        if success:
+        if success and not self.is_sent and save_is_sent:
             self.is_sent = True
-            self.save()
+            self.save(update_fields=["is_sent"])
 
         return success
 
+    @staticmethod
+    def _ping_type_to_priority(ping_type: Webhook.PingType) -> int:
+        """priority of the webhook queue lane for a notification with this ping type"""
+        if ping_type == Webhook.PingType.EVERYONE:
+            return Webhook.PRIORITY_HIGH
+        elif ping_type == Webhook.PingType.HERE:
+            return Webhook.PRIORITY_NORMAL
+        return Webhook.PRIORITY_LOW
+
     def _gen_avatar(self) -> Tuple[str, str]:
         if STRUCTURES_NOTIFICATION_SET_AVATAR:
             username = "Notifications"
@@ -533,6 +638,43 @@ class Notification(models.Model):
 
         return username, avatar_url
 
+    def _ping_groups_mentions(self, groups: set) -> str:
+        """Returns mentions of the Discord roles for given ping groups.
+
+        Mentions are cached for each combination of groups,
+        so changing the ping groups of an owner or webhook takes effect immediately.
+        """
+        group_pks = sorted(group.pk for group in groups)
+        cache_key = f"{__title__}_ping_mentions_" + "_".join(map(str, group_pks))
+        mentions = cache.get(cache_key)
+        if mentions is not None:
+            return mentions
+
+        DiscordUser = self._import_discord()
+        mentions = ""
+        is_complete = True
+        for group in sorted(groups, key=lambda obj: obj.pk):
+            role_cache_key = f"{__title__}_discord_role_{group.pk}"
+            role = cache.get(role_cache_key)
+            if role is None:
+                try:
+                    role = DiscordUser.objects.group_to_role(group) or dict()
+                except HTTPError:
+                    logger.warning("Failed to get Discord roles", exc_info=True)
+                    is_complete = False
+                    continue
+                cache.set(
+                    role_cache_key, role, timeout=STRUCTURES_DISCORD_ROLES_CACHE_TIMEOUT
+                )
+            if role:
+                mentions += f" <@&{role['id']}>"
+
+        if is_complete:
+            cache.set(
+                cache_key, mentions, timeout=STRUCTURES_DISCORD_ROLES_CACHE_TIMEOUT
+            )
+        return mentions
+
     @staticmethod
     def _import_discord() -> object:
         from allianceauth.services.modules.discord.models import DiscordUser
@@ -542,13 +684,25 @@ class Notification(models.Model):
     def _generate_embed(
         self, language_code: str
     ) -> Tuple[dhooks_lite.Embed, Webhook.PingType]:
-        """Generates a Discord embed for this notification."""
+        """Generates a Discord embed for this notification.
+
+        Embeds are cached per language on this instance,
+        so webhooks sharing a language get the same embed without rendering it again.
+        """
         from ..core.notification_embeds import NotificationBaseEmbed
 
+        if not hasattr(self, "_embeds_cache"):
+            self._embeds_cache = dict()
+        if language_code in self._embeds_cache:
+            return self._embeds_cache[language_code]
+
         logger.info("Creating embed with language = %s" % language_code)
         with translation.override(language_code):
             notification_embed = NotificationBaseEmbed.create(self)
-            return notification_embed.generate_embed(), notification_embed.ping_type
+            result = notification_embed.generate_embed(), notification_embed.ping_type
+
+        self._embeds_cache[language_code] = result
+        return result
 
     @classmethod
     def type_id_from_event_type(cls, event_type: int) -> int:
@@ -914,3 +1068,40 @@ class Notification(models.Model):
             "Automatically created from structure notification for "
             f"{self.owner.corporation} at {self.timestamp.strftime(DATETIME_FORMAT)}"
         )
+
+
+class ArchivedNotification(models.Model):
+    """A notification which has been moved out of the live notifications
+    after the retention period
+    """
+
+    notification_id = models.PositiveBigIntegerField(verbose_name="id")
+    owner = models.ForeignKey(
+        "Owner",
+        on_delete=models.CASCADE,
+        related_name="archived_notifications",
+        help_text="Corporation that received this notification",
+    )
+    sender_id = models.PositiveIntegerField(
+        help_text="Eve Online ID of the sender of this notification"
+    )
+    timestamp = models.DateTimeField()
+    notif_type = models.CharField(
+        max_length=100,
+        verbose_name="type",
+        help_text="type of this notification as reported by ESI",
+    )
+    text = models.TextField(
+        null=True, default=None, blank=True, help_text="Notification details in YAML"
+    )
+    created = models.DateTimeField(
+        null=True,
+        default=None,
+        help_text="Date when this notification was first received from ESI",
+    )
+
+    class Meta:
+        unique_together = (("notification_id", "owner"),)
+
+    def __str__(self) -> str:
+        return str(self.notification_id)
@@ -40,7 +40,7 @@ from ..helpers.esi_fetch import esi_fetch, esi_fetch_with_localization
 from ..managers import OwnerAssetManager, OwnerManager
 from .eveuniverse import EveMoon, EvePlanet, EveSolarSystem, EveType, EveUniverse
 from .notifications import EveEntity, Notification, NotificationType
-from .structures import PocoDetails, Structure
+from .structures import PocoDetails, RefineryMoon, Structure, StructureService
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
@@ -405,18 +405,11 @@ class Owner(models.Model):
 
         Return True if successful, else False.
         """
-        from .eveuniverse import EsiNameLocalization
-
         corporation_id = self.corporation.corporation_id
         structures = list()
         try:
-            # fetch all structures incl. localizations for services
-            structures_w_lang = esi_fetch_with_localization(
-                esi_path="Corporation.get_corporations_corporation_id_structures",
-                args={"corporation_id": corporation_id},
-                token=token,
-                languages=EsiNameLocalization.ESI_LANGUAGES,
-                has_pages=True,
+            structures = self._fetch_upwell_structures_with_localizations(
+                corporation_id, token
             )
         except OSError as ex:
             message_id = (
@@ -438,11 +431,6 @@ class Owner(models.Model):
             return False
 
         is_ok = True
-        # reduce data
-        structures = self._compress_services_localization(
-            structures_w_lang, EveUniverse.ESI_DEFAULT_LANGUAGE
-        )
-
         # fetch additional information for structures
         if not structures:
             logger.info("%s: No Upwell structures retrieved from ESI", self)
@@ -492,8 +480,7 @@ class Owner(models.Model):
                 self,
                 len(structures),
             )
-            for structure in structures:
-                Structure.objects.update_or_create_from_dict(structure, self)
+            Structure.objects.update_or_create_from_dicts(structures, self)
 
         if STRUCTURES_DEVELOPER_MODE:
             self._store_raw_data("structures", structures, corporation_id)
@@ -504,6 +491,50 @@ class Owner(models.Model):
         )
         return is_ok
 
+    def _fetch_upwell_structures_with_localizations(
+        self, corporation_id: int, token: Token
+    ) -> list:
+        """Fetch Upwell structures from ESI incl. localizations for services.
+
+        Localized service names are taken from already stored services.
+        Other languages are only fetched from ESI when a service name shows up,
+        which has not been seen before.
+        """
+        default_lang = EveUniverse.ESI_DEFAULT_LANGUAGE
+        structures = esi_fetch(
+            esi_path="Corporation.get_corporations_corporation_id_structures",
+            args={"corporation_id": corporation_id, "language": default_lang},
+            token=token,
+            has_pages=True,
+        )
+        service_names = {
+            service["name"]
+            for structure in structures
+            if structure.get("services")
+            for service in structure["services"]
+        }
+        other_languages = EveUniverse.ESI_LANGUAGES - {default_lang}
+        services_localized = StructureService.objects.localizations_by_name(
+            service_names, other_languages
+        )
+        if service_names.issubset(services_localized.keys()):
+            for structure in structures:
+                for service in structure.get("services") or []:
+                    service.update(services_localized[service["name"]])
+
+            return structures
+
+        logger.info("%s: Fetching localizations for new services from ESI", self)
+        structures_w_lang = esi_fetch_with_localization(
+            esi_path="Corporation.get_corporations_corporation_id_structures",
+            args={"corporation_id": corporation_id},
+            token=token,
+            languages=other_languages,
+            has_pages=True,
+        )
+        structures_w_lang[default_lang] = structures
+        return self._compress_services_localization(structures_w_lang, default_lang)
+
     @staticmethod
     def _compress_services_localization(
         structures_w_lang: dict, default_lang: str
@@ -586,8 +617,9 @@ class Owner(models.Model):
 
                 # making sure we have all solar systems loaded
                 # incl. their planets for later name matching
-                for solar_system_id in {int(x["system_id"]) for x in pocos}:
-                    EveSolarSystem.objects.get_or_create_esi(solar_system_id)
+                EveSolarSystem.objects.get_or_create_many_esi(
+                    {int(x["system_id"]) for x in pocos}
+                )
 
                 # compile pocos into structures list
                 for office_id, poco in pocos_2.items():
@@ -631,10 +663,10 @@ class Owner(models.Model):
                 logger.info(
                     "%s: Storing updates for %d customs offices", self, len(structure)
                 )
-                for office_id, structure in structures.items():
-                    structure_obj, _ = Structure.objects.update_or_create_from_dict(
-                        structure, self
-                    )
+                structure_objs = Structure.objects.update_or_create_from_dicts(
+                    list(structures.values()), self
+                )
+                for office_id, structure_obj in zip(structures.keys(), structure_objs):
                     try:
                         poco = pocos_2[office_id]
                     except KeyError:
@@ -772,6 +804,13 @@ class Owner(models.Model):
                 logger.info("%s: No starbases retrieved from ESI", self)
             else:
                 names = self._fetch_starbases_names(corporation_id, starbases, token)
+                # making sure we have all types and solar systems loaded
+                EveType.objects.get_or_create_many_esi(
+                    {x["type_id"] for x in starbases}
+                )
+                EveSolarSystem.objects.get_or_create_many_esi(
+                    {x["system_id"] for x in starbases}
+                )
                 for starbase in starbases:
                     starbase["fuel_expires"] = self._calc_starbase_fuel_expires(
                         corporation_id, starbase, token
@@ -809,8 +848,7 @@ class Owner(models.Model):
                 logger.info(
                     "%s: Storing updates for %d starbases", self, len(structures)
                 )
-                for structure in structures:
-                    Structure.objects.update_or_create_from_dict(structure, self)
+                Structure.objects.update_or_create_from_dicts(structures, self)
 
             if STRUCTURES_DEVELOPER_MODE:
                 self._store_raw_data("starbases", structures, corporation_id)
@@ -997,19 +1035,38 @@ class Owner(models.Model):
         Returns number of newly created objects.
         """
         # identify new notifications
+        # archived notifications can still be returned by ESI and must not come back
+        notification_ids = [obj["notification_id"] for obj in notifications]
         existing_notification_ids = set(
-            self.notifications.values_list("notification_id", flat=True)
+            self.notifications.filter(notification_id__in=notification_ids).values_list(
+                "notification_id", flat=True
+            )
+        ) | set(
+            self.archived_notifications.filter(
+                notification_id__in=notification_ids
+            ).values_list("notification_id", flat=True)
         )
         new_notifications = [
             obj
             for obj in notifications
             if obj["notification_id"] not in existing_notification_ids
         ]
+        # resolve all new senders at once
+        senders = EveEntity.objects.get_or_create_many_esi(
+            {
+                obj["sender_id"]
+                for obj in new_notifications
+                if EveEntity.Category.from_esi_name(obj["sender_type"])
+                != EveEntity.Category.OTHER
+            }
+        )
         # create new notif objects
         new_notification_objects = list()
         for notification in new_notifications:
             sender_type = EveEntity.Category.from_esi_name(notification["sender_type"])
-            if sender_type != EveEntity.Category.OTHER:
+            if notification["sender_id"] in senders:
+                sender = senders[notification["sender_id"]]
+            elif sender_type != EveEntity.Category.OTHER:
                 sender, _ = EveEntity.objects.get_or_create_esi(
                     eve_entity_id=notification["sender_id"]
                 )
@@ -1036,7 +1093,10 @@ class Owner(models.Model):
                 )
             )
 
-        Notification.objects.bulk_create(new_notification_objects)
+        Notification.objects.bulk_create(
+            new_notification_objects, ignore_conflicts=True
+        )
+        RefineryMoon.objects.update_from_notifications(new_notification_objects)
         return len(new_notification_objects)
 
     def _process_timers_for_notifications(self, token: Token):
@@ -1072,19 +1132,11 @@ class Owner(models.Model):
                 self,
                 empty_refineries.count(),
             )
-            notifications = (
-                Notification.objects.filter(owner=self)
-                .filter(notif_type__in=NotificationType.relevant_for_moonmining)
-                .select_related("owner", "sender")
-                .order_by("timestamp")
+            structure_id_2_moon_id = dict(
+                RefineryMoon.objects.filter(
+                    structure_id__in=[refinery.id for refinery in empty_refineries]
+                ).values_list("structure_id", "moon_id")
             )
-            structure_id_2_moon_id = dict()
-            for notification in notifications:
-                parsed_text = notification.get_parsed_text()
-                moon_id = parsed_text["moonID"]
-                structure_id = parsed_text["structureID"]
-                structure_id_2_moon_id[structure_id] = moon_id
-
             for refinery in empty_refineries:
                 if refinery.id in structure_id_2_moon_id:
                     logger.info("%s: Updating moon for structure %s", self, refinery)
@@ -1101,20 +1153,14 @@ class Owner(models.Model):
         self.forwarding_last_update_at = now()
         self.save()
 
-        cutoff_dt_for_stale = now() - timedelta(
-            hours=STRUCTURES_HOURS_UNTIL_STALE_NOTIFICATION
-        )
-        all_new_notifications = list(
-            Notification.objects.filter(owner=self)
-            .filter(notif_type__in=NotificationType.values)
-            .filter(is_sent=False)
-            .filter(timestamp__gte=cutoff_dt_for_stale)
-            .select_related()
-            .order_by("timestamp")
-        )
+        all_new_notifications = list(Notification.objects.new_for_forwarding(self))
+        self._resolve_eve_entities_for_notifications(all_new_notifications)
+        Notification.prefetch_structures(all_new_notifications)
         new_notifications_count = 0
         active_webhooks_count = 0
-        for webhook in self.webhooks.filter(is_active=True):
+        for webhook in self.webhooks.filter(is_active=True).prefetch_related(
+            "ping_groups"
+        ):
             active_webhooks_count += 1
             new_notifications = [
                 notif
@@ -1147,18 +1193,43 @@ class Owner(models.Model):
                 topic="notifications", topic_count=notifications_count, user=user
             )
 
+    def _resolve_eve_entities_for_notifications(self, notifications: list) -> None:
+        """Resolve all Eve entities referenced by notifications at once,
+        so they do not need to be fetched one by one when generating embeds.
+        """
+        eve_entity_ids = set()
+        for notification in notifications:
+            eve_entity_ids |= notification.eve_entity_ids()
+
+        if eve_entity_ids:
+            try:
+                EveEntity.objects.get_or_create_many_esi(eve_entity_ids)
+            except Exception:
+                # embeds will still resolve their entities one by one
+                logger.warning(
+                    "%s: Failed to resolve Eve entities for notifications",
+                    self,
+                    exc_info=True,
+                )
+
     def _send_notifications_to_webhook(self, new_notifications, webhook) -> int:
         """sends all notifications to given webhook"""
-        sent_count = 0
+        sent_notifications = list()
         for notification in new_notifications:
             if (
                 not notification.filter_for_npc_attacks()
                 and not notification.filter_for_alliance_level()
             ):
-                if notification.send_to_webhook(webhook):
-                    sent_count += 1
+                if notification.send_to_webhook(webhook, save_is_sent=False):
+                    sent_notifications.append(notification)
+
+        newly_sent_pks = [obj.pk for obj in sent_notifications if not obj.is_sent]
+        if newly_sent_pks:
+            Notification.objects.filter(pk__in=newly_sent_pks).update(is_sent=True)
+            for notification in sent_notifications:
+                notification.is_sent = True
 
-        return sent_count
+        return len(sent_notifications)
 
     def _send_report_to_user(self, topic: str, topic_count: int, user: User):
         message_details = "%(count)s %(topic)s synced." % {
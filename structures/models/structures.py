@@ -16,7 +16,12 @@ from app_utils.logging import LoggerAddTag
 from app_utils.views import bootstrap_label_html
 
 from .. import __title__
-from ..managers import StructureManager, StructureTagManager
+from ..managers import (
+    RefineryMoonManager,
+    StructureManager,
+    StructureServiceManager,
+    StructureTagManager,
+)
 from .eveuniverse import EsiNameLocalization, EveSolarSystem
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
@@ -476,6 +481,8 @@ class StructureService(EsiNameLocalization, models.Model):
         choices=State.choices, help_text="Current state of this service"
     )
 
+    objects = StructureServiceManager()
+
     class Meta:
         unique_together = (("structure", "name"),)
 
@@ -488,6 +495,23 @@ class StructureService(EsiNameLocalization, models.Model):
         )
 
 
+class RefineryMoon(models.Model):
+    """Moon of a refinery as reported by moon mining notifications"""
+
+    structure_id = models.BigIntegerField(
+        primary_key=True, help_text="Eve Online ID of the refinery"
+    )
+    moon_id = models.PositiveIntegerField(help_text="Eve Online ID of the moon")
+    timestamp = models.DateTimeField(
+        help_text="Date of the latest notification reporting this moon"
+    )
+
+    objects = RefineryMoonManager()
+
+    def __str__(self):
+        return "{} - {}".format(self.structure_id, self.moon_id)
+
+
 class PocoDetails(models.Model):
     class StandingLevel(models.IntegerChoices):
         NONE = -99, _("none")
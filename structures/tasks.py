@@ -1,8 +1,10 @@
+from datetime import timedelta
 from typing import Optional
 
 from celery import chain, shared_task
 
 from django.contrib.auth.models import User
+from django.utils.timezone import now
 
 from allianceauth.notifications import notify
 from allianceauth.services.hooks import get_extension_logger
@@ -11,13 +13,25 @@ from app_utils.esi import fetch_esi_status
 from app_utils.logging import LoggerAddTag
 
 from . import __title__
-from .app_settings import STRUCTURES_TASKS_TIME_LIMIT
-from .models import EveSovereigntyMap, Notification, Owner, Webhook
+from .app_settings import (
+    STRUCTURES_NOTIFICATION_RETENTION_DAYS,
+    STRUCTURES_TASKS_TIME_LIMIT,
+)
+from .helpers.eveuniverse_cache import eveuniverse_cache
+from .models import EveSovereigntyMap, Notification, Owner, Structure, Webhook
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
 TASK_PRIO_HIGH = 2
 
+# Max duration in seconds for sending queued messages to all webhooks.
+# Also used as lock timeout, so a crashed worker does not block sending for long.
+SEND_MESSAGES_TIMEOUT = 600
+
+# Seconds before the time limit when no new messages are taken from the queues.
+# Enough for the messages in flight to finish incl. their retries.
+SEND_MESSAGES_TIMEOUT_MARGIN = 180
+
 
 @shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
 def update_all_structures():
@@ -34,8 +48,12 @@ def update_all_structures():
 
 @shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
 def update_sov_map():
-    """Update sovereignty map from ESI."""
-    EveSovereigntyMap.objects.update_from_esi()
+    """Update sovereignty map from ESI and sov tags of affected structures."""
+    changes = EveSovereigntyMap.objects.update_from_esi()
+    if changes:
+        Structure.objects.update_sov_tags(
+            [change.solar_system_id for change in changes]
+        )
 
 
 @shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
@@ -79,13 +97,15 @@ def update_structures_for_owner(owner_pk, user_pk=None):
 @shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
 def update_structures_esi_for_owner(owner_pk, user_pk=None):
     """Update all structures for owner for ESI."""
-    _get_owner(owner_pk).update_structures_esi(_get_user(user_pk))
+    with eveuniverse_cache():
+        _get_owner(owner_pk).update_structures_esi(_get_user(user_pk))
 
 
 @shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
 def update_structures_assets_for_owner(owner_pk, user_pk=None):
     """Update all related assets for owner."""
-    _get_owner(owner_pk).update_asset_esi(_get_user(user_pk))
+    with eveuniverse_cache():
+        _get_owner(owner_pk).update_asset_esi(_get_user(user_pk))
 
 
 @shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
@@ -105,19 +125,22 @@ def process_notifications_for_owner(owner_pk, user_pk=None):
         logger.warning("ESI currently not available. Aborting.")
     else:
         owner = _get_owner(owner_pk)
-        owner.fetch_notifications_esi(_get_user(user_pk))
-        owner.send_new_notifications()
-        for webhook in owner.webhooks.filter(is_active=True):
-            if webhook.queue_size() > 0:
-                send_messages_for_webhook.apply_async(
-                    kwargs={"webhook_pk": webhook.pk}, priority=TASK_PRIO_HIGH
-                )
+        with eveuniverse_cache():
+            owner.fetch_notifications_esi(_get_user(user_pk))
+            owner.send_new_notifications()
+        if any(
+            webhook.queue_size() > 0
+            for webhook in owner.webhooks.filter(is_active=True)
+        ):
+            send_messages_for_webhooks.apply_async(priority=TASK_PRIO_HIGH)
 
 
 @shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
 def send_notifications(notification_pks: list) -> None:
     """Send notifications defined by list of pks (used for admin action)."""
-    notifications = Notification.objects.filter(pk__in=notification_pks)
+    notifications = Notification.objects.filter(
+        pk__in=notification_pks
+    ).select_related_for_sending()
     if notifications:
         logger.info(
             "Trying to send {} notifications to webhooks...".format(
@@ -125,20 +148,30 @@ def send_notifications(notification_pks: list) -> None:
             )
         )
         webhooks = set()
-        for notif in notifications:
-            for webhook in notif.owner.webhooks.filter(is_active=True):
-                webhooks.add(webhook)
-                if (
-                    str(notif.notif_type) in webhook.notification_types
-                    and not notif.filter_for_npc_attacks()
-                    and not notif.filter_for_alliance_level()
-                ):
-                    notif.send_to_webhook(webhook)
-
-        for webhook in webhooks:
-            send_messages_for_webhook.apply_async(
-                kwargs={"webhook_pk": webhook.pk}, priority=TASK_PRIO_HIGH
-            )
+        with eveuniverse_cache():
+            for notif in notifications:
+                for webhook in notif.owner.webhooks.filter(
+                    is_active=True
+                ).prefetch_related("ping_groups"):
+                    webhooks.add(webhook)
+                    if (
+                        str(notif.notif_type) in webhook.notification_types
+                        and not notif.filter_for_npc_attacks()
+                        and not notif.filter_for_alliance_level()
+                    ):
+                        notif.send_to_webhook(webhook)
+
+        if webhooks:
+            send_messages_for_webhooks.apply_async(priority=TASK_PRIO_HIGH)
+
+
+@shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
+def archive_notifications():
+    """Move notifications older than the retention period into the archive."""
+    cutoff = now() - timedelta(days=STRUCTURES_NOTIFICATION_RETENTION_DAYS)
+    archived_count = Notification.objects.archive_older_than(cutoff)
+    if archived_count:
+        logger.info("Archived %d notifications older than %s", archived_count, cutoff)
 
 
 @shared_task(base=QueueOnce)
@@ -147,6 +180,18 @@ def send_messages_for_webhook(webhook_pk: int) -> None:
     Webhook.objects.send_queued_messages_for_webhook(webhook_pk)
 
 
+@shared_task(
+    base=QueueOnce,
+    once={"graceful": True, "timeout": SEND_MESSAGES_TIMEOUT},
+    time_limit=SEND_MESSAGES_TIMEOUT,
+)
+def send_messages_for_webhooks() -> None:
+    """Send queued messages for all active webhooks concurrently."""
+    Webhook.objects.send_queued_messages_for_all(
+        timeout=SEND_MESSAGES_TIMEOUT - SEND_MESSAGES_TIMEOUT_MARGIN
+    )
+
+
 @shared_task(time_limit=STRUCTURES_TASKS_TIME_LIMIT)
 def send_test_notifications_to_webhook(webhook_pk, user_pk=None) -> None:
     """Send test notification to given webhook."""
@@ -1,11 +1,17 @@
+import os
 import re
 from datetime import datetime, timedelta
+from time import perf_counter
+from unittest import skipUnless
 from unittest.mock import Mock, patch
 
 import pytz
+import yaml
 from requests.exceptions import HTTPError
 
 from django.contrib.auth.models import Group
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
 from django.utils.timezone import now
 
 from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
@@ -114,6 +120,29 @@ class TestNotification(NoSocketsTestCase):
         self.assertEqual(parsed_text["structureName"], "Dummy")
         self.assertEqual(parsed_text["solarSystemID"], 30002537)
 
+    @patch(MODULE_PATH + ".yaml.load", wraps=yaml.load)
+    def test_get_parsed_text_should_parse_only_once(self, spy_yaml_load):
+        obj = Notification.objects.get(notification_id=1000000404)
+        obj.get_parsed_text()
+        parsed_text = obj.get_parsed_text()
+        self.assertEqual(parsed_text["structureName"], "Dummy")
+        self.assertEqual(spy_yaml_load.call_count, 1)
+
+    def test_get_parsed_text_should_parse_again_when_text_changed(self):
+        obj = Notification.objects.get(notification_id=1000000404)
+        obj.get_parsed_text()
+        obj.text = "structureName: Other"
+        parsed_text = obj.get_parsed_text()
+        self.assertEqual(parsed_text["structureName"], "Other")
+
+    def test_eve_entity_ids(self):
+        obj = Notification.objects.get(notification_id=1000000509)
+        self.assertSetEqual(obj.eve_entity_ids(), {3011, 1011})
+
+    def test_eve_entity_ids_should_handle_invalid_text(self):
+        obj = Notification(text="invalid: [")
+        self.assertSetEqual(obj.eve_entity_ids(), set())
+
     def test_is_npc_attacking(self):
         x1 = Notification.objects.get(notification_id=1000000509)
         self.assertFalse(x1.is_npc_attacking())
@@ -168,6 +197,62 @@ class TestNotification(NoSocketsTestCase):
         self.assertFalse(x1.filter_for_alliance_level())
 
 
+class TestNotificationForwardingQuery(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        create_structures()
+        _, cls.owner = set_owner_character(character_id=1001)
+        load_notification_entities(cls.owner)
+
+    @skipUnless(connection.vendor == "sqlite", "query plan is specific to SQLite")
+    def test_should_use_forwarding_index(self):
+        index_names = {
+            index.name
+            for index in Notification._meta.indexes
+            if index.fields == ["owner", "timestamp", "is_sent"]
+        }
+        plan = Notification.objects.new_for_forwarding(self.owner).explain()
+        self.assertIn(index_names.pop(), plan)
+
+    @skipUnless(
+        os.environ.get("STRUCTURES_RUN_BENCHMARKS"),
+        "benchmarks only run when STRUCTURES_RUN_BENCHMARKS is set",
+    )
+    def test_forwarding_query_should_stay_within_latency_budget(self):
+        # given
+        notifications_count = 1_000_000
+        budget_secs = 0.05
+        sender = Notification.objects.first().sender
+        start = now() - timedelta(days=730)
+        step = timedelta(days=730) / notifications_count
+        for offset in range(0, notifications_count, 10_000):
+            Notification.objects.bulk_create(
+                [
+                    Notification(
+                        notification_id=2_000_000_000 + num,
+                        owner=self.owner,
+                        sender=sender,
+                        timestamp=start + num * step,
+                        notif_type=NotificationType.STRUCTURE_UNDER_ATTACK,
+                        text="",
+                        is_sent=num < notifications_count - 50,
+                        last_updated=start,
+                    )
+                    for num in range(offset, offset + 10_000)
+                ]
+            )
+        # when
+        durations = list()
+        for _ in range(5):
+            started = perf_counter()
+            notifications = list(Notification.objects.new_for_forwarding(self.owner))
+            durations.append(perf_counter() - started)
+        # then
+        self.assertGreaterEqual(len(notifications), 1)
+        self.assertLess(min(durations), budget_secs)
+
+
 @patch(MODULE_PATH + ".Webhook.send_message", spec=True)
 class TestNotificationSendMessage(NoSocketsTestCase):
     @classmethod
@@ -191,6 +276,23 @@ class TestNotificationSendMessage(NoSocketsTestCase):
         self.assertIsNotNone(kwargs["content"])
         self.assertIsNotNone(kwargs["embeds"])
 
+    def test_should_send_with_priority_from_ping_type(self, mock_send_message):
+        # given
+        mock_send_message.return_value = True
+        cases = [
+            (1000000509, Webhook.PRIORITY_HIGH),  # StructureUnderAttack
+            (1000000503, Webhook.PRIORITY_NORMAL),  # StructureFuelAlert
+            (1000000506, Webhook.PRIORITY_LOW),  # StructureOnline
+        ]
+        for notification_id, expected in cases:
+            with self.subTest(notification_id=notification_id):
+                obj = Notification.objects.get(notification_id=notification_id)
+                # when
+                obj.send_to_webhook(self.webhook)
+                # then
+                _, kwargs = mock_send_message.call_args
+                self.assertEqual(kwargs["priority"], expected)
+
     def test_should_ignore_unsupported_notif_types(self, mock_send_message):
         # given
         mock_send_message.return_value = True
@@ -353,6 +455,11 @@ if "discord" in app_labels():
         def setUp(self):
             _, self.owner = set_owner_character(character_id=1001)
             load_notification_entities(self.owner)
+            cache_patcher = patch(
+                MODULE_PATH + ".cache", new=LocMemCache("structures-pings", {})
+            )
+            cache_patcher.start().clear()
+            self.addCleanup(cache_patcher.stop)
 
         @staticmethod
         def _my_group_to_role(group: Group) -> dict:
@@ -438,6 +545,50 @@ if "discord" in app_labels():
             args, kwargs = mock_send_message.call_args
             self.assertFalse(re.search(r"(<@&\d+>)", kwargs["content"]))
 
+        @patch(MODULE_PATH + ".Webhook.send_message", spec=True)
+        def test_should_cache_roles(self, mock_send_message, mock_import_discord):
+            # given
+            mock_send_message.return_value = True
+            mock_group_to_role = mock_import_discord.return_value.objects.group_to_role
+            mock_group_to_role.side_effect = self._my_group_to_role
+            webhook = Webhook.objects.create(
+                name="Test", url="http://www.example.com/dummy/"
+            )
+            webhook.ping_groups.add(self.group_1)
+            obj = Notification.objects.get(notification_id=1000000509)
+            obj.send_to_webhook(webhook)
+            # when
+            obj = Notification.objects.get(notification_id=1000000509)
+            obj.send_to_webhook(webhook)
+            # then
+            self.assertEqual(mock_group_to_role.call_count, 1)
+            _, kwargs = mock_send_message.call_args
+            self.assertIn(f"<@&{self.group_1.pk}>", kwargs["content"])
+
+        @patch(MODULE_PATH + ".Webhook.send_message", spec=True)
+        def test_should_update_mentions_when_ping_groups_change(
+            self, mock_send_message, mock_import_discord
+        ):
+            # given
+            mock_send_message.return_value = True
+            mock_import_discord.return_value.objects.group_to_role.side_effect = (
+                self._my_group_to_role
+            )
+            webhook = Webhook.objects.create(
+                name="Test", url="http://www.example.com/dummy/"
+            )
+            webhook.ping_groups.add(self.group_1)
+            obj = Notification.objects.get(notification_id=1000000509)
+            obj.send_to_webhook(webhook)
+            # when
+            webhook.ping_groups.add(self.group_2)
+            obj = Notification.objects.get(notification_id=1000000509)
+            obj.send_to_webhook(webhook)
+            # then
+            _, kwargs = mock_send_message.call_args
+            self.assertIn(f"<@&{self.group_1.pk}>", kwargs["content"])
+            self.assertIn(f"<@&{self.group_2.pk}>", kwargs["content"])
+
         @patch(MODULE_PATH + ".Webhook.send_message", spec=True)
         def test_can_handle_http_error(self, mock_send_message, mock_import_discord):
             args = {"status_code": 200, "status_ok": True, "content": None}
@@ -17,6 +17,7 @@ from app_utils.testing import (
     create_user_from_evecharacter,
 )
 
+from ...helpers.esi_fetch import esi_fetch_with_localization
 from ...models import (
     EveCategory,
     EveConstellation,
@@ -1123,6 +1124,63 @@ class TestUpdateStructuresEsi(NoSocketsTestCase):
         expected = {1000000000002, 1000000000003}
         self.assertSetEqual(owner.structures.ids(), expected)
 
+    @patch(MODULE_PATH + ".STRUCTURES_FEATURE_STARBASES", False)
+    @patch(MODULE_PATH + ".STRUCTURES_FEATURE_CUSTOMS_OFFICES", False)
+    def test_should_fetch_service_localizations_only_for_new_services(
+        self, mock_esi_client, mock_notify_admins_throttled
+    ):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        owner = create_owner(self.corporation, self.main_ownership)
+        owner.update_structures_esi()
+        # when
+        with patch(
+            MODULE_PATH + ".esi_fetch_with_localization",
+            wraps=esi_fetch_with_localization,
+        ) as spy_esi_fetch_with_localization:
+            owner.update_structures_esi()
+        # then
+        self.assertFalse(spy_esi_fetch_with_localization.called)
+        service = StructureService.objects.get(
+            structure_id=1000000000001, name="Clone Bay"
+        )
+        self.assertEqual(service.name_de, "Clone Bay_de")
+        self.assertEqual(service.name_ko, "Clone Bay_ko")
+        self.assertEqual(service.name_ru, "Clone Bay_ru")
+
+    @patch(MODULE_PATH + ".STRUCTURES_FEATURE_STARBASES", False)
+    @patch(MODULE_PATH + ".STRUCTURES_FEATURE_CUSTOMS_OFFICES", False)
+    def test_should_fetch_service_localizations_when_new_service_appears(
+        self, mock_esi_client, mock_notify_admins_throttled
+    ):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        owner = create_owner(self.corporation, self.main_ownership)
+        owner.update_structures_esi()
+        my_corp_structures_data = deepcopy(esi_corp_structures_data)
+        my_corp_structures_data["2001"][0]["services"].append(
+            {"name": "Invention", "state": "online"}
+        )
+        esi_get_corporations_corporation_id_structures.override_data = (
+            my_corp_structures_data
+        )
+        # when
+        with patch(
+            MODULE_PATH + ".esi_fetch_with_localization",
+            wraps=esi_fetch_with_localization,
+        ) as spy_esi_fetch_with_localization:
+            owner.update_structures_esi()
+        # then
+        self.assertEqual(spy_esi_fetch_with_localization.call_count, 1)
+        _, kwargs = spy_esi_fetch_with_localization.call_args
+        self.assertSetEqual(kwargs["languages"], {"de", "ko", "ru"})
+        service = StructureService.objects.get(
+            structure_id=1000000000002, name="Invention"
+        )
+        self.assertEqual(service.name_de, "Invention_de")
+        self.assertEqual(service.name_ko, "Invention_ko")
+        self.assertEqual(service.name_ru, "Invention_ru")
+
     @patch(MODULE_PATH + ".STRUCTURES_FEATURE_STARBASES", False)
     @patch(MODULE_PATH + ".STRUCTURES_FEATURE_CUSTOMS_OFFICES", False)
     def test_tags_are_not_modified_by_update(
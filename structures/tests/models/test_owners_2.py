@@ -1,8 +1,12 @@
+from datetime import timedelta
 from unittest.mock import patch
 
 from bravado.exception import HTTPBadGateway, HTTPInternalServerError
 
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
 from esi.models import Token
 
 from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
@@ -10,7 +14,16 @@ from allianceauth.tests.auth_utils import AuthUtils
 from app_utils.django import app_labels
 from app_utils.testing import BravadoResponseStub, NoSocketsTestCase, queryset_pks
 
-from ...models import EveMoon, Notification, Owner, OwnerAsset, Structure, Webhook
+from ...core.notification_embeds import NotificationBaseEmbed
+from ...models import (
+    EveMoon,
+    Notification,
+    Owner,
+    OwnerAsset,
+    RefineryMoon,
+    Structure,
+    Webhook,
+)
 from ...models.notifications import NotificationType
 from .. import to_json
 from ..testdata import (
@@ -34,6 +47,7 @@ else:
 
 MODULE_PATH = "structures.models.owners"
 MODELS_NOTIFICATIONS = "structures.models.notifications"
+EMBEDS_PATH = "structures.core.notification_embeds"
 
 
 class TestUpdateStructuresEsiWithLocalization(NoSocketsTestCase):
@@ -205,6 +219,12 @@ class TestFetchNotificationsEsi(NoSocketsTestCase):
             x["notification_id"] for x in entities_testdata["Notification"]
         }
         self.assertSetEqual(notif_ids_current, notif_ids_testdata)
+        # should have indexed moon of refinery and set it
+        self.assertEqual(
+            RefineryMoon.objects.get(structure_id=1000000000002).moon_id, 40161465
+        )
+        structure = Structure.objects.get(id=1000000000002)
+        self.assertEqual(structure.eve_moon_id, 40161465)
 
         if has_auth_timers:
             # should have added timers
@@ -320,6 +340,53 @@ class TestFetchNotificationsEsi(NoSocketsTestCase):
         structure = Structure.objects.get(id=1000000000002)
         self.assertEqual(structure.eve_moon, EveMoon.objects.get(id=40161465))
 
+    def test_should_only_store_new_notifications(
+        self, mock_esi_client, mock_notify_admins_throttled
+    ):
+        # given
+        load_notification_entities(self.owner)
+        Notification.objects.get(notification_id=1000000803).delete()
+        notifications = [
+            obj
+            for obj in entities_testdata["Notification"]
+            if obj["notification_id"] in {1000000404, 1000000803}
+        ]
+        # when
+        result = self.owner._store_notifications(notifications)
+        # then
+        self.assertEqual(result, 1)
+        self.assertEqual(
+            self.owner.notifications.filter(
+                notification_id__in=[1000000404, 1000000803]
+            ).count(),
+            2,
+        )
+        self.assertFalse(mock_esi_client.called)
+
+    def test_should_not_store_archived_notifications_again(
+        self, mock_esi_client, mock_notify_admins_throttled
+    ):
+        # given
+        load_notification_entities(self.owner)
+        Notification.objects.archive_older_than(now() + timedelta(days=1))
+        notifications = [
+            obj
+            for obj in entities_testdata["Notification"]
+            if obj["notification_id"] == 1000000803
+        ]
+        # when
+        result = self.owner._store_notifications(notifications)
+        # then
+        self.assertEqual(result, 0)
+        self.assertFalse(
+            self.owner.notifications.filter(notification_id=1000000803).exists()
+        )
+        self.assertTrue(
+            self.owner.archived_notifications.filter(
+                notification_id=1000000803
+            ).exists()
+        )
+
     @patch("structures.helpers.esi_fetch.ESI_RETRY_SLEEP_SECS", 0)
     @patch(MODULE_PATH + ".STRUCTURES_ADD_TIMERS", False)
     def test_report_error_when_esi_returns_error_during_sync(
@@ -468,7 +535,7 @@ class TestSendNewNotifications2(NoSocketsTestCase):
         cls.owner.webhooks.add(my_webhook)
 
     @staticmethod
-    def my_send_to_webhook_success(self, webhook):
+    def my_send_to_webhook_success(self, webhook, save_is_sent=True):
         """simulates successful sending of a notification"""
         self.is_sent = True
         self.save()
@@ -537,6 +604,37 @@ class TestSendNewNotifications2(NoSocketsTestCase):
         }
         self.assertDictEqual(notifications_per_webhook, expected)
 
+    @patch(MODELS_NOTIFICATIONS + ".Webhook.send_message", spec=True)
+    def test_should_render_notifications_once_per_language(self, mock_send_message):
+        # given
+        mock_send_message.return_value = True
+        notif_types = [NotificationType.STRUCTURE_DESTROYED]
+        webhooks = [
+            Webhook.objects.create(
+                name=f"Webhook {num}",
+                url=f"dummy-url-{num}",
+                notification_types=notif_types,
+                language_code=language_code,
+                is_active=True,
+            )
+            for num, language_code in enumerate(["en", "en", "de"])
+        ]
+        self.owner.webhooks.clear()
+        self.owner.webhooks.add(*webhooks)
+        notifications_count = Notification.objects.filter(
+            owner=self.owner, notif_type__in=notif_types
+        ).count()
+        # when
+        with patch(
+            EMBEDS_PATH + ".NotificationBaseEmbed.create",
+            wraps=NotificationBaseEmbed.create,
+        ) as spy_create:
+            self.owner.send_new_notifications()
+        # then
+        self.assertGreater(notifications_count, 0)
+        self.assertEqual(mock_send_message.call_count, notifications_count * 3)
+        self.assertEqual(spy_create.call_count, notifications_count * 2)
+
     # @patch(MODULE_PATH + ".Token", spec=True)
     # @patch("structures.helpers.esi_fetch._esi_client")
     # @patch(
@@ -714,3 +812,50 @@ class TestOwnerToken(NoSocketsTestCase):
         token = owner.characters.first().valid_token()
         # then
         self.assertIsNone(token)
+
+
+@patch(MODELS_NOTIFICATIONS + ".Webhook.send_message", spec=True)
+class TestSendNewNotificationsQueryCount(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        create_structures()
+        cls.user, cls.owner = set_owner_character(character_id=1001)
+        load_notification_entities(cls.owner)
+        cls.webhook = Webhook.objects.create(
+            name="Dummy",
+            url="dummy-url",
+            is_active=True,
+            notification_types=NotificationType.values,
+        )
+        cls.owner.webhooks.add(cls.webhook)
+        cls.template = Notification.objects.get(notification_id=1000000509)
+
+    def _create_notifications(self, count: int) -> None:
+        template = self.template
+        Notification.objects.filter(owner=self.owner).delete()
+        for num in range(count):
+            template.pk = None
+            template.notification_id = 1 + num
+            template.timestamp = now()
+            template.is_sent = False
+            template.save()
+
+    def _count_queries_for_sending(self, count: int) -> int:
+        self._create_notifications(count)
+        with CaptureQueriesContext(connection) as queries:
+            self.owner.send_new_notifications()
+        self.assertFalse(
+            Notification.objects.filter(owner=self.owner, is_sent=False).exists()
+        )
+        return len(queries)
+
+    def test_should_send_with_constant_number_of_queries(self, mock_send_message):
+        # given
+        mock_send_message.return_value = True
+        # when
+        queries_count_1 = self._count_queries_for_sending(1)
+        queries_count_n = self._count_queries_for_sending(5)
+        # then
+        self.assertTrue(mock_send_message.called)
+        self.assertEqual(queries_count_1, queries_count_n)
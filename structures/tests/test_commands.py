@@ -1,10 +1,21 @@
+import csv
+import json
+import os
+from copy import deepcopy
+from datetime import timedelta
 from io import StringIO
-from unittest.mock import patch
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest.mock import Mock, patch
 
-from django.core.management import call_command
+from bravado.exception import HTTPError
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.utils.timezone import now
 
 from app_utils.testing import NoSocketsTestCase
 
+from ..management.commands.structures_updatesde import CHECKPOINT_KEY
 from ..models import (
     EveCategory,
     EveConstellation,
@@ -24,6 +35,7 @@ from ..models import (
 )
 from .testdata import (
     create_structures,
+    entities_testdata,
     esi_mock_client,
     load_entities,
     load_notification_entities,
@@ -33,10 +45,16 @@ from .testdata import (
 PACKAGE_PATH = "structures.management.commands"
 
 
+@patch(
+    PACKAGE_PATH + ".structures_updatesde.cache",
+    new_callable=LocMemCache,
+    name="test",
+    params={},
+)
 class TestUpdateSde(NoSocketsTestCase):
     @patch(PACKAGE_PATH + ".structures_updatesde.get_input")
     @patch("structures.helpers.esi_fetch._esi_client")
-    def test_can_update_all_models(self, mock_esi_client, mock_get_input):
+    def test_can_update_all_models(self, mock_esi_client, mock_get_input, mock_cache):
         mock_esi_client.side_effect = esi_mock_client
         mock_get_input.return_value = "Y"
         load_entities()
@@ -99,6 +117,230 @@ class TestUpdateSde(NoSocketsTestCase):
 
         eve_solar_system.refresh_from_db()
         self.assertEqual(eve_solar_system.name, "1-PGSG")
+        self.assertIsNone(mock_cache.get(CHECKPOINT_KEY))
+
+    @patch(PACKAGE_PATH + ".structures_updatesde.get_input")
+    @patch("structures.helpers.esi_fetch._esi_client")
+    def test_should_resume_unfinished_update(
+        self, mock_esi_client, mock_get_input, mock_cache
+    ):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        mock_get_input.return_value = "Y"
+        load_entities()
+        started_at = now() - timedelta(hours=1)
+        mock_cache.set(CHECKPOINT_KEY, started_at)
+        EveCategory.objects.filter(id=65).update(
+            name="Superheros", last_updated=now() - timedelta(minutes=30)
+        )
+        EveGroup.objects.filter(id=1657).update(
+            name="Fantastic Four", last_updated=now() - timedelta(hours=2)
+        )
+        # when
+        out = StringIO()
+        call_command("structures_updatesde", stdout=out)
+        # then
+        self.assertEqual(EveCategory.objects.get(id=65).name, "Superheros")
+        self.assertEqual(EveGroup.objects.get(id=1657).name, "Citadel")
+        self.assertIn("Resuming", out.getvalue())
+        self.assertIn("objects/s", out.getvalue())
+        self.assertIsNone(mock_cache.get(CHECKPOINT_KEY))
+
+    @patch(PACKAGE_PATH + ".structures_updatesde.get_input")
+    @patch("structures.helpers.esi_fetch._esi_client")
+    def test_should_update_all_objects_when_restarting(
+        self, mock_esi_client, mock_get_input, mock_cache
+    ):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        mock_get_input.return_value = "Y"
+        load_entities()
+        mock_cache.set(CHECKPOINT_KEY, now() - timedelta(hours=1))
+        EveCategory.objects.filter(id=65).update(name="Superheros", last_updated=now())
+        # when
+        call_command("structures_updatesde", "--restart", stdout=StringIO())
+        # then
+        self.assertEqual(EveCategory.objects.get(id=65).name, "Structure")
+
+    @patch(PACKAGE_PATH + ".structures_updatesde.get_input")
+    @patch("structures.helpers.esi_fetch._esi_client")
+    def test_should_keep_checkpoint_when_update_is_incomplete(
+        self, mock_esi_client, mock_get_input, mock_cache
+    ):
+        # given
+        esi_client = esi_mock_client()
+        esi_client.Universe.get_universe_categories_category_id.side_effect = HTTPError(
+            response=Mock(), message="Test"
+        )
+        mock_esi_client.return_value = esi_client
+        mock_get_input.return_value = "Y"
+        load_entities()
+        # when
+        out = StringIO()
+        call_command("structures_updatesde", stdout=out)
+        # then
+        self.assertIsNotNone(mock_cache.get(CHECKPOINT_KEY))
+        self.assertIn("Run this command again", out.getvalue())
+
+
+class TestLoadSde(NoSocketsTestCase):
+    SDE_MODELS = [
+        EveCategory,
+        EveGroup,
+        EveType,
+        EveRegion,
+        EveConstellation,
+        EveSolarSystem,
+        EvePlanet,
+        EveMoon,
+    ]
+
+    def setUp(self) -> None:
+        for EveModel in reversed(self.SDE_MODELS):
+            EveModel.objects.all().delete()
+
+    @staticmethod
+    def _sde_data() -> dict:
+        return {
+            EveModel.__name__: deepcopy(entities_testdata[EveModel.__name__])
+            for EveModel in TestLoadSde.SDE_MODELS
+        }
+
+    @staticmethod
+    def _write_jsonl_files(dirname: str, data: dict) -> None:
+        for model_name, rows in data.items():
+            with open(os.path.join(dirname, f"{model_name}.jsonl"), "w") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+
+    def _assert_sde_loaded(self):
+        for EveModel in self.SDE_MODELS:
+            self.assertEqual(
+                EveModel.objects.count(),
+                len(entities_testdata[EveModel.__name__]),
+                EveModel.__name__,
+            )
+        solar_system = EveSolarSystem.objects.get(id=30000474)
+        self.assertEqual(solar_system.name, "1-PGSG")
+        self.assertEqual(solar_system.security_status, -0.496552765369415)
+        self.assertEqual(solar_system.eve_constellation_id, 20000069)
+        amamake = EveSolarSystem.objects.get(id=30002537)
+        self.assertEqual(
+            EvePlanet.objects.get(id=40161463).name_de,
+            amamake.name_localized_for_language("de") + " I",
+        )
+
+    def test_can_load_from_directory(self):
+        # given
+        data = self._sde_data()
+        with TemporaryDirectory() as dirname:
+            for model_name in ["EveCategory", "EveGroup", "EveType", "EveRegion"]:
+                rows = data[model_name]
+                with open(
+                    os.path.join(dirname, f"{model_name}.csv"), "w", newline=""
+                ) as f:
+                    writer = csv.DictWriter(
+                        f, fieldnames=sorted({key for row in rows for key in row})
+                    )
+                    writer.writeheader()
+                    writer.writerows(rows)
+            for model_name in [
+                "EveConstellation",
+                "EveSolarSystem",
+                "EvePlanet",
+                "EveMoon",
+            ]:
+                with open(os.path.join(dirname, f"{model_name}.jsonl"), "w") as f:
+                    for row in data[model_name]:
+                        f.write(json.dumps(row) + "\n")
+            # when
+            out = StringIO()
+            call_command("structures_loadsde", dirname, "--batch-size", "2", stdout=out)
+        # then
+        self._assert_sde_loaded()
+        self.assertIn("Load completed", out.getvalue())
+
+    def test_should_report_only_inserted_objects(self):
+        # given
+        EveCategory.objects.create(id=65, name="Superheros")
+        with TemporaryDirectory() as dirname:
+            self._write_jsonl_files(dirname, self._sde_data())
+            # when
+            out = StringIO()
+            call_command("structures_loadsde", dirname, stdout=out)
+        # then
+        count = len(entities_testdata["EveCategory"])
+        self.assertIn(
+            f"EveCategory: Processed {count} rows, inserted {count - 1} new objects",
+            out.getvalue(),
+        )
+
+    def test_should_not_change_existing_objects(self):
+        # given
+        EveCategory.objects.create(id=65, name="Superheros")
+        with TemporaryDirectory() as dirname:
+            self._write_jsonl_files(dirname, self._sde_data())
+            # when
+            call_command("structures_loadsde", dirname, stdout=StringIO())
+        # then
+        self.assertEqual(EveCategory.objects.get(id=65).name, "Superheros")
+
+    def test_should_raise_error_for_invalid_value(self):
+        # given
+        data = self._sde_data()
+        data["EveSolarSystem"][1]["security_status"] = ""
+        with TemporaryDirectory() as dirname:
+            self._write_jsonl_files(dirname, data)
+            # when/then
+            with self.assertRaisesRegex(CommandError, "security_status in row 2"):
+                call_command("structures_loadsde", dirname, stdout=StringIO())
+
+    def test_should_raise_error_for_unknown_parent(self):
+        # given
+        data = self._sde_data()
+        data["EveSolarSystem"][1]["eve_constellation_id"] = 20999999
+        with TemporaryDirectory() as dirname:
+            self._write_jsonl_files(dirname, data)
+            # when/then
+            with self.assertRaisesRegex(
+                CommandError,
+                "EveSolarSystem: Unknown EveConstellation 20999999 "
+                "for eve_constellation in row 2",
+            ):
+                call_command("structures_loadsde", dirname, stdout=StringIO())
+
+    def test_should_raise_error_for_unknown_solar_system_of_localized_model(self):
+        # given
+        data = self._sde_data()
+        data["EvePlanet"][1]["eve_solar_system_id"] = 30999999
+        with TemporaryDirectory() as dirname:
+            self._write_jsonl_files(dirname, data)
+            # when/then
+            with self.assertRaisesRegex(
+                CommandError,
+                "EvePlanet: Unknown EveSolarSystem 30999999 "
+                "for eve_solar_system in row 2",
+            ):
+                call_command("structures_loadsde", dirname, stdout=StringIO())
+        self.assertFalse(EvePlanet.objects.exists())
+
+    def test_should_raise_error_for_invalid_json(self):
+        # given
+        with TemporaryDirectory() as dirname:
+            with open(os.path.join(dirname, "EveCategory.jsonl"), "w") as f:
+                f.write('{"id": 65, "name": "Structure"}\n{"id": 66,\n')
+            # when/then
+            with self.assertRaisesRegex(CommandError, "line 2"):
+                call_command("structures_loadsde", dirname, stdout=StringIO())
+
+    def test_should_raise_error_when_path_is_not_a_directory(self):
+        with NamedTemporaryFile("w", suffix=".json") as f:
+            with self.assertRaises(CommandError):
+                call_command("structures_loadsde", f.name, stdout=StringIO())
+
+    def test_should_raise_error_when_path_does_not_exist(self):
+        with self.assertRaises(CommandError):
+            call_command("structures_loadsde", "/does/not/exist", stdout=StringIO())
 
 
 class TestPurgeAll(NoSocketsTestCase):
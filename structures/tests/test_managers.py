@@ -1,14 +1,23 @@
 from datetime import datetime, timedelta
+from threading import Lock
+from time import sleep
 from unittest.mock import Mock, patch
 
-from bravado.exception import HTTPError
+from bravado.exception import HTTPError, HTTPNotFound
 
+from django.contrib.auth.models import Group
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 
 from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
 from app_utils.testing import NoSocketsTestCase, queryset_pks
 
+from ..helpers import esi_fetch as esi_fetch_module
+from ..helpers.eveuniverse_cache import eveuniverse_cache
+from ..managers import SovereigntyChange, SovereigntyOwner
 from ..models import (
+    ArchivedNotification,
     EveCategory,
     EveConstellation,
     EveEntity,
@@ -19,14 +28,24 @@ from ..models import (
     EveSolarSystem,
     EveSovereigntyMap,
     EveType,
+    Notification,
     Owner,
     OwnerAsset,
+    RefineryMoon,
     Structure,
     StructureService,
     StructureTag,
 )
 from . import to_json
-from .testdata import create_structures, esi_mock_client, load_entities, load_entity
+from .testdata import (
+    EsiOperation,
+    create_structures,
+    esi_mock_client,
+    load_entities,
+    load_entity,
+    load_notification_entities,
+    set_owner_character,
+)
 from .testdata.load_eveuniverse import load_eveuniverse
 
 MODULE_PATH = "structures.managers"
@@ -242,6 +261,34 @@ class TestEveTypeManager(NoSocketsTestCase):
         self.assertEqual(obj_parent.id, 1657)
         self.assertEqual(obj_parent.name, "Citadel")
 
+    def test_should_return_cached_object_within_cache_scope(self):
+        # given
+        load_entity(EveType)
+        with eveuniverse_cache() as cache:
+            obj_1, _ = EveType.objects.get_or_create_esi(35832)
+            # when
+            with self.assertNumQueries(0):
+                obj_2, created = EveType.objects.get_or_create_esi(35832)
+        # then
+        self.assertFalse(created)
+        self.assertIs(obj_2, obj_1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_should_invalidate_cached_object_when_updated_from_esi(
+        self, mock_esi_client
+    ):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        load_entity(EveType)
+        with eveuniverse_cache() as cache:
+            EveType.objects.get_or_create_esi(35832)
+            # when
+            EveType.objects.update_or_create_esi(35832)
+            # then
+            self.assertIsNone(cache.get(EveType, 35832))
+
 
 class TestEveRegionManager(NoSocketsTestCase):
     def test_can_get_stored_object(self):
@@ -382,6 +429,85 @@ class TestEveSolarSystemManager(NoSocketsTestCase):
         obj_child.refresh_from_db()
         self.assertEqual(obj_child.name, "1-PGSG I")
 
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_can_get_many_stored_objects(self, mock_esi_client):
+        mock_esi_client.side_effect = esi_mock_client
+        load_entity(EveSolarSystem)
+
+        with self.assertNumQueries(1):
+            objs = EveSolarSystem.objects.get_or_create_many_esi([30000474, 30000476])
+
+        self.assertSetEqual(set(objs.keys()), {30000474, 30000476})
+        self.assertEqual(objs[30000474].name, "1-PGSG")
+        self.assertFalse(mock_esi_client.called)
+
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_can_create_many_objects_from_esi_including_related(self, mock_esi_client):
+        mock_esi_client.side_effect = esi_mock_client
+        EveConstellation.objects.get(id=20000069).delete()
+
+        objs = EveSolarSystem.objects.get_or_create_many_esi([30000474])
+
+        structure = EveSolarSystem.objects.get(id=30000474)
+        self.assertEqual(objs[30000474], structure)
+        self.assertEqual(structure.name, "1-PGSG")
+        self.assertEqual(structure.security_status, -0.496552765369415)
+        self.assertEqual(structure.eve_constellation.name, "1RG-GU")
+        self.assertEqual(structure.eve_constellation.eve_region_id, 10000005)
+        self.assertSetEqual(
+            {x.id for x in EvePlanet.objects.filter(eve_solar_system=structure)},
+            {40029526, 40029528, 40029529},
+        )
+        self.assertTrue(EvePlanet.objects.get(id=40029526).name_de)
+
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_get_or_create_many_esi_should_use_cache_within_cache_scope(
+        self, mock_esi_client
+    ):
+        mock_esi_client.side_effect = esi_mock_client
+        load_entity(EveSolarSystem)
+
+        with eveuniverse_cache():
+            EveSolarSystem.objects.get_or_create_esi(30000474)
+            with self.assertNumQueries(0):
+                objs = EveSolarSystem.objects.get_or_create_many_esi([30000474])
+
+        self.assertEqual(objs[30000474].name, "1-PGSG")
+
+
+class TestEveUniverseManagerConcurrency(NoSocketsTestCase):
+    @patch(MODULE_PATH_ESI_FETCH + ".STRUCTURES_ESI_MAX_WORKERS", 5)
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_should_not_exceed_max_workers_for_requests(self, mock_esi_client):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        load_entities([EveCategory, EveGroup])
+        lock = Lock()
+        in_flight = {"current": 0, "peak": 0}
+        original = esi_fetch_module._fetch_with_retries
+
+        def fetch_with_retries(*args, **kwargs):
+            with lock:
+                in_flight["current"] += 1
+                in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+            try:
+                sleep(0.02)
+                return original(*args, **kwargs)
+            finally:
+                with lock:
+                    in_flight["current"] -= 1
+
+        # when
+        with patch(
+            MODULE_PATH_ESI_FETCH + "._fetch_with_retries", wraps=fetch_with_retries
+        ):
+            objs = EveType.objects.update_or_create_many_esi(
+                [35832, 35835], max_workers=2
+            )
+        # then
+        self.assertSetEqual(set(objs.keys()), {35832, 35835})
+        self.assertLessEqual(in_flight["peak"], 2)
+
 
 class TestEveMoonManager(NoSocketsTestCase):
     @classmethod
@@ -514,6 +640,60 @@ class TestEveSovereigntyMapManagerUpdateFromEsi(NoSocketsTestCase):
         self.assertEqual(structure.corporation_id, 2001)
         self.assertEqual(structure.alliance_id, 3001)
 
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_should_return_changes_and_only_write_changed_rows(self, mock_esi_client):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        EveSovereigntyMap.objects.create(
+            solar_system_id=30000726, alliance_id=3001, corporation_id=2001
+        )
+        EveSovereigntyMap.objects.create(
+            solar_system_id=30000474, alliance_id=3001, corporation_id=2001
+        )
+        EveSovereigntyMap.objects.create(
+            solar_system_id=30000142, alliance_id=3011, corporation_id=2011
+        )
+        last_updated = now() - timedelta(hours=1)
+        EveSovereigntyMap.objects.update(last_updated=last_updated)
+        # when
+        changes = EveSovereigntyMap.objects.update_from_esi()
+        # then
+        self.assertSetEqual(
+            set(changes),
+            {
+                SovereigntyChange(
+                    30000726,
+                    SovereigntyOwner(3001, 2001, None),
+                    SovereigntyOwner(3011, 2011, None),
+                ),
+                SovereigntyChange(30000728, None, SovereigntyOwner(3001, 2001, None)),
+                SovereigntyChange(30000142, SovereigntyOwner(3011, 2011, None), None),
+            },
+        )
+        self.assertSetEqual(
+            set(EveSovereigntyMap.objects.values_list("solar_system_id", flat=True)),
+            {30000726, 30000474, 30000728},
+        )
+        self.assertEqual(
+            EveSovereigntyMap.objects.get(solar_system_id=30000474).last_updated,
+            last_updated,
+        )
+        self.assertEqual(
+            EveSovereigntyMap.objects.get(solar_system_id=30000726).alliance_id, 3011
+        )
+
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_should_not_write_anything_when_nothing_changed(self, mock_esi_client):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        EveSovereigntyMap.objects.update_from_esi()
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            changes = EveSovereigntyMap.objects.update_from_esi()
+        # then
+        self.assertListEqual(changes, [])
+        self.assertEqual(len(queries), 1)
+
 
 class TestEveEntityManager(NoSocketsTestCase):
     def test_can_get_stored_object(self):
@@ -568,6 +748,90 @@ class TestEveEntityManager(NoSocketsTestCase):
         with self.assertRaises(RuntimeError):
             EveEntity.objects.update_or_create_esi(3011)
 
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_get_or_create_many_esi_should_return_stored_objects(self, mock_esi_client):
+        # given
+        load_entity(EveEntity)
+        # when
+        result = EveEntity.objects.get_or_create_many_esi([3011, 2011])
+        # then
+        self.assertSetEqual(set(result.keys()), {3011, 2011})
+        self.assertFalse(mock_esi_client.called)
+
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_get_or_create_many_esi_should_create_missing_objects(
+        self, mock_esi_client
+    ):
+        # given
+        mock_esi_client.side_effect = esi_mock_client
+        # when
+        result = EveEntity.objects.get_or_create_many_esi([3011])
+        # then
+        self.assertEqual(result[3011].name, "Big Bad Alliance")
+        self.assertTrue(EveEntity.objects.filter(id=3011).exists())
+
+    @patch(MODULE_PATH + ".ESI_POST_UNIVERSE_NAMES_MAX_IDS", 2)
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_get_or_create_many_esi_should_fetch_missing_objects_in_chunks(
+        self, mock_esi_client
+    ):
+        # given
+        mock_esi_client.return_value.Universe.post_universe_names.return_value.result.side_effect = [
+            [
+                {"id": 1001, "category": "character", "name": "Bruce Wayne"},
+                {"id": 1002, "category": "character", "name": "Peter Parker"},
+            ],
+            [{"id": 2001, "category": "corporation", "name": "Wayne Technologies"}],
+        ]
+        # when
+        result = EveEntity.objects.get_or_create_many_esi([1001, 1002, 2001])
+        # then
+        self.assertSetEqual(set(result.keys()), {1001, 1002, 2001})
+        self.assertEqual(
+            mock_esi_client.return_value.Universe.post_universe_names.call_count, 2
+        )
+        self.assertEqual(
+            EveEntity.objects.get(id=2001).category, EveEntity.Category.CORPORATION
+        )
+
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_get_or_create_many_esi_should_skip_invalid_ids(self, mock_esi_client):
+        # given
+        entities = {
+            1001: {"id": 1001, "category": "character", "name": "Bruce Wayne"},
+            1002: {"id": 1002, "category": "character", "name": "Peter Parker"},
+            2001: {"id": 2001, "category": "corporation", "name": "Wayne Tech"},
+        }
+
+        def post_universe_names(ids, **kwargs):
+            if any(id not in entities for id in ids):
+                raise HTTPNotFound(Mock(status_code=404), message="Invalid ID")
+            return EsiOperation(data=[entities[id] for id in ids])
+
+        mock_esi_client.return_value.Universe.post_universe_names.side_effect = (
+            post_universe_names
+        )
+        # when
+        result = EveEntity.objects.get_or_create_many_esi([1001, 1002, 2001, 9999])
+        # then
+        self.assertSetEqual(set(result.keys()), {1001, 1002, 2001})
+        self.assertSetEqual(
+            set(EveEntity.objects.values_list("id", flat=True)), {1001, 1002, 2001}
+        )
+
+    @patch(MODULE_PATH_ESI_FETCH + "._esi_client")
+    def test_get_or_create_many_esi_should_raise_other_errors(self, mock_esi_client):
+        # given
+        mock_esi_client.return_value.Universe.post_universe_names.return_value.result.side_effect = (
+            RuntimeError()
+        )
+        # when/then
+        with self.assertRaises(RuntimeError):
+            EveEntity.objects.get_or_create_many_esi([1001, 1002])
+        self.assertEqual(
+            mock_esi_client.return_value.Universe.post_universe_names.call_count, 1
+        )
+
 
 class TestStructureManager(NoSocketsTestCase):
     @classmethod
@@ -919,6 +1183,293 @@ class TestStructureManagerCreateFromDict(NoSocketsTestCase):
         self.assertIsNone(structure.last_online_at)
 
 
+class TestStructureManagerCreateFromDicts(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_eveuniverse()
+        load_entities(
+            [
+                EveCategory,
+                EveGroup,
+                EveType,
+                EveRegion,
+                EveConstellation,
+                EveSolarSystem,
+                EveCharacter,
+                EveSovereigntyMap,
+            ]
+        )
+        cls.owner = Owner.objects.create(
+            corporation=EveCorporationInfo.objects.get(corporation_id=2001)
+        )
+        StructureTag.objects.create(name="default_tag", is_default=True)
+
+    @staticmethod
+    def _structure_dict(structure_id: int, service_state: str = "online") -> dict:
+        # alternate between a null sec system with sov and a low sec system
+        return {
+            "name": f"Test Structure {structure_id}",
+            "position": {"x": 1.0, "y": 2.0, "z": 3.0},
+            "reinforce_hour": 18,
+            "services": [
+                {"name": "Clone Bay", "name_de": "Klonbucht", "state": service_state},
+                {"name": "Market Hub", "state": "offline"},
+            ],
+            "state": "shield_vulnerable",
+            "structure_id": structure_id,
+            "system_id": 30000474 if structure_id % 2 else 30002537,
+            "type_id": 35832,
+        }
+
+    @staticmethod
+    def _stored_structures() -> dict:
+        return {
+            obj.id: {
+                "owner": obj.owner_id,
+                "name": obj.name,
+                "eve_type": obj.eve_type_id,
+                "eve_solar_system": obj.eve_solar_system_id,
+                "position": (obj.position_x, obj.position_y, obj.position_z),
+                "reinforce_hour": obj.reinforce_hour,
+                "state": obj.state,
+                "is_online": obj.last_online_at is not None,
+                "services": {(x.name, x.name_de, x.state) for x in obj.services.all()},
+                "tags": {x.name for x in obj.tags.all()},
+            }
+            for obj in Structure.objects.all()
+        }
+
+    def test_should_store_same_as_per_row_path(self):
+        # given
+        structures = [
+            self._structure_dict(1000000000001),
+            self._structure_dict(1000000000002, service_state="offline"),
+        ]
+        for structure in structures:
+            Structure.objects.update_or_create_from_dict(structure, self.owner)
+        expected = self._stored_structures()
+        Structure.objects.all().delete()
+        # when
+        objs = Structure.objects.update_or_create_from_dicts(structures, self.owner)
+        # then
+        self.assertListEqual([x.id for x in objs], [1000000000001, 1000000000002])
+        self.assertDictEqual(self._stored_structures(), expected)
+        self.assertSetEqual(
+            expected[1000000000001]["tags"], {"default_tag", "nullsec", "sov"}
+        )
+        self.assertSetEqual(expected[1000000000002]["tags"], {"default_tag", "lowsec"})
+
+    def test_should_update_existing_structures(self):
+        # given
+        create_structure = self._structure_dict(1000000000001)
+        Structure.objects.update_or_create_from_dict(create_structure, self.owner)
+        Structure.objects.filter(id=1000000000001).update(
+            last_updated_at=now() - timedelta(hours=2)
+        )
+        update_structure = self._structure_dict(1000000000001)
+        update_structure["name"] = "Test Structure Updated"
+        update_structure["services"] = [{"name": "Market Hub", "state": "online"}]
+        # when
+        Structure.objects.update_or_create_from_dicts([update_structure], self.owner)
+        # then
+        obj = Structure.objects.get(id=1000000000001)
+        self.assertEqual(obj.name, "Test Structure Updated")
+        self.assertAlmostEqual(
+            (now() - obj.last_updated_at).total_seconds(), 0, delta=2
+        )
+        self.assertListEqual(
+            list(obj.services.values_list("name", "state")),
+            [("Market Hub", StructureService.State.ONLINE)],
+        )
+
+    def test_should_keep_last_online_when_services_are_offline(self):
+        # given
+        Structure.objects.update_or_create_from_dict(
+            self._structure_dict(1000000000001), self.owner
+        )
+        last_online_at = Structure.objects.get(id=1000000000001).last_online_at
+        # when
+        Structure.objects.update_or_create_from_dicts(
+            [self._structure_dict(1000000000001, service_state="offline")], self.owner
+        )
+        # then
+        obj = Structure.objects.get(id=1000000000001)
+        self.assertEqual(obj.last_online_at, last_online_at)
+
+    def test_should_use_fixed_number_of_queries(self):
+        # given
+        Structure.objects.update_or_create_from_dicts(
+            [self._structure_dict(1000000000001), self._structure_dict(1000000000002)],
+            self.owner,
+        )
+        # when
+        with CaptureQueriesContext(connection) as few_structures:
+            Structure.objects.update_or_create_from_dicts(
+                [self._structure_dict(1000000000000 + x) for x in range(1, 5)],
+                self.owner,
+            )
+        with CaptureQueriesContext(connection) as many_structures:
+            Structure.objects.update_or_create_from_dicts(
+                [self._structure_dict(1000000000000 + x) for x in range(1, 41)],
+                self.owner,
+            )
+        with CaptureQueriesContext(connection) as per_row:
+            for x in range(1, 41):
+                Structure.objects.update_or_create_from_dict(
+                    self._structure_dict(1000000000000 + x), self.owner
+                )
+        # then
+        self.assertEqual(Structure.objects.count(), 40)
+        self.assertEqual(len(many_structures), len(few_structures))
+        self.assertLess(len(many_structures) * 10, len(per_row))
+
+
+class TestStructureManagerUpdateSovTags(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_eveuniverse()
+        create_structures()
+
+    def setUp(self):
+        self.structure = Structure.objects.get(id=1000000000001)
+        self.sov_tag, _ = StructureTag.objects.get_or_create_for_sov()
+        self.structure.eve_solar_system = EveSolarSystem.objects.get(id=30000474)
+        self.structure.save()
+
+    def test_should_add_sov_tag_when_owner_has_sov(self):
+        # given
+        self.structure.tags.remove(self.sov_tag)
+        # when
+        Structure.objects.update_sov_tags([30000474])
+        # then
+        self.assertIn(self.sov_tag, self.structure.tags.all())
+
+    def test_should_remove_sov_tag_when_owner_lost_sov(self):
+        # given
+        self.assertIn(self.sov_tag, self.structure.tags.all())
+        EveSovereigntyMap.objects.filter(solar_system_id=30000474).update(
+            alliance_id=3011
+        )
+        # when
+        Structure.objects.update_sov_tags([30000474])
+        # then
+        self.assertNotIn(self.sov_tag, self.structure.tags.all())
+
+    def test_should_ignore_structures_in_other_systems(self):
+        # given
+        EveSovereigntyMap.objects.filter(solar_system_id=30000474).update(
+            alliance_id=3011
+        )
+        # when
+        Structure.objects.update_sov_tags([30002537])
+        # then
+        self.assertIn(self.sov_tag, self.structure.tags.all())
+
+
+class TestStructureServiceManagerUpdateForStructures(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_eveuniverse()
+        create_structures()
+        cls.structure = Structure.objects.get(id=1000000000001)
+
+    def setUp(self):
+        self.structure.services.all().delete()
+        StructureService.objects.create(
+            structure=self.structure,
+            name="Clone Bay",
+            name_de="Klonbucht",
+            state=StructureService.State.ONLINE,
+        )
+        StructureService.objects.create(
+            structure=self.structure,
+            name="Market Hub",
+            state=StructureService.State.OFFLINE,
+        )
+
+    def _services(self, *services) -> list:
+        return [
+            StructureService(structure=self.structure, **service)
+            for service in services
+        ]
+
+    def test_should_not_write_when_nothing_changed(self):
+        # given
+        services = self._services(
+            {
+                "name": "Clone Bay",
+                "name_de": "Klonbucht",
+                "state": StructureService.State.ONLINE,
+            },
+            {"name": "Market Hub", "state": StructureService.State.OFFLINE},
+        )
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            StructureService.objects.update_for_structures(
+                [self.structure.id], services
+            )
+        # then
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]["sql"].startswith("SELECT"))
+
+    def test_should_write_only_changed_services(self):
+        # given
+        clone_bay_pk = self.structure.services.get(name="Clone Bay").pk
+        services = self._services(
+            {
+                "name": "Clone Bay",
+                "name_de": "Klonbucht",
+                "state": StructureService.State.OFFLINE,
+            },
+            {"name": "Reprocessing", "state": StructureService.State.ONLINE},
+        )
+        # when
+        StructureService.objects.update_for_structures([self.structure.id], services)
+        # then
+        self.assertSetEqual(
+            set(self.structure.services.values_list("name", "name_de", "state")),
+            {
+                ("Clone Bay", "Klonbucht", StructureService.State.OFFLINE),
+                ("Reprocessing", "", StructureService.State.ONLINE),
+            },
+        )
+        self.assertEqual(self.structure.services.get(name="Clone Bay").pk, clone_bay_pk)
+
+    def test_should_update_all_localized_names(self):
+        # given
+        services = self._services(
+            {
+                "name": "Clone Bay",
+                "name_de": "Klonbucht",
+                "name_ru": "Клон-отсек",
+                "name_zh": "克隆舱",
+                "state": StructureService.State.ONLINE,
+            },
+            {"name": "Market Hub", "state": StructureService.State.OFFLINE},
+        )
+        # when
+        StructureService.objects.update_for_structures([self.structure.id], services)
+        # then
+        obj = self.structure.services.get(name="Clone Bay")
+        self.assertEqual(obj.name_ru, "Клон-отсек")
+        self.assertEqual(obj.name_zh, "克隆舱")
+
+    def test_should_know_all_localized_name_fields(self):
+        self.assertListEqual(
+            StructureService.localized_name_fields(),
+            ["name_de", "name_ko", "name_ru", "name_zh"],
+        )
+
+    def test_should_remove_all_services_when_none_given(self):
+        # when
+        StructureService.objects.update_for_structures([self.structure.id], [])
+        # then
+        self.assertFalse(self.structure.services.exists())
+
+
 class TestStructureTagManager(NoSocketsTestCase):
     @classmethod
     def setUpClass(cls):
@@ -1069,6 +1620,161 @@ class TestStructureTagManager(NoSocketsTestCase):
     """
 
 
+class TestRefineryMoonManager(NoSocketsTestCase):
+    @staticmethod
+    def _notification(notif_type, timestamp, structure_id=1000000000002):
+        return Notification(
+            notif_type=notif_type,
+            timestamp=timestamp,
+            text=f"moonID: 40161465\nstructureID: {structure_id}\n",
+        )
+
+    def test_should_create_entries_from_moon_notifications(self):
+        # given
+        notifications = [
+            self._notification("MoonminingExtractionStarted", now()),
+            self._notification("StructureUnderAttack", now(), 1000000000001),
+        ]
+        # when
+        result = RefineryMoon.objects.update_from_notifications(notifications)
+        # then
+        self.assertEqual(result, 1)
+        self.assertSetEqual(
+            set(RefineryMoon.objects.values_list("structure_id", "moon_id")),
+            {(1000000000002, 40161465)},
+        )
+
+    def test_should_update_entry_from_newer_notification(self):
+        # given
+        RefineryMoon.objects.create(
+            structure_id=1000000000002,
+            moon_id=40161466,
+            timestamp=now() - timedelta(days=1),
+        )
+        notifications = [self._notification("MoonminingLaserFired", now())]
+        # when
+        result = RefineryMoon.objects.update_from_notifications(notifications)
+        # then
+        self.assertEqual(result, 1)
+        self.assertEqual(RefineryMoon.objects.get(pk=1000000000002).moon_id, 40161465)
+
+    def test_should_ignore_older_notification(self):
+        # given
+        RefineryMoon.objects.create(
+            structure_id=1000000000002, moon_id=40161466, timestamp=now()
+        )
+        notifications = [
+            self._notification("MoonminingLaserFired", now() - timedelta(days=1))
+        ]
+        # when
+        result = RefineryMoon.objects.update_from_notifications(notifications)
+        # then
+        self.assertEqual(result, 0)
+        self.assertEqual(RefineryMoon.objects.get(pk=1000000000002).moon_id, 40161466)
+
+
+class TestNotificationManagerArchiveOlderThan(NoSocketsTestCase):
+    def setUp(self) -> None:
+        create_structures()
+        _, self.owner = set_owner_character(character_id=1001)
+        load_notification_entities(self.owner)
+        self.old_ids = {1000000403, 1000000404, 1000000405}
+        Notification.objects.filter(notification_id__in=self.old_ids).update(
+            timestamp=now() - timedelta(days=100)
+        )
+
+    def test_should_move_old_notifications_into_archive(self):
+        # given
+        notifications_count = Notification.objects.count()
+        text = Notification.objects.get(notification_id=1000000404).text
+        # when
+        result = Notification.objects.archive_older_than(
+            now() - timedelta(days=90), batch_size=2
+        )
+        # then
+        self.assertEqual(result, 3)
+        self.assertEqual(Notification.objects.count(), notifications_count - 3)
+        self.assertFalse(
+            Notification.objects.filter(notification_id__in=self.old_ids).exists()
+        )
+        self.assertSetEqual(
+            set(
+                ArchivedNotification.objects.filter(owner=self.owner).values_list(
+                    "notification_id", flat=True
+                )
+            ),
+            self.old_ids,
+        )
+        self.assertEqual(
+            ArchivedNotification.objects.get(notification_id=1000000404).text, text
+        )
+
+    def test_should_do_nothing_when_no_old_notifications(self):
+        # when
+        result = Notification.objects.archive_older_than(now() - timedelta(days=200))
+        # then
+        self.assertEqual(result, 0)
+        self.assertFalse(ArchivedNotification.objects.exists())
+
+
+class TestNotificationQuerySetSelectRelatedForSending(NoSocketsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_structures()
+        _, cls.owner = set_owner_character(character_id=1001)
+        load_notification_entities(cls.owner)
+        cls.owner.ping_groups.add(Group.objects.create(name="Dummy"))
+
+    def test_should_load_related_objects_with_constant_number_of_queries(self):
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            notifications = list(
+                Notification.objects.filter(
+                    owner=self.owner
+                ).select_related_for_sending()
+            )
+            for notification in notifications:
+                notification.owner.corporation.alliance
+                notification.sender.name
+                list(notification.owner.ping_groups.all())
+        # then
+        self.assertGreater(len(notifications), 1)
+        self.assertEqual(len(queries), 2)
+
+
+class TestNotificationQuerySetNewForForwarding(NoSocketsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_structures()
+        _, cls.owner = set_owner_character(character_id=1001)
+        load_notification_entities(cls.owner)
+
+    def test_should_return_new_notifications_oldest_first(self):
+        # given
+        Notification.objects.filter(notification_id=1000000403).update(is_sent=True)
+        Notification.objects.filter(notification_id=1000000404).update(
+            timestamp=now() - timedelta(days=100)
+        )
+        # when
+        result = list(Notification.objects.new_for_forwarding(self.owner))
+        # then
+        notification_ids = {obj.notification_id for obj in result}
+        self.assertGreater(len(notification_ids), 1)
+        self.assertNotIn(1000000403, notification_ids)
+        self.assertNotIn(1000000404, notification_ids)
+        self.assertListEqual(
+            [obj.timestamp for obj in result], sorted(obj.timestamp for obj in result)
+        )
+
+    def test_should_not_return_notifications_of_other_owners(self):
+        # given
+        _, other_owner = set_owner_character(character_id=1011)
+        # when
+        result = Notification.objects.new_for_forwarding(other_owner)
+        # then
+        self.assertFalse(result.exists())
+
+
 class TestOwnerAssetManager(NoSocketsTestCase):
     @classmethod
     def setUpClass(cls):
@@ -1,8 +1,10 @@
+from datetime import timedelta
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
 from django.test import TestCase
 from django.test.utils import override_settings
+from django.utils.timezone import now
 
 from allianceauth.eveonline.models import EveCorporationInfo
 from app_utils.esi import EsiStatus
@@ -11,6 +13,7 @@ from app_utils.testing import NoSocketsTestCase, generate_invalid_pk
 from structures.models.notifications import Notification
 
 from .. import tasks
+from ..managers import SovereigntyChange, SovereigntyOwner
 from ..models import Owner, Webhook
 from .testdata import create_structures, load_notification_entities, set_owner_character
 
@@ -41,6 +44,191 @@ class TestSendMessagesForWebhook(TestCase):
         self.assertEqual(mock_send_queued_messages.call_count, 0)
 
 
+@patch(MODULE_PATH + ".Webhook.send_queued_messages", autospec=True)
+class TestSendMessagesForWebhooks(TestCase):
+    def setUp(self) -> None:
+        # queues are bound to the pk when a webhook is loaded from the database
+        self.webhook_1, self.webhook_2, self.webhook_3 = [
+            Webhook.objects.get(
+                pk=Webhook.objects.create(
+                    name=f"Dummy {num}", url=f"dummy-url-{num}"
+                ).pk
+            )
+            for num in range(1, 4)
+        ]
+        for webhook in [self.webhook_1, self.webhook_2, self.webhook_3]:
+            webhook.clear_queue()
+
+    def tearDown(self) -> None:
+        for webhook in [self.webhook_1, self.webhook_2, self.webhook_3]:
+            webhook.clear_queue()
+
+    @staticmethod
+    def _send_queued_messages(webhook, deadline=None) -> int:
+        """simulates sending all queued messages successfully"""
+        return webhook.clear_queue()
+
+    def test_should_send_for_all_active_webhooks_with_queued_messages(
+        self, mock_send_queued_messages
+    ):
+        # given
+        mock_send_queued_messages.side_effect = self._send_queued_messages
+        self.webhook_1.send_message("dummy")
+        self.webhook_2.send_message("dummy")
+        self.webhook_2.is_active = False
+        self.webhook_2.save()
+        # when
+        tasks.send_messages_for_webhooks()
+        # then
+        self.assertEqual(mock_send_queued_messages.call_count, 1)
+
+    def test_should_continue_with_other_webhooks_after_error(
+        self, mock_send_queued_messages
+    ):
+        # given
+        def send_queued_messages(webhook, deadline=None):
+            if webhook.pk == self.webhook_1.pk:
+                raise RuntimeError()
+            return self._send_queued_messages(webhook)
+
+        mock_send_queued_messages.side_effect = send_queued_messages
+        self.webhook_1.send_message("dummy")
+        self.webhook_3.send_message("dummy")
+        # when
+        result = Webhook.objects.send_queued_messages_for_all(max_workers=1)
+        # then
+        self.assertEqual(result, 1)
+        self.assertEqual(mock_send_queued_messages.call_count, 2)
+
+    def test_should_send_messages_queued_while_running(self, mock_send_queued_messages):
+        # given
+        def send_queued_messages(webhook, deadline=None):
+            if webhook.pk == self.webhook_1.pk:
+                self.webhook_2.send_message("new")
+            return self._send_queued_messages(webhook)
+
+        mock_send_queued_messages.side_effect = send_queued_messages
+        self.webhook_1.send_message("dummy")
+        # when
+        result = Webhook.objects.send_queued_messages_for_all()
+        # then
+        self.assertEqual(result, 2)
+        self.assertEqual(self.webhook_2.queue_size(), 0)
+
+    def test_should_not_retry_webhooks_which_can_not_send(
+        self, mock_send_queued_messages
+    ):
+        # given
+        mock_send_queued_messages.return_value = 0
+        self.webhook_1.send_message("dummy")
+        # when
+        result = Webhook.objects.send_queued_messages_for_all()
+        # then
+        self.assertEqual(result, 0)
+        self.assertEqual(mock_send_queued_messages.call_count, 1)
+        self.assertEqual(self.webhook_1.queue_size(), 1)
+
+    def test_should_stop_after_max_rounds(self, mock_send_queued_messages):
+        # given
+        def send_queued_messages(webhook, deadline=None):
+            webhook.send_message("new")
+            return 1
+
+        mock_send_queued_messages.side_effect = send_queued_messages
+        self.webhook_1.send_message("dummy")
+        # when
+        result = Webhook.objects.send_queued_messages_for_all()
+        # then
+        self.assertEqual(result, Webhook.objects.SEND_ROUNDS_MAX)
+        self.assertEqual(
+            mock_send_queued_messages.call_count, Webhook.objects.SEND_ROUNDS_MAX
+        )
+
+    @patch("structures.webhooks.managers.monotonic", spec=True)
+    def test_should_not_start_new_round_after_timeout(
+        self, mock_monotonic, mock_send_queued_messages
+    ):
+        # given
+        def send_queued_messages(webhook, deadline=None):
+            mock_monotonic.return_value = 100
+            sent_count = webhook.clear_queue()
+            webhook.send_message("new")
+            return sent_count
+
+        mock_monotonic.return_value = 0
+        mock_send_queued_messages.side_effect = send_queued_messages
+        self.webhook_1.send_message("dummy")
+        # when
+        result = Webhook.objects.send_queued_messages_for_all(timeout=50)
+        # then
+        self.assertEqual(result, 1)
+        self.assertEqual(mock_send_queued_messages.call_count, 1)
+        self.assertEqual(mock_send_queued_messages.call_args[1]["deadline"], 50)
+        self.assertEqual(self.webhook_1.queue_size(), 1)
+
+    def test_task_should_stop_sending_before_time_limit(
+        self, mock_send_queued_messages
+    ):
+        # given
+        mock_send_queued_messages.side_effect = self._send_queued_messages
+        self.webhook_1.send_message("dummy")
+        # when
+        with patch("structures.webhooks.managers.monotonic", spec=True) as mock_mono:
+            mock_mono.return_value = 1000
+            tasks.send_messages_for_webhooks()
+        # then
+        deadline = mock_send_queued_messages.call_args[1]["deadline"]
+        self.assertEqual(
+            deadline,
+            1000 + tasks.SEND_MESSAGES_TIMEOUT - tasks.SEND_MESSAGES_TIMEOUT_MARGIN,
+        )
+
+
+@patch(MODULE_PATH + ".Structure.objects.update_sov_tags", spec=True)
+@patch(MODULE_PATH + ".EveSovereigntyMap.objects.update_from_esi", spec=True)
+class TestUpdateSovMap(NoSocketsTestCase):
+    def test_should_update_sov_tags_for_changed_systems(
+        self, mock_update_from_esi, mock_update_sov_tags
+    ):
+        # given
+        mock_update_from_esi.return_value = [
+            SovereigntyChange(30000474, None, SovereigntyOwner(3001, 2001, None)),
+            SovereigntyChange(30000726, SovereigntyOwner(3001, 2001, None), None),
+        ]
+        # when
+        tasks.update_sov_map()
+        # then
+        args, _ = mock_update_sov_tags.call_args
+        self.assertListEqual(args[0], [30000474, 30000726])
+
+    def test_should_not_update_sov_tags_when_nothing_changed(
+        self, mock_update_from_esi, mock_update_sov_tags
+    ):
+        # given
+        mock_update_from_esi.return_value = []
+        # when
+        tasks.update_sov_map()
+        # then
+        self.assertFalse(mock_update_sov_tags.called)
+
+
+@patch(MODULE_PATH + ".STRUCTURES_NOTIFICATION_RETENTION_DAYS", 30)
+@patch(MODULE_PATH + ".Notification.objects.archive_older_than", spec=True)
+class TestArchiveNotifications(NoSocketsTestCase):
+    def test_should_archive_notifications_older_than_retention_period(
+        self, mock_archive_older_than
+    ):
+        # given
+        mock_archive_older_than.return_value = 0
+        # when
+        tasks.archive_notifications()
+        # then
+        args, _ = mock_archive_older_than.call_args
+        self.assertAlmostEqual(
+            args[0], now() - timedelta(days=30), delta=timedelta(minutes=1)
+        )
+
+
 @override_settings(CELERY_ALWAYS_EAGER=True)
 class TestUpdateStructures(NoSocketsTestCase):
     def setUp(self):
@@ -218,12 +406,12 @@ class TestProcessNotificationsForOwner(TestCase):
         with self.assertRaises(Owner.DoesNotExist):
             tasks.process_notifications_for_owner(owner_pk=generate_invalid_pk(Owner))
 
-    @patch(MODULE_PATH + ".send_messages_for_webhook")
+    @patch(MODULE_PATH + ".send_messages_for_webhooks")
     @patch(MODULE_PATH + ".Owner.fetch_notifications_esi")
     def test_should_send_notifications_for_owner(
         self,
         mock_fetch_notifications_esi,
-        mock_send_messages_for_webhook,
+        mock_send_messages_for_webhooks,
     ):
         # given
         load_notification_entities(self.owner)
@@ -233,20 +421,20 @@ class TestProcessNotificationsForOwner(TestCase):
         tasks.process_notifications_for_owner(owner_pk=self.owner.pk)
         # then
         self.assertTrue(mock_fetch_notifications_esi.called)
-        self.assertEqual(mock_send_messages_for_webhook.apply_async.call_count, 1)
+        self.assertEqual(mock_send_messages_for_webhooks.apply_async.call_count, 1)
 
-    @patch(MODULE_PATH + ".send_messages_for_webhook")
+    @patch(MODULE_PATH + ".send_messages_for_webhooks")
     @patch(MODULE_PATH + ".Owner.fetch_notifications_esi")
     def test_dont_sent_if_queue_is_empty(
         self,
         mock_fetch_notifications_esi,
-        mock_send_messages_for_webhook,
+        mock_send_messages_for_webhooks,
     ):
         self.owner.webhooks.first().clear_queue()
 
         tasks.process_notifications_for_owner(owner_pk=self.owner.pk)
         self.assertTrue(mock_fetch_notifications_esi.called)
-        self.assertEqual(mock_send_messages_for_webhook.apply_async.call_count, 0)
+        self.assertEqual(mock_send_messages_for_webhooks.apply_async.call_count, 0)
 
 
 @patch("structures.webhooks.core.sleep", lambda _: None)
@@ -294,10 +482,10 @@ class TestSendNotifications(TestCase):
         create_structures()
         cls.user, cls.owner = set_owner_character(character_id=1001)
 
-    @patch(MODULE_PATH + ".send_messages_for_webhook")
-    def test_normal(self, mock_send_messages_for_webhook):
+    @patch(MODULE_PATH + ".send_messages_for_webhooks")
+    def test_normal(self, mock_send_messages_for_webhooks):
         load_notification_entities(self.owner)
 
         notification_pk = Notification.objects.get(notification_id=1000000509).pk
         tasks.send_notifications([notification_pk])
-        self.assertEqual(mock_send_messages_for_webhook.apply_async.call_count, 1)
+        self.assertEqual(mock_send_messages_for_webhooks.apply_async.call_count, 1)
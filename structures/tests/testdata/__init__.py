@@ -39,6 +39,7 @@ from ...models import (
     NotificationType,
     Owner,
     OwnerCharacter,
+    RefineryMoon,
     Structure,
     StructureService,
     StructureTag,
@@ -808,3 +809,5 @@ def load_notification_entities(owner: Owner):
                 "is_sent": False,
             },
         )
+    # moons of refineries are indexed when notifications are stored
+    RefineryMoon.objects.update_from_notifications(owner.notifications.all())
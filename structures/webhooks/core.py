@@ -1,24 +1,140 @@
 import json
-from time import sleep
-from typing import List, Tuple
+from time import monotonic, sleep
+from typing import Iterable, List, Optional, Tuple
 
 import dhooks_lite
 from simple_mq import SimpleMQ
 
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 
 from allianceauth.services.hooks import get_extension_logger
 from app_utils.allianceauth import notify_admins_throttled
 from app_utils.json import JSONDateTimeDecoder, JSONDateTimeEncoder
 from app_utils.logging import LoggerAddTag
 
-from .. import __title__
-from ..app_settings import STRUCTURES_NOTIFY_THROTTLED_TIMEOUT
+from .. import __title__, __version__
+from ..app_settings import (
+    STRUCTURES_NOTIFICATION_MAX_RETRIES,
+    STRUCTURES_NOTIFY_THROTTLED_TIMEOUT,
+)
+from .session import get_session
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
 
+class DiscordRateLimiter:
+    """Token bucket for sending messages to a Discord webhook.
+
+    The bucket is filled and refilled as reported by Discord
+    in the rate limit headers of each response.
+    """
+
+    def __init__(self) -> None:
+        self._remaining = None
+        self._reset_at = None
+
+    def wait(self) -> None:
+        """Waits until the next message can be sent, if needed."""
+        if self._remaining is not None and self._remaining <= 0:
+            delay = self._reset_at - monotonic()
+            if delay > 0:
+                logger.debug("Waiting %.2f seconds for rate limit reset", delay)
+                sleep(delay)
+            self._remaining = None
+
+    def update(self, headers: dict) -> None:
+        """Updates the bucket from the headers of a response."""
+        headers = {key.lower(): value for key, value in headers.items()}
+        try:
+            remaining = int(headers["x-ratelimit-remaining"])
+            reset_after = float(headers["x-ratelimit-reset-after"])
+        except (KeyError, ValueError):
+            return
+        self._remaining = remaining
+        self._reset_at = monotonic() + reset_after
+
+    def block(self, retry_after: float) -> None:
+        """Blocks sending for the given number of seconds."""
+        self._remaining = 0
+        self._reset_at = monotonic() + retry_after
+
+
+class BatchedSimpleMQ(SimpleMQ):
+    """SimpleMQ queue with bulk operations that need only one round trip to Redis.
+
+    The bulk operations of SimpleMQ process one message per round trip.
+    """
+
+    def clear(self) -> int:
+        """Purge all messages from the queue and return count of cleared messages."""
+        pipe = self.conn.pipeline()
+        pipe.llen(self._redis_key())
+        pipe.delete(self._redis_key())
+        total, _ = pipe.execute()
+        return int(total)
+
+    def enqueue_bulk(self, messages: Iterable[str]) -> Optional[int]:
+        """Enqueue a list of messages into the queue at once.
+
+        Return size of the queue after enqueuing or None if list was empty.
+        """
+        messages = [str(message) for message in messages]
+        if not messages:
+            return None
+        return self.conn.rpush(self._redis_key(), *messages)
+
+    def requeue_bulk(self, messages: Iterable[str]) -> Optional[int]:
+        """Put messages back to the front of the queue in their current order.
+
+        Return size of the queue after requeuing or None if list was empty.
+        """
+        messages = [str(message) for message in messages]
+        if not messages:
+            return None
+        return self.conn.lpush(self._redis_key(), *reversed(messages))
+
+    def dequeue_bulk(self, max: Optional[int] = None) -> List[str]:
+        """Dequeue a list of message from the queue.
+
+        Return no more than max message from queue
+        or return all messages if max is not specified.
+        Returns an empty list if queue is empty.
+        """
+        if max is not None and int(max) < 0:
+            raise ValueError("max can not be negative")
+        if max is not None and int(max) == 0:
+            return []
+
+        pipe = self.conn.pipeline()
+        if max is None:
+            pipe.lrange(self._redis_key(), 0, -1)
+            pipe.delete(self._redis_key())
+        else:
+            pipe.lrange(self._redis_key(), 0, int(max) - 1)
+            pipe.ltrim(self._redis_key(), int(max), -1)
+        values, _ = pipe.execute()
+        return [value.decode("utf8") for value in values]
+
+    def move_all(self, target: "BatchedSimpleMQ") -> int:
+        """Atomically move all messages to the end of the target queue.
+
+        Returns number of moved messages.
+        """
+        key = self._redis_key()
+
+        def _move(pipe) -> int:
+            values = pipe.lrange(key, 0, -1)
+            pipe.multi()
+            if values:
+                pipe.rpush(target._redis_key(), *values)
+                pipe.delete(key)
+            return len(values)
+
+        return self.conn.transaction(_move, key, value_from_callable=True)
+
+
 class DiscordWebhookMixin:
     """Mixing adding a queued Discord webhook to a model
 
@@ -27,18 +143,53 @@ class DiscordWebhookMixin:
     - url: url of the webhook (string)
     """
 
-    # delay in seconds between every message sent to Discord
-    # this needs to be >= 1 to prevent 429 Too Many Request errors
-    SEND_DELAY = 2
+    HTTP_CODE_TOO_MANY_REQUESTS = 429
+    HTTP_CODES_SERVER_UNAVAILABLE = {502, 503, 504}
+
+    # timeouts for connecting to and reading from Discord in seconds
+    REQUESTS_TIMEOUT = (5.0, 30.0)
+
+    # wait time in seconds after a 429 response without retry information
+    DEFAULT_RETRY_AFTER = 2
+
+    # max number of messages taken from the queue at once for sending
+    QUEUE_BATCH_SIZE = 100
+
+    # Discord limits for embeds in one message
+    MAX_EMBEDS_PER_MESSAGE = 10
+    MAX_EMBEDS_CHARACTERS = 6000
+
+    # properties that must be equal for messages to be combined
+    COALESCE_KEYS = ("content", "tts", "username", "avatar_url")
+
+    # priority lanes of the queue. Higher lanes are always sent first.
+    PRIORITY_HIGH = 1
+    PRIORITY_NORMAL = 2
+    PRIORITY_LOW = 3
+    PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self._main_queue = SimpleMQ(
+        self._main_queue = BatchedSimpleMQ(
             cache.get_master_client(), f"{__title__}_webhook_{self.pk}_main"
         )
-        self._error_queue = SimpleMQ(
+        self._error_queue = BatchedSimpleMQ(
             cache.get_master_client(), f"{__title__}_webhook_{self.pk}_errors"
         )
+        self._queues = {self.PRIORITY_NORMAL: self._main_queue}
+        self._error_queues = {self.PRIORITY_NORMAL: self._error_queue}
+        for priority, suffix in (
+            (self.PRIORITY_HIGH, "high"),
+            (self.PRIORITY_LOW, "low"),
+        ):
+            self._queues[priority] = BatchedSimpleMQ(
+                cache.get_master_client(),
+                f"{__title__}_webhook_{self.pk}_main_{suffix}",
+            )
+            self._error_queues[priority] = BatchedSimpleMQ(
+                cache.get_master_client(),
+                f"{__title__}_webhook_{self.pk}_errors_{suffix}",
+            )
 
     def __str__(self) -> str:
         return self.name
@@ -48,21 +199,19 @@ class DiscordWebhookMixin:
             self.__class__.__name__, self.pk, self.name
         )
 
-    def queue_size(self) -> int:
-        """returns current size of the queue"""
-        return self._main_queue.size()
+    def queue_size(self, priority: int = None) -> int:
+        """returns current size of the queue
+
+        Args:
+            priority: only return size of the lane with this priority
+        """
+        if priority is not None:
+            return self._queues[priority].size()
+        return sum(queue.size() for queue in self._queues.values())
 
     def clear_queue(self) -> int:
         """deletes all messages from the queue. Returns number of cleared messages."""
-        counter = 0
-        while True:
-            y = self._main_queue.dequeue()
-            if y is None:
-                break
-            else:
-                counter += 1
-
-        return counter
+        return sum(queue.clear() for queue in self._queues.values())
 
     def send_message(
         self,
@@ -71,14 +220,20 @@ class DiscordWebhookMixin:
         tts: bool = None,
         username: str = None,
         avatar_url: str = None,
+        priority: int = PRIORITY_NORMAL,
     ) -> int:
         """Adds Discord message to queue for later sending
 
-        Returns updated size of queue
-        Raises ValueError if mesage is incomplete
+        Messages with higher priority are sent before all messages
+        with lower priority.
+
+        Returns updated size of the queue lane
+        Raises ValueError if mesage is incomplete or priority is invalid
         """
         if not content and not embeds:
             raise ValueError("Message must have content or embeds to be valid")
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"Invalid priority: {priority}")
 
         if embeds:
             embeds_list = [obj.asdict() for obj in embeds]
@@ -97,61 +252,192 @@ class DiscordWebhookMixin:
         if avatar_url:
             message["avatar_url"] = avatar_url
 
-        return self._main_queue.enqueue(json.dumps(message, cls=JSONDateTimeEncoder))
+        return self._queues[priority].enqueue(
+            json.dumps(message, cls=JSONDateTimeEncoder)
+        )
 
-    def send_queued_messages(self) -> int:
+    def send_queued_messages(self, deadline: float = None) -> int:
         """sends all messages in the queue to this webhook
 
         returns number of successfull sent messages
 
-        Messages that could not be sent are put back into the queue for later retry
+        Messages are sent in batches and higher priority lanes are drained first.
+        Messages that could not be sent are put back into the queue for later retry.
+        When sending is aborted by an exception, the unsent messages of the current
+        batch are put back to the front of their queue.
+
+        Args:
+            deadline: stop sending new messages after this time as reported by
+            time.monotonic(). Unsent messages stay in the queue.
         """
         message_count = 0
-        while True:
-            message_json = self._main_queue.dequeue()
-            if message_json:
-                message = json.loads(message_json, cls=JSONDateTimeDecoder)
+        rate_limiter = DiscordRateLimiter()
+        try:
+            while not self._is_deadline_reached(deadline):
+                priority, messages_json = self._dequeue_next_batch()
+                if not messages_json:
+                    break
+                message_count += self._send_batch(
+                    priority, messages_json, rate_limiter, deadline
+                )
+        finally:
+            for priority in self.PRIORITIES:
+                self._error_queues[priority].move_all(self._queues[priority])
+
+        return message_count
+
+    def _send_batch(
+        self,
+        priority: int,
+        messages_json: List[str],
+        rate_limiter: DiscordRateLimiter,
+        deadline: float = None,
+    ) -> int:
+        """sends a batch of messages dequeued from the lane with given priority
+
+        Stops early when messages with higher priority have been queued meanwhile
+        or the deadline is reached.
+        The remaining messages are then put back to the front of their lane.
+
+        Returns number of successfully sent messages
+        """
+        message_count = 0
+        failed_messages_json = list()
+        coalesced_messages = self._coalesce_messages(messages_json)
+        next_index = 0
+        try:
+            for message, source_messages_json in coalesced_messages:
+                if next_index > 0 and (
+                    self._is_deadline_reached(deadline)
+                    or self._has_messages_with_higher_priority(priority)
+                ):
+                    break
                 logger.debug("Sending message to webhook %s", self)
-                if self._send_message_to_webhook(message):
-                    message_count += 1
+                if self._send_message_to_webhook(message, rate_limiter):
+                    message_count += len(source_messages_json)
                 else:
-                    self._error_queue.enqueue(message_json)
+                    failed_messages_json += source_messages_json
+                next_index += 1
+        finally:
+            self._error_queues[priority].enqueue_bulk(failed_messages_json)
+            self._queues[priority].requeue_bulk(
+                [
+                    message_json
+                    for _, source_messages_json in coalesced_messages[next_index:]
+                    for message_json in source_messages_json
+                ]
+            )
 
-                sleep(self.SEND_DELAY)
+        return message_count
 
-            else:
-                break
+    @staticmethod
+    def _is_deadline_reached(deadline: Optional[float]) -> bool:
+        return deadline is not None and monotonic() >= deadline
+
+    def _has_messages_with_higher_priority(self, priority: int) -> bool:
+        """whether any lane with higher priority than the given one has messages"""
+        return any(
+            self._queues[obj].size() > 0 for obj in self.PRIORITIES if obj < priority
+        )
+
+    def _dequeue_next_batch(self) -> Tuple[Optional[int], List[str]]:
+        """dequeues next batch of messages from the highest non empty lane
+
+        Returns priority of the lane and its messages
+        """
+        for priority in self.PRIORITIES:
+            messages_json = self._queues[priority].dequeue_bulk(self.QUEUE_BATCH_SIZE)
+            if messages_json:
+                return priority, messages_json
 
-        while True:
-            message_json = self._error_queue.dequeue()
-            if message_json:
-                self._main_queue.enqueue(message_json)
+        return None, []
+
+    @classmethod
+    def _coalesce_messages(cls, messages_json: List[str]) -> List[Tuple[dict, list]]:
+        """combines consecutive messages with embeds into multi-embed messages
+
+        Messages are combined if they have the same content, tts, username
+        and avatar and the result stays within Discord's limits for embeds.
+
+        Returns list of tuples of combined message and its source messages as JSON
+        """
+        results = list()
+        last_message = None
+        last_characters = 0
+        for message_json in messages_json:
+            message = json.loads(message_json, cls=JSONDateTimeDecoder)
+            embeds = message.get("embeds") or []
+            characters = sum(cls._embed_characters(embed) for embed in embeds)
+            if (
+                last_message
+                and embeds
+                and all(
+                    last_message.get(key) == message.get(key)
+                    for key in cls.COALESCE_KEYS
+                )
+                and len(last_message["embeds"]) + len(embeds)
+                <= cls.MAX_EMBEDS_PER_MESSAGE
+                and last_characters + characters <= cls.MAX_EMBEDS_CHARACTERS
+            ):
+                last_message["embeds"] += embeds
+                last_characters += characters
+                results[-1][1].append(message_json)
             else:
-                break
+                results.append((message, [message_json]))
+                last_message = message if embeds else None
+                last_characters = characters
 
-        return message_count
+        return results
 
-    def _send_message_to_webhook(self, message: dict) -> bool:
+    @staticmethod
+    def _embed_characters(embed: dict) -> int:
+        """number of characters of an embed as counted by Discord for its limits"""
+        characters = len(embed.get("title") or "") + len(embed.get("description") or "")
+        for field in embed.get("fields") or []:
+            characters += len(field.get("name") or "") + len(field.get("value") or "")
+        characters += len((embed.get("footer") or {}).get("text") or "")
+        characters += len((embed.get("author") or {}).get("name") or "")
+        return characters
+
+    def _send_message_to_webhook(
+        self, message: dict, rate_limiter: DiscordRateLimiter = None
+    ) -> bool:
         """sends message directly to webhook
 
+        Waits as needed for the rate limits reported by Discord
+        and retries after 429 responses.
+
         returns True if successful, else False
         """
-        hook = dhooks_lite.Webhook(url=self.url)
-        if message.get("embeds"):
-            embeds = [
-                dhooks_lite.Embed.from_dict(embed_dict)
-                for embed_dict in message.get("embeds")
-            ]
-        else:
-            embeds = None
-
-        response = hook.execute(
-            content=message.get("content"),
-            embeds=embeds,
-            username=message.get("username"),
-            avatar_url=message.get("avatar_url"),
-            wait_for_response=True,
-        )
+        if not rate_limiter:
+            rate_limiter = DiscordRateLimiter()
+        for retry_count in range(STRUCTURES_NOTIFICATION_MAX_RETRIES + 1):
+            rate_limiter.wait()
+            response = self._execute_message(message)
+            rate_limiter.update(response.headers)
+            if response.status_code == self.HTTP_CODE_TOO_MANY_REQUESTS:
+                retry_after = self._retry_after(response)
+                logger.warning(
+                    "Webhook %s is rate limited. Retrying in %.2f seconds (%d/%d)",
+                    self,
+                    retry_after,
+                    retry_count + 1,
+                    STRUCTURES_NOTIFICATION_MAX_RETRIES,
+                )
+            elif response.status_code in self.HTTP_CODES_SERVER_UNAVAILABLE:
+                retry_after = self.DEFAULT_RETRY_AFTER * 2 ** retry_count
+                logger.warning(
+                    "Discord is unavailable for webhook %s. "
+                    "Retrying in %.2f seconds (%d/%d)",
+                    self,
+                    retry_after,
+                    retry_count + 1,
+                    STRUCTURES_NOTIFICATION_MAX_RETRIES,
+                )
+            else:
+                break
+            rate_limiter.block(retry_after)
+
         logger.debug("headers: %s", response.headers)
         logger.debug("status_code: %s", response.status_code)
         logger.debug("content: %s", response.content)
@@ -176,6 +462,44 @@ class DiscordWebhookMixin:
         )
         return False
 
+    def _execute_message(self, message: dict) -> dhooks_lite.WebhookResponse:
+        """posts message to this webhook with the shared HTTP session"""
+        r = get_session().post(
+            url=self.url,
+            params={"wait": True},
+            headers={
+                "Content-Type": "application/json",
+                "User-Agent": f"{__title__} {__version__}",
+            },
+            data=json.dumps(message, cls=DjangoJSONEncoder),
+            timeout=self.REQUESTS_TIMEOUT,
+        )
+        try:
+            content = r.json()
+        except ValueError:
+            content = None
+
+        return dhooks_lite.WebhookResponse(
+            headers=r.headers,
+            status_code=r.status_code,
+            content=content if isinstance(content, dict) else None,
+        )
+
+    @classmethod
+    def _retry_after(cls, response: dhooks_lite.WebhookResponse) -> float:
+        """Returns seconds to wait before retrying as reported in a 429 response."""
+        headers = {key.lower(): value for key, value in response.headers.items()}
+        try:
+            return float(headers["retry-after"])
+        except (KeyError, ValueError):
+            pass
+        if response.content and "retry_after" in response.content:
+            try:
+                return float(response.content["retry_after"])
+            except (TypeError, ValueError):
+                pass
+        return cls.DEFAULT_RETRY_AFTER
+
     @classmethod
     def create_link(cls, name: str, url: str) -> str:
         """creates a link for messages of this webhook"""
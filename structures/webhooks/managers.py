@@ -1,14 +1,22 @@
-from django.db import models
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import monotonic
+
+from django.db import connections, models
 
 from allianceauth.services.hooks import get_extension_logger
 from app_utils.logging import LoggerAddTag
 
 from .. import __title__
+from ..app_settings import STRUCTURES_WEBHOOKS_MAX_WORKERS
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
 
 class WebhookBaseManager(models.Manager):
+    # max number of rounds for sending queued messages to all webhooks
+    SEND_ROUNDS_MAX = 10
+
     def send_queued_messages_for_webhook(self, webhook_pk: int) -> None:
         """sends all currently queued messages to given webhook
 
@@ -26,3 +34,75 @@ class WebhookBaseManager(models.Manager):
             logger.info("Started sending messages to webhook %s", webhook)
             webhook.send_queued_messages()
             logger.info("Completed sending messages to webhook %s", webhook)
+
+    def send_queued_messages_for_all(
+        self, max_workers: int = None, timeout: float = None
+    ) -> int:
+        """sends queued messages of all active webhooks concurrently
+
+        Each webhook is drained in its own thread with its own rate limit,
+        so one worker can deliver to many webhooks at the same time.
+
+        Webhooks are checked again for new messages after each round
+        until no webhook has pending messages or SEND_ROUNDS_MAX is reached.
+        Webhooks which could not send any message in a round are skipped
+        in later rounds to avoid retrying failing messages endlessly.
+
+        timeout: stop taking new messages from the queues after these seconds,
+        so the caller can finish before a hard time limit without losing messages
+
+        Returns number of sent messages.
+
+        !! this method should be called from a tasks with QueueOnce !!
+        """
+        max_workers = max_workers or STRUCTURES_WEBHOOKS_MAX_WORKERS
+        deadline = monotonic() + timeout if timeout is not None else None
+        stalled_webhook_pks = set()
+        sent_count = 0
+        for _ in range(self.SEND_ROUNDS_MAX):
+            if deadline is not None and monotonic() >= deadline:
+                logger.info("Stopped sending messages to webhooks: timeout reached")
+                break
+            webhooks = [
+                webhook
+                for webhook in self.filter(is_active=True).exclude(
+                    pk__in=stalled_webhook_pks
+                )
+                if webhook.queue_size() > 0
+            ]
+            if not webhooks:
+                break
+
+            workers_count = min(max_workers, len(webhooks))
+            logger.info(
+                "Started sending messages to %d webhooks with %d workers",
+                len(webhooks),
+                workers_count,
+            )
+            with ThreadPoolExecutor(max_workers=workers_count) as executor:
+                results = list(
+                    executor.map(
+                        partial(self._send_queued_messages, deadline=deadline),
+                        webhooks,
+                    )
+                )
+
+            for webhook, webhook_sent_count in zip(webhooks, results):
+                if not webhook_sent_count:
+                    stalled_webhook_pks.add(webhook.pk)
+
+            sent_count += sum(results)
+
+        logger.info("Completed sending %d messages to webhooks", sent_count)
+        return sent_count
+
+    @staticmethod
+    def _send_queued_messages(webhook, deadline: float = None) -> int:
+        try:
+            return webhook.send_queued_messages(deadline=deadline)
+        except Exception:
+            logger.exception("Failed to send messages to webhook %s", webhook)
+            return 0
+        finally:
+            # DB connections are per thread and need to be closed explicitly
+            connections.close_all()
@@ -0,0 +1,63 @@
+"""Shared HTTP session for sending messages to Discord webhooks"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..app_settings import STRUCTURES_WEBHOOKS_MAX_WORKERS
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Returns the keep-alive HTTP session shared by all webhooks of this process.
+
+    Connections are pooled per host, so consecutive messages to Discord
+    reuse open connections instead of doing a new TCP and TLS handshake.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=STRUCTURES_WEBHOOKS_MAX_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def close_session() -> None:
+    """Closes the shared session and all its connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def session_metrics() -> dict:
+    """Returns connection reuse metrics of the shared session.
+
+    requests: number of requests sent
+    connections: number of connections opened
+    reused: number of requests sent over an already open connection
+    """
+    requests_count = 0
+    connections_count = 0
+    with _session_lock:
+        adapters = set(_session.adapters.values()) if _session else set()
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool:
+                    requests_count += pool.num_requests
+                    connections_count += pool.num_connections
+
+    return {
+        "requests": requests_count,
+        "connections": connections_count,
+        "reused": max(requests_count - connections_count, 0),
+    }
@@ -3,7 +3,9 @@ from random import randint
 from unittest.mock import patch
 
 import dhooks_lite
+import requests
 
+from django.core.cache import cache
 from django.test import TestCase
 
 from allianceauth.tests.auth_utils import AuthUtils
@@ -27,6 +29,70 @@ class Webhook(core.DiscordWebhookMixin):
         super().__init__()
 
 
+class TestBatchedSimpleMQ(TestCase):
+    def setUp(self) -> None:
+        self.queue = core.BatchedSimpleMQ(cache.get_master_client(), "test_main")
+        self.other_queue = core.BatchedSimpleMQ(cache.get_master_client(), "test_other")
+        self.queue.clear()
+        self.other_queue.clear()
+
+    def test_should_enqueue_and_dequeue_in_bulk(self):
+        # given
+        self.queue.enqueue_bulk(["1", "2", "3"])
+        # when
+        result = self.queue.dequeue_bulk()
+        # then
+        self.assertListEqual(result, ["1", "2", "3"])
+        self.assertEqual(self.queue.size(), 0)
+
+    def test_should_dequeue_no_more_than_max(self):
+        # given
+        self.queue.enqueue_bulk(["1", "2", "3"])
+        # when
+        result = self.queue.dequeue_bulk(2)
+        # then
+        self.assertListEqual(result, ["1", "2"])
+        self.assertListEqual(self.queue.dequeue_bulk(), ["3"])
+
+    def test_should_return_empty_list_when_queue_is_empty(self):
+        self.assertListEqual(self.queue.dequeue_bulk(10), [])
+
+    def test_should_requeue_messages_to_front_in_order(self):
+        # given
+        self.queue.enqueue_bulk(["3", "4"])
+        # when
+        self.queue.requeue_bulk(["1", "2"])
+        # then
+        self.assertListEqual(self.queue.dequeue_bulk(), ["1", "2", "3", "4"])
+
+    def test_should_return_none_when_enqueuing_nothing(self):
+        self.assertIsNone(self.queue.enqueue_bulk([]))
+
+    def test_should_clear_queue(self):
+        # given
+        self.queue.enqueue_bulk([str(num) for num in range(5000)])
+        # when
+        result = self.queue.clear()
+        # then
+        self.assertEqual(result, 5000)
+        self.assertEqual(self.queue.size(), 0)
+
+    def test_should_move_all_messages_to_end_of_other_queue(self):
+        # given
+        self.queue.enqueue_bulk(["3", "4"])
+        self.other_queue.enqueue_bulk(["1", "2"])
+        # when
+        result = self.queue.move_all(self.other_queue)
+        # then
+        self.assertEqual(result, 2)
+        self.assertEqual(self.queue.size(), 0)
+        self.assertListEqual(self.other_queue.dequeue_bulk(), ["1", "2", "3", "4"])
+
+    def test_should_move_nothing_from_empty_queue(self):
+        self.assertEqual(self.queue.move_all(self.other_queue), 0)
+        self.assertEqual(self.other_queue.size(), 0)
+
+
 @patch(MODULE_PATH + ".sleep", lambda _: None)
 class TestDiscordWebhookMixin(TestCase):
     def setUp(self) -> None:
@@ -83,7 +149,7 @@ class TestDiscordWebhookMixin(TestCase):
             },
         )
 
-    @patch(MODULE_PATH + ".dhooks_lite.Webhook.execute")
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
     def test_send_queued_messages_normal_simple(self, mock_execute):
         mock_execute.return_value = dhooks_lite.WebhookResponse(
             {}, status_code=200, content={"dummy": True}
@@ -97,7 +163,7 @@ class TestDiscordWebhookMixin(TestCase):
         self.assertEqual(self.webhook.queue_size(), 0)
         self.assertEqual(self.webhook._error_queue.size(), 0)
 
-    @patch(MODULE_PATH + ".dhooks_lite.Webhook.execute")
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
     def test_send_queued_messages_normal_complex(self, mock_execute):
         mock_execute.return_value = dhooks_lite.WebhookResponse(
             {}, status_code=200, content={"dummy": True}
@@ -116,7 +182,7 @@ class TestDiscordWebhookMixin(TestCase):
         self.assertEqual(self.webhook.queue_size(), 0)
         self.assertEqual(self.webhook._error_queue.size(), 0)
 
-    @patch(MODULE_PATH + ".dhooks_lite.Webhook.execute")
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
     def test_send_queued_messages_errors_are_requeued(self, mock_execute):
         mock_execute.return_value = dhooks_lite.WebhookResponse(
             {}, status_code=404, content={"dummy": True}
@@ -130,13 +196,298 @@ class TestDiscordWebhookMixin(TestCase):
         self.assertEqual(self.webhook.queue_size(), 2)
         self.assertEqual(self.webhook._error_queue.size(), 0)
 
+    @patch(MODULE_PATH + ".DiscordWebhookMixin.QUEUE_BATCH_SIZE", 2)
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
+    def test_send_queued_messages_in_batches(self, mock_execute):
+        # given
+        mock_execute.side_effect = [
+            dhooks_lite.WebhookResponse({}, status_code=200),
+            dhooks_lite.WebhookResponse({}, status_code=404),
+            dhooks_lite.WebhookResponse({}, status_code=200),
+            dhooks_lite.WebhookResponse({}, status_code=200),
+            dhooks_lite.WebhookResponse({}, status_code=404),
+        ]
+        for num in range(5):
+            self.webhook.send_message(f"dummy {num}")
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 3)
+        self.assertEqual(mock_execute.call_count, 5)
+        contents = [
+            json.loads(message_json)["content"]
+            for message_json in self.webhook._main_queue.dequeue_bulk()
+        ]
+        self.assertListEqual(contents, ["dummy 1", "dummy 4"])
+
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
+    def test_send_queued_messages_combines_embeds(self, mock_execute):
+        # given
+        mock_execute.return_value = dhooks_lite.WebhookResponse({}, status_code=200)
+        for num in range(12):
+            self.webhook.send_message(
+                content="@here",
+                embeds=[dhooks_lite.Embed(description=f"description {num}")],
+                username="user",
+            )
+        self.webhook.send_message(
+            content="@everyone", embeds=[dhooks_lite.Embed(description="other")]
+        )
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 13)
+        self.assertEqual(mock_execute.call_count, 3)
+        messages = [call[0][0] for call in mock_execute.call_args_list]
+        self.assertEqual(len(messages[0]["embeds"]), 10)
+        self.assertEqual(messages[0]["embeds"][9]["description"], "description 9")
+        self.assertEqual(messages[0]["content"], "@here")
+        self.assertEqual(len(messages[1]["embeds"]), 2)
+        self.assertEqual(messages[2]["content"], "@everyone")
+
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
+    def test_send_queued_messages_requeues_all_combined_messages(self, mock_execute):
+        # given
+        mock_execute.return_value = dhooks_lite.WebhookResponse({}, status_code=404)
+        for num in range(3):
+            self.webhook.send_message(
+                embeds=[dhooks_lite.Embed(description=f"description {num}")]
+            )
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 0)
+        self.assertEqual(mock_execute.call_count, 1)
+        self.assertEqual(self.webhook.queue_size(), 3)
+
+    def test_should_not_combine_embeds_exceeding_character_limit(self):
+        # given
+        for _ in range(3):
+            self.webhook.send_message(
+                embeds=[
+                    dhooks_lite.Embed(description="x" * 1500),
+                    dhooks_lite.Embed(description="x" * 1500),
+                ]
+            )
+        messages_json = self.webhook._main_queue.dequeue_bulk()
+        # when
+        result = self.webhook._coalesce_messages(messages_json)
+        # then
+        self.assertListEqual([len(obj[1]) for obj in result], [2, 1])
+
+    @patch(MODULE_PATH + ".DiscordWebhookMixin.QUEUE_BATCH_SIZE", 1)
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
+    def test_send_queued_messages_drains_higher_priorities_first(self, mock_execute):
+        # given
+        mock_execute.return_value = dhooks_lite.WebhookResponse({}, status_code=200)
+        self.webhook.send_message("low", priority=Webhook.PRIORITY_LOW)
+        self.webhook.send_message("normal")
+        self.webhook.send_message("high", priority=Webhook.PRIORITY_HIGH)
+        self.assertEqual(self.webhook.queue_size(), 3)
+        self.assertEqual(self.webhook.queue_size(Webhook.PRIORITY_HIGH), 1)
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 3)
+        contents = [call[0][0]["content"] for call in mock_execute.call_args_list]
+        self.assertListEqual(contents, ["high", "normal", "low"])
+
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
+    def test_send_queued_messages_sends_new_high_priority_message_next(
+        self, mock_execute
+    ):
+        # given
+        sent_contents = list()
+
+        def execute_message(message):
+            sent_contents.append(message["content"])
+            if message["content"] == "low 0":
+                self.webhook.send_message("high", priority=Webhook.PRIORITY_HIGH)
+            return dhooks_lite.WebhookResponse({}, status_code=200)
+
+        mock_execute.side_effect = execute_message
+        for num in range(3):
+            self.webhook.send_message(f"low {num}", priority=Webhook.PRIORITY_LOW)
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 4)
+        self.assertListEqual(sent_contents, ["low 0", "high", "low 1", "low 2"])
+        self.assertEqual(self.webhook.queue_size(), 0)
+
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
+    def test_send_queued_messages_requeues_errors_in_their_lane(self, mock_execute):
+        # given
+        mock_execute.return_value = dhooks_lite.WebhookResponse({}, status_code=404)
+        self.webhook.send_message("high", priority=Webhook.PRIORITY_HIGH)
+        self.webhook.send_message("low", priority=Webhook.PRIORITY_LOW)
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 0)
+        self.assertEqual(self.webhook.queue_size(Webhook.PRIORITY_HIGH), 1)
+        self.assertEqual(self.webhook.queue_size(Webhook.PRIORITY_LOW), 1)
+        self.assertEqual(self.webhook.queue_size(Webhook.PRIORITY_NORMAL), 0)
+
+    def test_send_message_raises_on_invalid_priority(self):
+        with self.assertRaises(ValueError):
+            self.webhook.send_message("dummy", priority=99)
+
+    @patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
+    def test_send_queued_messages_keeps_unsent_messages_on_exception(
+        self, mock_execute
+    ):
+        # given
+        mock_execute.side_effect = [
+            dhooks_lite.WebhookResponse({}, status_code=200),
+            dhooks_lite.WebhookResponse({}, status_code=404),
+            requests.exceptions.ConnectionError,
+        ]
+        for num in range(5):
+            self.webhook.send_message(f"dummy {num}")
+        # when
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(self.webhook._error_queue.size(), 0)
+        contents = [
+            json.loads(message_json)["content"]
+            for message_json in self.webhook._main_queue.dequeue_bulk()
+        ]
+        self.assertListEqual(contents, ["dummy 2", "dummy 3", "dummy 4", "dummy 1"])
+
+    def test_clear_queue_returns_number_of_cleared_messages(self):
+        self.webhook.send_message("dummy")
+        self.webhook.send_message("dummy", priority=Webhook.PRIORITY_HIGH)
+        self.assertEqual(self.webhook.clear_queue(), 2)
+        self.assertEqual(self.webhook.queue_size(), 0)
+
     def test_can_create_discord_link(self):
         result = self.webhook.create_link("test-name", "test-url")
         self.assertEqual(result, "[test-name](test-url)")
 
 
+@patch(MODULE_PATH + ".sleep")
+@patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
+class TestDiscordWebhookMixinRateLimits(TestCase):
+    def setUp(self) -> None:
+        self.webhook = Webhook("Dummy 1", "dummy-1-url")
+        self.webhook.clear_queue()
+
+    def test_send_queued_messages_without_waiting(self, mock_execute, mock_sleep):
+        # given
+        mock_execute.return_value = dhooks_lite.WebhookResponse(
+            {"X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "2"},
+            status_code=200,
+        )
+        self.webhook.send_message("dummy")
+        self.webhook.send_message("dummy")
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 2)
+        self.assertFalse(mock_sleep.called)
+
+    @patch(MODULE_PATH + ".monotonic")
+    def test_send_queued_messages_stops_at_deadline_without_losing_messages(
+        self, mock_monotonic, mock_execute, mock_sleep
+    ):
+        # given
+        def execute_message(message):
+            if mock_execute.call_count == 2:
+                mock_monotonic.return_value = 100
+            return dhooks_lite.WebhookResponse(
+                {"X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "2"},
+                status_code=200,
+            )
+
+        mock_monotonic.return_value = 0
+        mock_execute.side_effect = execute_message
+        for num in range(1, 6):
+            self.webhook.send_message(f"dummy {num}")
+        # when
+        result = self.webhook.send_queued_messages(deadline=50)
+        # then
+        self.assertEqual(result, 2)
+        contents = [
+            json.loads(message_json)["content"]
+            for message_json in self.webhook._main_queue.dequeue_bulk()
+        ]
+        self.assertListEqual(contents, ["dummy 3", "dummy 4", "dummy 5"])
+
+    @patch(MODULE_PATH + ".monotonic")
+    def test_send_queued_messages_sends_nothing_after_deadline(
+        self, mock_monotonic, mock_execute, mock_sleep
+    ):
+        # given
+        mock_monotonic.return_value = 100
+        self.webhook.send_message("dummy")
+        # when
+        result = self.webhook.send_queued_messages(deadline=50)
+        # then
+        self.assertEqual(result, 0)
+        self.assertFalse(mock_execute.called)
+        self.assertEqual(self.webhook.queue_size(), 1)
+
+    def test_send_queued_messages_waits_when_bucket_is_empty(
+        self, mock_execute, mock_sleep
+    ):
+        # given
+        mock_execute.return_value = dhooks_lite.WebhookResponse(
+            {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "1.5"},
+            status_code=200,
+        )
+        self.webhook.send_message("dummy")
+        self.webhook.send_message("dummy")
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 2)
+        self.assertEqual(mock_sleep.call_count, 1)
+        delay = mock_sleep.call_args[0][0]
+        self.assertGreater(delay, 1)
+        self.assertLessEqual(delay, 1.5)
+
+    def test_send_queued_messages_retries_after_rate_limit(
+        self, mock_execute, mock_sleep
+    ):
+        # given
+        mock_execute.side_effect = [
+            dhooks_lite.WebhookResponse(
+                {}, status_code=429, content={"retry_after": 0.5, "global": False}
+            ),
+            dhooks_lite.WebhookResponse({}, status_code=200),
+        ]
+        self.webhook.send_message("dummy")
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 1)
+        self.assertEqual(mock_execute.call_count, 2)
+        self.assertEqual(self.webhook.queue_size(), 0)
+        delay = mock_sleep.call_args[0][0]
+        self.assertGreater(delay, 0.4)
+        self.assertLessEqual(delay, 0.5)
+
+    def test_send_queued_messages_retries_when_discord_is_unavailable(
+        self, mock_execute, mock_sleep
+    ):
+        # given
+        mock_execute.side_effect = [
+            dhooks_lite.WebhookResponse({}, status_code=503),
+            dhooks_lite.WebhookResponse({}, status_code=200),
+        ]
+        self.webhook.send_message("dummy")
+        # when
+        result = self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 1)
+        self.assertEqual(mock_execute.call_count, 2)
+        self.assertTrue(mock_sleep.called)
+
+
 @patch(MODULE_PATH + ".notify_admins_throttled")
-@patch(MODULE_PATH + ".dhooks_lite.Webhook.execute")
+@patch(MODULE_PATH + ".DiscordWebhookMixin._execute_message")
 class TestSendTestMessage(TestCase):
     def setUp(self) -> None:
         self.webhook = Webhook("Dummy 1", "dummy-1-url")
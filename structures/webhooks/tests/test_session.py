@@ -0,0 +1,105 @@
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import dhooks_lite
+
+from django.test import TestCase
+from django.utils.timezone import utc
+
+from .. import session
+from .test_core import Webhook
+
+
+class _StubDiscordHandler(BaseHTTPRequestHandler):
+    """Answers every webhook request like Discord and keeps connections open"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        self.server.payloads.append(json.loads(self.rfile.read(length)))
+        body = json.dumps({"id": len(self.server.payloads)}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-RateLimit-Remaining", "5")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubDiscordServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestSharedSession(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = _StubDiscordServer(("127.0.0.1", 0), _StubDiscordHandler)
+        cls.server.payloads = []
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever)
+        cls.server_thread.daemon = True
+        cls.server_thread.start()
+        cls.url = "http://127.0.0.1:%d/api/webhooks/1/abc" % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        session.close_session()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        session.close_session()
+        self.server.payloads.clear()
+
+    def test_should_reuse_connections_across_messages_and_webhooks(self):
+        # given
+        webhook_1 = Webhook("Dummy 1", self.url)
+        webhook_2 = Webhook("Dummy 2", self.url)
+        for webhook in [webhook_1, webhook_2]:
+            webhook.clear_queue()
+            for num in range(3):
+                webhook.send_message(f"message {num}")
+        # when
+        result_1 = webhook_1.send_queued_messages()
+        result_2 = webhook_2.send_queued_messages()
+        # then
+        self.assertEqual(result_1, 3)
+        self.assertEqual(result_2, 3)
+        metrics = session.session_metrics()
+        self.assertEqual(metrics["requests"], 6)
+        self.assertEqual(metrics["connections"], 1)
+        self.assertEqual(metrics["reused"], 5)
+
+    def test_should_post_embeds_with_timestamps(self):
+        # given
+        webhook = Webhook("Dummy 1", self.url)
+        webhook.clear_queue()
+        embed = dhooks_lite.Embed(
+            description="description",
+            timestamp=datetime(2021, 7, 24, 12, 30, tzinfo=utc),
+        )
+        webhook.send_message(content="content", embeds=[embed], username="user")
+        # when
+        result = webhook.send_queued_messages()
+        # then
+        self.assertEqual(result, 1)
+        payload = self.server.payloads[0]
+        self.assertEqual(payload["content"], "content")
+        self.assertEqual(payload["username"], "user")
+        self.assertEqual(payload["embeds"][0]["description"], "description")
+        self.assertTrue(
+            payload["embeds"][0]["timestamp"].startswith("2021-07-24T12:30")
+        )
+
+    def test_should_return_empty_metrics_without_session(self):
+        self.assertEqual(
+            session.session_metrics(), {"requests": 0, "connections": 0, "reused": 0}
+        )